@@ -0,0 +1 @@
+# Commands
\ No newline at end of file
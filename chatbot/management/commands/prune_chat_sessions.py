@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chatbot.models import ChatSession
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous chat sessions (and their preferences) that have been idle for too long'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Delete anonymous sessions idle for more than this many days (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of sessions deleted per statement (default: 5000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many sessions would be deleted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        stale = ChatSession.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{stale.count()} anonymous chat sessions would be deleted')
+            return
+
+        deleted = 0
+        batch_size = options['batch_size']
+        while True:
+            # Delete in primary-key batches to keep each statement and lock short
+            batch = list(stale.values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            ChatSession.objects.filter(pk__in=batch).delete()
+            deleted += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} anonymous chat sessions idle since before {cutoff:%Y-%m-%d}')
+        )
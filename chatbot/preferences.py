@@ -0,0 +1,132 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+# Multipliers for shorthand amounts like "50k" or "1.5 lakh"
+AMOUNT_MULTIPLIERS = {
+    'k': 1000,
+    'thousand': 1000,
+    'lac': 100000,
+    'lacs': 100000,
+    'lakh': 100000,
+    'lakhs': 100000,
+}
+
+# Intent rules: regex group name -> (preference field, level)
+INTENT_RULES = {
+    'camera': ('camera_importance', 'high'),
+    'performance': ('performance_needs', 'high'),
+    'basic_use': ('performance_needs', 'low'),
+    'gaming': ('gaming_priority', 'high'),
+}
+
+# Negated intents ("don't care about the camera") flip to low
+NEGATION_WINDOW = 25
+
+# "under 50k" - a bound keyword only qualifies an amount that follows closely
+BOUND_WINDOW = 12
+
+# "40 to 60k" - the suffix of a range's second amount also applies to the first
+RANGE_JOINER = re.compile(r'\s*(?:and|to|-)\s*$', re.IGNORECASE)
+
+# Order matters: spec and quantity numbers must be consumed before generic
+# amounts so "8 GB RAM", "108 MP" or "2 phones" never end up in the budget.
+TOKEN_PATTERNS = (
+    ('spec', r'\d+(?:\.\d+)?\s*(?:gb|tb|mb|mp|mah|hz|w|inch(?:es)?|")(?![a-z])'),
+    ('quantity', r'\d+\s*(?:phones?|mobiles?|handsets?|devices?|units?|pcs|pieces?)\b'),
+    ('amount', r'(?:(?P<currency>rs\.?|pkr|\$|usd)\s*)?'
+               r'(?P<number>\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)'
+               r'\s*(?P<suffix>k|thousand|lakhs?|lacs?)?(?![a-z0-9])'),
+    ('upper', r'\b(?:under|below|less than|up ?to|upto|max(?:imum)?|within|no(?:t)? more than|not over|not above)\b'),
+    ('lower', r'\b(?:above|over|more than|at least|min(?:imum)?|starting|from)\b'),
+    ('budget', r'\b(?:budget|price|spend|cost|afford|range)\b'),
+    ('negation', r"\b(?:no|not|don'?t|dont|never|without)\b(?:\s+(?:really|much|care|about|need|the|a|for))*"),
+    ('camera', r'\b(?:camera|cameras|photo(?:s|graphy)?|selfies?|video(?:s|graphy)?|zoom)\b'),
+    ('performance', r'\b(?:performance|fast|speed|snappy|multitask(?:ing)?|processor|chipset|powerful)\b'),
+    ('basic_use', r'\b(?:basic|casual|simple|light use|calls? and whatsapp)\b'),
+    ('gaming', r'\b(?:gam(?:e|es|ing|er)|pubg|fortnite|free ?fire)\b'),
+)
+
+TOKEN_REGEX = re.compile(
+    '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_PATTERNS),
+    re.IGNORECASE,
+)
+
+
+def _parse_amount(match, suffix=None):
+    """Convert an amount match into a Decimal, applying k/lakh suffixes."""
+    try:
+        value = Decimal(match.group('number').replace(',', ''))
+    except InvalidOperation:
+        return None
+    suffix = (suffix or match.group('suffix') or '').lower()
+    return value * AMOUNT_MULTIPLIERS.get(suffix, 1)
+
+
+def extract_preferences(message):
+    """
+    Extract budget and feature priorities from a chat message in one pass.
+
+    Returns a dict containing only the UserPreference fields that the
+    message actually mentions, so it can be passed straight to
+    update_or_create() without clobbering earlier answers.
+    """
+    preferences = {}
+    amounts = []
+    has_budget_context = False
+    bound = None
+    bound_until = -1
+    negated_until = -1
+    previous = None
+
+    for match in TOKEN_REGEX.finditer(message):
+        kind = match.lastgroup
+
+        if kind in ('spec', 'quantity'):
+            continue
+        if kind == 'budget':
+            has_budget_context = True
+        elif kind in ('upper', 'lower'):
+            has_budget_context = True
+            bound = kind
+            bound_until = match.end() + BOUND_WINDOW
+        elif kind == 'negation':
+            negated_until = match.end() + NEGATION_WINDOW
+        elif kind == 'amount':
+            value = _parse_amount(match)
+            if value is None:
+                continue
+            suffix = match.group('suffix')
+            if (suffix and previous and not previous.group('suffix')
+                    and RANGE_JOINER.match(message, previous.end(), match.start())
+                    and Decimal(previous.group('number').replace(',', '')) < Decimal(match.group('number'))):
+                amounts[-1] = (_parse_amount(previous, suffix), amounts[-1][1], True)
+            explicit = bool(match.group('currency') or suffix)
+            qualifier = bound if match.start() <= bound_until else None
+            amounts.append((value, qualifier, explicit))
+            bound = None
+            previous = match
+        elif kind in INTENT_RULES:
+            field, level = INTENT_RULES[kind]
+            if match.start() <= negated_until:
+                level = 'low'
+                negated_until = -1
+            preferences[field] = level
+
+    # Bare numbers only count as money when the message is about budget, and
+    # not at all once a bound keyword has picked out the amount it refers to
+    qualified = any(qualifier for _, qualifier, _ in amounts)
+    amounts = [(value, qualifier) for value, qualifier, explicit in amounts
+               if explicit or qualifier or has_budget_context and not qualified]
+
+    if len(amounts) >= 2:
+        first, second = amounts[0][0], amounts[1][0]
+        preferences['budget_min'] = min(first, second)
+        preferences['budget_max'] = max(first, second)
+    elif amounts:
+        value, qualifier = amounts[0]
+        if qualifier == 'lower':
+            preferences['budget_min'] = value
+        else:
+            preferences['budget_max'] = value
+
+    return preferences
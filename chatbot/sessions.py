@@ -0,0 +1,85 @@
+import uuid
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import ChatSession
+
+# Key under which the resolved ChatSession is cached in request.session
+SESSION_CACHE_KEY = 'chat_session'
+
+# How often a cached session row gets its updated_at refreshed. Pruning of
+# stale anonymous sessions relies on updated_at, so it must move eventually,
+# but not on every message.
+TOUCH_INTERVAL = timedelta(hours=1)
+
+
+def _cache_session(request, session, touched_at):
+    request.session[SESSION_CACHE_KEY] = {
+        'id': session.pk,
+        'session_id': session.session_id,
+        'user_id': session.user_id,
+        'touched_at': touched_at.isoformat(),
+    }
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _from_cache(cached):
+    """Build a ChatSession instance from cached values without a query."""
+    return ChatSession.from_db(
+        'default',
+        ['id', 'session_id', 'user_id'],
+        [cached['id'], cached['session_id'], cached['user_id']],
+    )
+
+
+def _lookup_or_create(request):
+    if request.user.is_authenticated:
+        session = ChatSession.objects.filter(user=request.user).order_by('-updated_at').first()
+        if session is None:
+            session = ChatSession.objects.create(
+                user=request.user,
+                session_id=str(uuid.uuid4())
+            )
+        return session
+
+    # Sessions created before the resolver existed only stored the uuid
+    session_id = request.session.get('chat_session_id')
+    if session_id:
+        session = ChatSession.objects.filter(session_id=session_id).first()
+        if session is not None:
+            return session
+    return ChatSession.objects.create(session_id=str(uuid.uuid4()))
+
+
+def resolve_chat_session(request):
+    """
+    Return the ChatSession for this request.
+
+    The resolved row is cached in the (signed) Django session, so a normal
+    chat turn costs no ChatSession queries at all. Rows are only created
+    when the first real message arrives, and the cached row is re-validated
+    at most once per TOUCH_INTERVAL by bumping its updated_at.
+    """
+    now = timezone.now()
+    user_id = request.user.pk if request.user.is_authenticated else None
+    cached = request.session.get(SESSION_CACHE_KEY)
+
+    if cached and cached.get('user_id') == user_id:
+        session = _from_cache(cached)
+        touched_at = _parse_timestamp(cached.get('touched_at'))
+        if touched_at and now - touched_at < TOUCH_INTERVAL:
+            return session
+        # A zero row count means the session was pruned; fall through
+        if ChatSession.objects.filter(pk=session.pk).update(updated_at=now):
+            _cache_session(request, session, now)
+            return session
+
+    session = _lookup_or_create(request)
+    _cache_session(request, session, now)
+    return session
+
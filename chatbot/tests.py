@@ -1,3 +1,85 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from .models import ChatSession
+from .preferences import extract_preferences
+from .sessions import resolve_chat_session
+
+
+class ExtractPreferencesTest(SimpleTestCase):
+    def test_budget_range(self):
+        prefs = extract_preferences('My budget is between 40000 and 60,000')
+        self.assertEqual(prefs['budget_min'], Decimal('40000'))
+        self.assertEqual(prefs['budget_max'], Decimal('60000'))
+
+    def test_range_suffix_applies_to_both_ends(self):
+        prefs = extract_preferences('budget between 40 and 60k')
+        self.assertEqual(prefs['budget_min'], Decimal('40000'))
+        self.assertEqual(prefs['budget_max'], Decimal('60000'))
+
+    def test_negated_lower_bound_is_a_ceiling(self):
+        self.assertEqual(extract_preferences('no more than 50k'), {'budget_max': Decimal('50000')})
+        self.assertEqual(extract_preferences('not over 50k'), {'budget_max': Decimal('50000')})
+
+    def test_quantities_are_not_money(self):
+        self.assertEqual(extract_preferences('I want 2 phones under 80k'), {'budget_max': Decimal('80000')})
+        self.assertEqual(extract_preferences('I have 2 kids, budget under 50k'), {'budget_max': Decimal('50000')})
+
+    def test_shorthand_upper_bound(self):
+        prefs = extract_preferences('Show me something under 50k')
+        self.assertEqual(prefs, {'budget_max': Decimal('50000')})
+
+    def test_lower_bound_with_currency(self):
+        prefs = extract_preferences('above Rs. 1.5 lakh please')
+        self.assertEqual(prefs, {'budget_min': Decimal('150000')})
+
+    def test_spec_numbers_are_not_budget(self):
+        prefs = extract_preferences('I need 8 GB RAM, 128gb storage and a fast chipset')
+        self.assertEqual(prefs, {'performance_needs': 'high'})
+
+    def test_bare_numbers_need_budget_context(self):
+        self.assertEqual(extract_preferences('I have 2 kids'), {})
+
+    def test_intents_and_negation(self):
+        prefs = extract_preferences("I don't care about the camera, mostly PUBG")
+        self.assertEqual(prefs, {'camera_importance': 'low', 'gaming_priority': 'high'})
+
+    def test_only_mentioned_fields_returned(self):
+        self.assertEqual(extract_preferences('Great selfies matter'), {'camera_importance': 'high'})
+
+
+class ResolveChatSessionTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().post('/chatbot/message/')
+        self.request.user = AnonymousUser()
+        self.request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+    def test_cached_session_needs_no_queries(self):
+        session = resolve_chat_session(self.request)
+        with self.assertNumQueries(0):
+            cached = resolve_chat_session(self.request)
+        self.assertEqual(cached.pk, session.pk)
+        self.assertEqual(cached.session_id, session.session_id)
+
+    def test_pruned_session_is_recreated(self):
+        pruned_pk = resolve_chat_session(self.request).pk
+        ChatSession.objects.filter(pk=pruned_pk).delete()
+        self.request.session['chat_session']['touched_at'] = '2000-01-01T00:00:00+00:00'
+        recreated = resolve_chat_session(self.request)
+        self.assertNotEqual(recreated.pk, pruned_pk)
+        self.assertTrue(ChatSession.objects.filter(pk=recreated.pk).exists())
+
+    def test_prune_command_only_removes_stale_anonymous_sessions(self):
+        stale = ChatSession.objects.create(session_id='stale')
+        fresh = ChatSession.objects.create(session_id='fresh')
+        ChatSession.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=60))
+        call_command('prune_chat_sessions', days=30, stdout=StringIO())
+        self.assertFalse(ChatSession.objects.filter(pk=stale.pk).exists())
+        self.assertTrue(ChatSession.objects.filter(pk=fresh.pk).exists())
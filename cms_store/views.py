@@ -21,7 +21,7 @@ def blog_index(request):
             return render(request, 'blog/blog_index_page.html', context)
         
         # Get all live blog posts
-        posts = BlogPost.objects.live().order_by('-first_published_at')
+        posts = BlogPost.objects.live().select_related('category').order_by('-first_published_at')
         
         # Filter by category if specified
         category_slug = request.GET.get('category')
@@ -43,7 +43,7 @@ def blog_index(request):
         posts_page = paginator.get_page(page_number)
         
         # Get featured posts (first 2 featured posts)
-        featured_posts = BlogPost.objects.live().filter(is_featured=True)[:2]
+        featured_posts = BlogPost.objects.live().filter(is_featured=True).select_related('category')[:2]
         
         # Get categories for the filter
         categories = BlogCategory.objects.all()[:6]
@@ -0,0 +1,24 @@
+import os
+
+
+def on_starting(server):
+    # Worker files of the previous run would otherwise be added into /metrics
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setting.settings')
+    from setting.metrics import clear_metrics_dir
+    clear_metrics_dir()
+
+
+def post_worker_init(worker):
+    # Build the identifier Bloom filter before the worker takes requests, so
+    # the first scan doesn't wait on a full table read
+    from django.conf import settings
+    from django.db import close_old_connections
+    from inventory_erp.identifiers import identifier_filter
+    if settings.ERP_IDENTIFIER_BLOOM:
+        try:
+            identifier_filter.rebuild()
+        except Exception:
+            # Scans build it on first use instead
+            worker.log.exception('Could not build the identifier filter')
+        finally:
+            close_old_connections()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class InventoryErpConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory_erp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
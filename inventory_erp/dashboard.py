@@ -0,0 +1,102 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Dealer, Device, Purchase, Sale
+from .valuation import get_valuation
+
+CACHE_KEY = 'inventory_erp:dashboard:kpis'
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Value(Decimal('0'), output_field=MONEY)
+
+
+def _kpi_row(queryset, metric, count, count_extra, amount=None, amount_extra=None):
+    """
+    One aggregate row per table, shaped identically so the rows can be
+    UNIONed into a single statement. Unused amounts still need to be an
+    aggregate, otherwise the constant ends up in GROUP BY and empty tables
+    return no row at all.
+    """
+    placeholder = Max(ZERO)
+    return queryset.order_by().annotate(
+        metric=Value(metric, output_field=CharField())
+    ).values('metric').annotate(
+        count=count,
+        count_extra=count_extra,
+        amount=Coalesce(amount if amount is not None else placeholder, ZERO, output_field=MONEY),
+        amount_extra=Coalesce(amount_extra if amount_extra is not None else placeholder, ZERO, output_field=MONEY),
+    )
+
+
+def compute_dashboard_kpis(today=None):
+    """
+    Compute every dashboard KPI with conditional aggregation in one query.
+    The stock value is taken from the cached valuation, so it matches the
+    inventory report's value at cost.
+    """
+    today = today or timezone.now().date()
+    live_purchase = ~Q(status='cancelled')
+    live_sale = ~Q(status='cancelled')
+
+    purchases = _kpi_row(
+        Purchase.objects.all(), 'purchases',
+        count=Count('id'),
+        count_extra=Count('id', filter=Q(status='pending')),
+        amount=Sum(F('total_amount') - F('paid_amount'), filter=live_purchase),
+        amount_extra=Sum('total_amount', filter=Q(purchase_date=today) & live_purchase),
+    )
+    sales = _kpi_row(
+        Sale.objects.all(), 'sales',
+        count=Count('id'),
+        count_extra=Count('id', filter=Q(sale_date=today) & live_sale),
+        amount=Sum(F('final_amount') - F('received_amount'), filter=live_sale),
+        amount_extra=Sum('final_amount', filter=Q(sale_date=today) & live_sale),
+    )
+    dealers = _kpi_row(
+        Dealer.objects.all(), 'dealers',
+        count=Count('id'),
+        count_extra=Count('id', filter=Q(is_active=True)),
+    )
+    devices = _kpi_row(
+        Device.objects.filter(is_active=True), 'devices',
+        count=Count('id'),
+        count_extra=Count('id', filter=Q(stock__lte=0)),
+        amount_extra=Sum('stock'),
+    )
+
+    rows = {row['metric']: row for row in purchases.union(sales, dealers, devices, all=True)}
+    empty = {'count': 0, 'count_extra': 0, 'amount': Decimal('0'), 'amount_extra': Decimal('0')}
+    purchase_row = rows.get('purchases', empty)
+    sale_row = rows.get('sales', empty)
+    dealer_row = rows.get('dealers', empty)
+    device_row = rows.get('devices', empty)
+
+    return {
+        'total_purchases': purchase_row['count'],
+        'pending_purchases': purchase_row['count_extra'],
+        'payables': purchase_row['amount'],
+        'today_purchases_amount': purchase_row['amount_extra'],
+        'total_sales': sale_row['count'],
+        'today_sales': sale_row['count_extra'],
+        'receivables': sale_row['amount'],
+        'today_sales_amount': sale_row['amount_extra'],
+        'total_dealers': dealer_row['count'],
+        'active_dealers': dealer_row['count_extra'],
+        'total_devices': device_row['count'],
+        'out_of_stock': device_row['count_extra'],
+        'stock_value': get_valuation()['totals']['cost_value'],
+        'stock_units': int(device_row['amount_extra']),
+        'generated_at': timezone.now(),
+    }
+
+
+def get_dashboard_kpis():
+    """Return dashboard KPIs, recomputed at most every ERP_DASHBOARD_CACHE_SECONDS."""
+    kpis = cache.get(CACHE_KEY)
+    if kpis is None:
+        kpis = compute_dashboard_kpis()
+        cache.set(CACHE_KEY, kpis, getattr(settings, 'ERP_DASHBOARD_CACHE_SECONDS', 30))
+    return kpis
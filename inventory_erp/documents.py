@@ -0,0 +1,184 @@
+"""
+Printouts of purchases, sales, dealer ledgers and the inventory report.
+
+Each printout is first built as a plain document: a dict with a title,
+detail lines, one table (headers and rows of text) and closing lines. The
+same document is rendered to DOCX here and to PDF by pdf.py, and since it
+holds only text it can be hashed to recognise a reprint (see printouts.py).
+
+python-docx's table.add_row() deep-copies the grid and every cell.text
+assignment walks the cell's XML, which makes a ledger of a few thousand
+entries take many seconds. Tables here are filled by generating the rows'
+WordprocessingML as one string and parsing it once, and the rows come from a
+single values_list() query instead of lazy per-row lookups.
+"""
+from io import BytesIO
+from xml.sax.saxutils import escape
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from .models import Ledger
+from .valuation import METHODS as VALUATION_METHODS
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+LEDGER_TYPES = dict(Ledger._meta.get_field('payment_type').choices)
+
+
+def _cell_xml(value, width):
+    properties = f'<w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>'
+    if value is None or value == '':
+        return f'<w:tc>{properties}<w:p/></w:tc>'
+    text = escape(ILLEGAL_CHARACTERS_RE.sub('', str(value)))
+    return f'<w:tc>{properties}<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:tc>'
+
+
+def add_table(doc, headers, rows, style='Table Grid'):
+    """
+    Add a table with a header row and `rows` (iterables of cell values,
+    None for an empty cell), building all body rows in one XML parse.
+    """
+    table = doc.add_table(rows=1, cols=len(headers))
+    table.style = style
+    for cell, header in zip(table.rows[0].cells, headers):
+        cell.text = header
+
+    widths = [grid_col.get(qn('w:w')) for grid_col in table._tbl.tblGrid.gridCol_lst]
+    body = ''.join(
+        '<w:tr>' + ''.join(_cell_xml(value, width) for value, width in zip(row, widths)) + '</w:tr>'
+        for row in rows
+    )
+    if body:
+        for tr in list(parse_xml(f'<w:tbl {nsdecls("w")}>{body}</w:tbl>')):
+            table._tbl.append(tr)
+    return table
+
+
+def _text(value):
+    return None if value is None or value == '' else str(value)
+
+
+def _document(title, filename, lines, headers, rows, footer):
+    return {
+        'title': title,
+        'filename': filename,
+        'lines': lines,
+        'headers': headers,
+        'rows': [[_text(value) for value in row] for row in rows],
+        'footer': footer,
+    }
+
+
+def purchase_document(purchase):
+    items = purchase.items.values_list('device__name', 'quantity', 'unit_price').order_by('id')
+    return _document(
+        'Purchase Invoice', f'purchase_{purchase.id}',
+        [
+            f'Invoice Number: {purchase.dealer_invoice_number}',
+            f'Date: {purchase.purchase_date}',
+            f'Dealer: {purchase.dealer.name}',
+            f'Type: {purchase.get_purchase_type_display()}',
+        ],
+        ['Device', 'Quantity', 'Unit Price', 'Total'],
+        ((name, quantity, unit_price, quantity * unit_price) for name, quantity, unit_price in items),
+        [
+            f'Total Amount: Rs. {purchase.total_amount}',
+            f'Paid Amount: Rs. {purchase.paid_amount}',
+            f'Balance Due: Rs. {purchase.balance_due}',
+        ],
+    )
+
+
+def sale_document(sale):
+    items = sale.items.values_list(
+        'device__name', 'device_identifier__identifier_value', 'quantity', 'unit_price'
+    ).order_by('id')
+    return _document(
+        'Sale Invoice', f'sale_{sale.id}',
+        [
+            f'Invoice Number: {sale.invoice_number}',
+            f'Date: {sale.sale_date}',
+            f'Customer: {sale.customer_name}',
+            f'Phone: {sale.customer_phone}',
+        ],
+        ['Device', 'IMEI/Serial', 'Quantity', 'Unit Price', 'Total'],
+        ((name, identifier, quantity, unit_price, quantity * unit_price)
+         for name, identifier, quantity, unit_price in items),
+        [
+            f'Total Amount: Rs. {sale.final_amount}',
+            f'Received Amount: Rs. {sale.received_amount}',
+            f'Balance Due: Rs. {sale.balance_due}',
+        ],
+    )
+
+
+def ledger_document(dealer, ledger_entries, opening_balance=None):
+    """`ledger_entries` is a Ledger queryset; balances are stored on each entry."""
+    balance = opening_balance or 0
+    rows = []
+    if opening_balance is not None:
+        rows.append((None, 'Opening Balance', None, None, opening_balance))
+    for transaction_date, payment_type, amount, balance in ledger_entries.values_list(
+        'transaction_date', 'payment_type', 'amount', 'balance_after'
+    ).iterator(chunk_size=2000):
+        label = LEDGER_TYPES.get(payment_type, payment_type)
+        if payment_type == 'credit':
+            rows.append((transaction_date, label, amount, None, balance))
+        else:
+            rows.append((transaction_date, label, None, amount, balance))
+    return _document(
+        'Dealer Ledger', f'ledger_{dealer.id}',
+        [f'Dealer: {dealer.name}', f'Type: {dealer.get_dealer_type_display()}'],
+        ['Date', 'Transaction', 'Debit', 'Credit', 'Balance'],
+        rows,
+        [f'Current Balance: Rs. {balance}'],
+    )
+
+
+def inventory_document(valuation):
+    """The inventory report from a valuation.build_valuation() result."""
+    totals = valuation['totals']
+    return _document(
+        'Inventory Report', f'inventory_{valuation["method"]}',
+        [
+            f'Valuation: {VALUATION_METHODS[valuation["method"]]}',
+            f'Devices: {len(valuation["devices"])}',
+            f'Units in stock: {totals["units"]}',
+        ],
+        ['Device', 'SKU', 'Company', 'Category', 'Stock', 'Unit Cost', 'Value', 'List Value'],
+        ((device['name'], device['sku'], device['company'], device['category'], device['stock'],
+          device['unit_cost'], device['value'], device['list_value']) for device in valuation['devices']),
+        [
+            f'Stock Value at Cost: Rs. {totals["cost_value"]}',
+            f'Stock Value at List Price: Rs. {totals["list_value"]}',
+        ],
+    )
+
+
+def render_docx(document):
+    doc = Document()
+    title = doc.add_heading(document['title'], 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    for line in document['lines']:
+        doc.add_paragraph(line)
+    add_table(doc, document['headers'], document['rows'])
+    for line in document['footer']:
+        doc.add_paragraph(line)
+
+    docx_file = BytesIO()
+    doc.save(docx_file)
+    docx_file.seek(0)
+    return docx_file
+
+
+def generate_purchase_docx(purchase):
+    return render_docx(purchase_document(purchase))
+
+
+def generate_sale_docx(sale):
+    return render_docx(sale_document(sale))
+
+
+def generate_ledger_docx(dealer, ledger_entries, opening_balance=None):
+    return render_docx(ledger_document(dealer, ledger_entries, opening_balance))
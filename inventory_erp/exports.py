@@ -0,0 +1,228 @@
+"""
+CSV/XLSX exports for the ERP lists and reports.
+
+Rows are read with values_list().iterator(chunk_size=...), so neither format
+ever holds the whole result set in memory: CSV is streamed to the client as
+it is produced, and XLSX is written by openpyxl's write-only workbook to a
+temporary file that is then streamed back.
+
+Staff open these files in Excel, so text typed in by customers and dealers
+must not turn into a formula: CSV cells that start with a formula character
+get a leading apostrophe, and XLSX cells are stored as plain strings.
+"""
+import csv
+import tempfile
+from django.db.models import F
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from .filters import filter_inventory, filter_ledger, filter_payments, filter_purchases, filter_sales
+from .models import Dealer, Ledger, Payment, Purchase, Sale
+from .valuation import get_valuation
+
+CHUNK_SIZE = 2000
+FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+FORMATS = ('csv', 'xlsx')
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Echo:
+    """File-like object whose write() returns the line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def _ledger_queryset(params):
+    dealer = get_object_or_404(Dealer, pk=params.get('dealer') or 0)
+    return filter_ledger(dealer, params)
+
+
+def _valuation_column(key):
+    """Display map from device id to one of today's valuation figures."""
+    return lambda: {device['id']: device[key] for device in get_valuation()['devices']}
+
+
+# Each export: sheet title, queryset builder and (header, field[, display map])
+# columns. A display map can also be a function returning one per export.
+EXPORTS = {
+    'sales': {
+        'title': 'Sales',
+        'queryset': lambda params: filter_sales(params).annotate(pending=F('final_amount') - F('received_amount')),
+        'columns': [
+            ('Invoice', 'invoice_number'),
+            ('Date', 'sale_date'),
+            ('Customer', 'customer_name'),
+            ('Phone', 'customer_phone'),
+            ('Type', 'sale_type', dict(Sale.SALE_TYPES)),
+            ('Sub Dealer', 'sub_dealer__name'),
+            ('Total', 'total_amount'),
+            ('Discount', 'discount'),
+            ('Tax', 'tax_amount'),
+            ('Final Amount', 'final_amount'),
+            ('Received', 'received_amount'),
+            ('Pending', 'pending'),
+            ('Payment Status', 'payment_status', dict(Sale._meta.get_field('payment_status').choices)),
+            ('Status', 'status', dict(Sale.STATUS_CHOICES)),
+        ],
+    },
+    'purchases': {
+        'title': 'Purchases',
+        'queryset': lambda params: filter_purchases(params).annotate(pending=F('total_amount') - F('paid_amount')),
+        'columns': [
+            ('PO', 'id'),
+            ('Date', 'purchase_date'),
+            ('Dealer', 'dealer__name'),
+            ('Dealer Invoice', 'dealer_invoice_number'),
+            ('Type', 'purchase_type', dict(Purchase._meta.get_field('purchase_type').choices)),
+            ('Total', 'total_amount'),
+            ('Paid', 'paid_amount'),
+            ('Pending', 'pending'),
+            ('Due Date', 'payment_due_date'),
+            ('Status', 'status', dict(Purchase.STATUS_CHOICES)),
+        ],
+    },
+    'purchase-payments': {
+        'title': 'Purchase Payments',
+        'queryset': lambda params: filter_payments('purchase', params),
+        'columns': [
+            ('Date', 'payment_date'),
+            ('Amount', 'amount'),
+            ('Method', 'payment_method', dict(Payment.PAYMENT_METHODS)),
+            ('Reference', 'reference_number'),
+            ('PO', 'purchase_id'),
+            ('Dealer', 'purchase__dealer__name'),
+            ('Notes', 'notes'),
+        ],
+    },
+    'sale-payments': {
+        'title': 'Sale Payments',
+        'queryset': lambda params: filter_payments('sale', params),
+        'columns': [
+            ('Date', 'payment_date'),
+            ('Amount', 'amount'),
+            ('Method', 'payment_method', dict(Payment.PAYMENT_METHODS)),
+            ('Reference', 'reference_number'),
+            ('Invoice', 'sale__invoice_number'),
+            ('Customer', 'sale__customer_name'),
+            ('Notes', 'notes'),
+        ],
+    },
+    'dealer-ledger': {
+        'title': 'Dealer Ledger',
+        'queryset': _ledger_queryset,
+        'columns': [
+            ('Date', 'transaction_date'),
+            ('Type', 'payment_type', dict(Ledger._meta.get_field('payment_type').choices)),
+            ('Amount', 'amount'),
+            ('Notes', 'notes'),
+            ('Balance', 'balance_after'),
+        ],
+    },
+    'inventory': {
+        'title': 'Inventory',
+        'queryset': filter_inventory,
+        'columns': [
+            ('SKU', 'sku'),
+            ('Device', 'name'),
+            ('Company', 'company__name'),
+            ('Category', 'category__name'),
+            ('Price', 'price'),
+            ('Stock', 'stock'),
+            # At cost, as on the inventory report
+            ('Unit Cost', 'id', _valuation_column('unit_cost')),
+            ('Stock Value', 'id', _valuation_column('value')),
+        ],
+    },
+}
+
+
+def export_rows(name, params):
+    """Return (header, row iterator) for an export."""
+    spec = EXPORTS[name]
+    columns = spec['columns']
+    queryset = spec['queryset'](params)
+    # Resolve the database now, while the request's routing is still active;
+    # the rows are read after the view has returned.
+    queryset = queryset.using(queryset.db)
+
+    rows = queryset.values_list(*[column[1] for column in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+    displays = [
+        (index, column[2]() if callable(column[2]) else column[2])
+        for index, column in enumerate(columns) if len(column) > 2
+    ]
+
+    def formatted():
+        for row in rows:
+            if displays:
+                row = list(row)
+                for index, choices in displays:
+                    row[index] = choices.get(row[index], row[index])
+            yield row
+
+    header = [column[0] for column in columns]
+    return header, formatted()
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _xlsx_cell(sheet, value):
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    if not value.startswith('='):
+        return value
+    # openpyxl writes any string starting with '=' as a formula
+    cell = WriteOnlyCell(sheet, value)
+    cell.data_type = 's'
+    return cell
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    # BOM so Excel opens the file as UTF-8
+    yield '\ufeff' + writer.writerow(header)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow([_csv_cell(value) for value in row]))
+        if len(batch) >= CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def write_xlsx(title, header, rows):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_xlsx_cell(sheet, value) for value in row])
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def export_response(name, fmt, params):
+    if name not in EXPORTS or fmt not in FORMATS:
+        raise Http404('Unknown export')
+
+    header, rows = export_rows(name, params)
+    filename = f'{name}-{timezone.now():%Y%m%d-%H%M}.{fmt}'
+    if fmt == 'csv':
+        response = StreamingHttpResponse(stream_csv(header, rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    return FileResponse(
+        write_xlsx(EXPORTS[name]['title'], header, rows),
+        as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE,
+    )
@@ -0,0 +1,89 @@
+"""
+Query filters shared by the list views and their CSV/XLSX exports, so an
+export always contains exactly the rows the filtered page shows.
+"""
+from .models import Device, Payment, Purchase, Sale
+from .search import search_queryset
+
+
+def filter_sales(params):
+    sales = Sale.objects.all().order_by('-sale_date')
+
+    # Filter by date range
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date and end_date:
+        sales = sales.filter(sale_date__range=[start_date, end_date])
+
+    # Filter by sale type
+    sale_type = params.get('sale_type')
+    if sale_type:
+        sales = sales.filter(sale_type=sale_type)
+
+    # Filter by status
+    status = params.get('status')
+    if status:
+        sales = sales.filter(status=status)
+
+    # Search, best matches first
+    search = params.get('search')
+    if search:
+        sales = search_queryset('sales', search, sales)
+    return sales
+
+
+def filter_purchases(params):
+    purchases = Purchase.objects.all().order_by('-purchase_date')
+
+    # Filter by date range
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date and end_date:
+        purchases = purchases.filter(purchase_date__range=[start_date, end_date])
+
+    # Filter by dealer
+    dealer_id = params.get('dealer')
+    if dealer_id:
+        purchases = purchases.filter(dealer_id=dealer_id)
+
+    # Filter by status
+    status = params.get('status')
+    if status:
+        purchases = purchases.filter(status=status)
+
+    # Search, best matches first
+    search = params.get('search')
+    if search:
+        purchases = search_queryset('purchases', search, purchases)
+    return purchases
+
+
+def filter_payments(payment_type, params):
+    payments = Payment.objects.filter(payment_type=payment_type).order_by('-payment_date')
+
+    # Filter by date range
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date and end_date:
+        payments = payments.filter(payment_date__range=[start_date, end_date])
+
+    # Filter by dealer through purchase
+    dealer_id = params.get('dealer')
+    if dealer_id and payment_type == 'purchase':
+        payments = payments.filter(purchase__dealer_id=dealer_id)
+    return payments
+
+
+def filter_ledger(dealer, params):
+    entries = dealer.ledger_entries.all()
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date:
+        entries = entries.filter(transaction_date__gte=start_date)
+    if end_date:
+        entries = entries.filter(transaction_date__lte=end_date)
+    return entries.order_by('transaction_date', 'id')
+
+
+def filter_inventory(params):
+    return Device.objects.filter(is_active=True)
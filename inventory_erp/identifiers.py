@@ -0,0 +1,187 @@
+"""
+IMEI/serial validation for the scanning screens.
+
+Format checks (Luhn for IMEIs) run locally. Registration checks go through an
+in-process Bloom filter of every known identifier_value: a miss means the
+identifier is definitely new, so only possible hits are looked up in the
+database, in one query per batch.
+
+The filter is only a prefilter. It is built when a worker starts (or on
+first use), picks up new rows incrementally and is rebuilt periodically, so other worker processes see
+identifiers registered elsewhere within ERP_IDENTIFIER_BLOOM_REFRESH_SECONDS.
+The unique constraint on identifier_value stays the final authority when a
+purchase is saved.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from .models import DeviceIdentifier
+
+IDENTIFIER_TYPES = dict(DeviceIdentifier.IDENTIFIER_TYPES)
+
+
+def luhn_valid(value):
+    """True for a 15-digit IMEI whose last digit is the Luhn check digit."""
+    if len(value) != 15 or not value.isdigit():
+        return False
+    total = 0
+    for index, digit in enumerate(int(d) for d in reversed(value)):
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1000)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class IdentifierFilter:
+    """
+    Process-wide Bloom filter over DeviceIdentifier.identifier_value.
+
+    Building the filter scans the whole table, so it runs outside the lock:
+    one caller builds a new filter and swaps it in, while the others keep
+    using the old one, or look everything up in the database if there is
+    none yet. gunicorn.conf.py builds it when a worker starts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = None
+        self.max_pk = 0
+        self.built_at = 0
+        self.refreshed_at = 0
+        self.rebuilding = False
+
+    def rebuild(self):
+        """Build a filter over every identifier and replace the current one."""
+        started = time.monotonic()
+        identifiers = DeviceIdentifier.objects.order_by()
+        # Room to grow before the false-positive rate degrades
+        bloom = BloomFilter(capacity=identifiers.count() * 2)
+        max_pk = 0
+        for pk, value in identifiers.values_list('pk', 'identifier_value').iterator(chunk_size=5000):
+            bloom.add(value)
+            max_pk = max(max_pk, pk)
+        with self.lock:
+            self.bloom = bloom
+            self.max_pk = max_pk
+            self.built_at = self.refreshed_at = started
+
+    def _refresh(self, bloom, max_pk):
+        rows = list(DeviceIdentifier.objects.filter(pk__gt=max_pk).values_list('pk', 'identifier_value'))
+        with self.lock:
+            # A rebuild may have replaced the filter meanwhile; it has these rows
+            if self.bloom is bloom:
+                for pk, value in rows:
+                    bloom.add(value)
+                    self.max_pk = max(self.max_pk, pk)
+        return bloom.count > bloom.capacity
+
+    def might_exist(self, values):
+        """The subset of `values` that may already be registered."""
+        with self.lock:
+            now = time.monotonic()
+            bloom, max_pk = self.bloom, self.max_pk
+            rebuild = bloom is None or now - self.built_at >= getattr(
+                settings, 'ERP_IDENTIFIER_BLOOM_REBUILD_SECONDS', 3600)
+            refresh = not rebuild and now - self.refreshed_at >= getattr(
+                settings, 'ERP_IDENTIFIER_BLOOM_REFRESH_SECONDS', 5)
+            if refresh:
+                self.refreshed_at = now
+            if rebuild and self.rebuilding:
+                rebuild = False
+            elif rebuild:
+                self.rebuilding = True
+
+        if refresh and self._refresh(bloom, max_pk):
+            with self.lock:
+                rebuild = not self.rebuilding
+                self.rebuilding = True
+        if rebuild:
+            try:
+                self.rebuild()
+            finally:
+                with self.lock:
+                    self.rebuilding = False
+            bloom = self.bloom
+        if bloom is None:
+            return set(values)
+        return {value for value in values if value in bloom}
+
+    def add(self, values):
+        """Record identifiers registered by this process."""
+        with self.lock:
+            if self.bloom is not None:
+                for value in values:
+                    self.bloom.add(value)
+
+
+identifier_filter = IdentifierFilter()
+
+
+def check_identifiers(entries):
+    """
+    Validate (identifier_type, value) pairs in one pass. Returns one
+    {'type', 'value', 'valid', 'message'} dict per entry, in order. A type of
+    None skips the format check.
+    """
+    counts = Counter(value for _, value in entries)
+    results = []
+    for identifier_type, value in entries:
+        result = {'type': identifier_type, 'value': value, 'valid': False, 'message': ''}
+        if not value:
+            result['message'] = 'Empty identifier'
+        elif identifier_type is not None and identifier_type not in IDENTIFIER_TYPES:
+            result['message'] = f'Unknown identifier type "{identifier_type}"'
+        elif identifier_type == 'imei' and not luhn_valid(value):
+            result['message'] = 'Invalid IMEI: expected 15 digits with a valid check digit'
+        elif counts[value] > 1:
+            result['message'] = 'Scanned more than once'
+        else:
+            result['valid'] = True
+        results.append(result)
+
+    candidates = [result['value'] for result in results if result['valid']]
+    if candidates and getattr(settings, 'ERP_IDENTIFIER_BLOOM', True):
+        candidates = identifier_filter.might_exist(candidates)
+    if candidates:
+        registered = dict(
+            DeviceIdentifier.objects.filter(identifier_value__in=candidates)
+            .values_list('identifier_value', 'identifier_type')
+        )
+        for result in results:
+            if result['valid'] and result['value'] in registered:
+                result['valid'] = False
+                display = IDENTIFIER_TYPES.get(registered[result['value']], 'identifier')
+                result['message'] = f'This {display} is already registered'
+    return results
@@ -0,0 +1,226 @@
+"""
+Bulk import of supplier manifests (CSV or XLSX) into a purchase.
+
+Rows of (device, imei, condition, unit_price) are read as a stream, validated
+a chunk at a time (one device lookup and one duplicate-identifier query per
+chunk) and written with bulk_create inside a single transaction. Rows that
+fail validation are skipped and written, with the reason, to a rejects CSV.
+"""
+import csv
+import io
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import Q
+from openpyxl import load_workbook
+from .identifiers import identifier_filter, luhn_valid
+from .intake import BATCH_SIZE, CONDITIONS, IDENTIFIER_TYPES, existing_identifiers
+from .models import Device, DeviceIdentifier, Ledger, Purchase, PurchaseItem
+from .stock import adjust_stock
+
+CHUNK_SIZE = 1000
+
+COLUMN_ALIASES = {
+    'device': 'device', 'sku': 'device', 'model': 'device',
+    'imei': 'identifier', 'identifier': 'identifier', 'serial': 'identifier', 'identifier_value': 'identifier',
+    'type': 'identifier_type', 'identifier_type': 'identifier_type',
+    'condition': 'condition',
+    'unit_price': 'unit_price', 'price': 'unit_price',
+}
+REQUIRED_COLUMNS = ('device', 'identifier', 'unit_price')
+
+
+class ImportFormatError(Exception):
+    """The file itself can't be read (bad format or missing columns)."""
+
+
+class ManifestReader:
+    """
+    Stream (row_number, raw_cells, values) from a CSV or XLSX manifest
+    without loading it whole. `values` maps canonical column names to
+    strings. The header is read up front so format problems surface before
+    anything is written.
+    """
+
+    def __init__(self, fileobj, filename):
+        self.workbook = None
+        name = filename.lower()
+        if name.endswith('.xlsx'):
+            try:
+                self.workbook = load_workbook(fileobj, read_only=True, data_only=True)
+            except Exception as e:
+                raise ImportFormatError(f'Could not read the workbook: {e}')
+            self.rows = self.workbook.active.iter_rows(values_only=True)
+        elif name.endswith('.csv'):
+            if isinstance(fileobj.read(0), bytes):
+                fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+            self.rows = csv.reader(fileobj)
+        else:
+            raise ImportFormatError('Upload a .csv or .xlsx file')
+
+        try:
+            header = next(self.rows, None)
+        except UnicodeDecodeError:
+            raise ImportFormatError('CSV files must be UTF-8 encoded')
+        if header is None:
+            raise ImportFormatError('The file is empty')
+        self.header = ['' if name is None else str(name).strip() for name in header]
+        keys = [name.lower().replace(' ', '_') for name in self.header]
+        self.columns = [COLUMN_ALIASES.get(key, key) for key in keys]
+        missing = [column for column in REQUIRED_COLUMNS if column not in self.columns]
+        if missing:
+            raise ImportFormatError(f'Missing column(s): {", ".join(missing)}')
+        # A column headed "serial" means serial numbers unless a type column says otherwise
+        self.default_type = 'serial' if 'serial' in keys else 'imei'
+
+    def __iter__(self):
+        try:
+            for number, row in enumerate(self.rows, start=2):
+                raw = ['' if value is None else str(value).strip() for value in row]
+                if not any(raw):
+                    continue
+                values = dict(zip(self.columns, raw))
+                values.setdefault('identifier_type', self.default_type)
+                yield number, raw, values
+        except UnicodeDecodeError:
+            raise ImportFormatError('CSV files must be UTF-8 encoded')
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.close()
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class DeviceResolver:
+    """Match the manifest's device column by id, SKU or exact name; one query per chunk."""
+
+    def __init__(self):
+        self.known = {}
+
+    def resolve(self, keys):
+        missing = {key for key in keys if key and key not in self.known}
+        if missing:
+            ids = [int(key) for key in missing if key.isdigit()]
+            for device in Device.objects.filter(Q(sku__in=missing) | Q(name__in=missing) | Q(pk__in=ids)):
+                for key in (str(device.pk), device.sku, device.name):
+                    if key in missing:
+                        self.known[key] = device
+            for key in missing:
+                self.known.setdefault(key, None)
+        return self.known
+
+
+def _validate_chunk(chunk, resolver, seen):
+    """Split a chunk into accepted identifiers and (row, reason) rejects."""
+    devices = resolver.resolve({values.get('device', '') for _, _, values in chunk})
+    registered = existing_identifiers(list({values.get('identifier') for _, _, values in chunk} - {None, ''}))
+
+    accepted, rejected = [], []
+    for number, raw, values in chunk:
+        identifier = values.get('identifier', '')
+        identifier_type = (values.get('identifier_type') or 'imei').lower()
+        condition = (values.get('condition') or 'new').lower()
+        device = devices.get(values.get('device', ''))
+        try:
+            unit_price = Decimal(values.get('unit_price', '').replace(',', ''))
+        except InvalidOperation:
+            unit_price = None
+
+        if device is None:
+            reason = f'Unknown device "{values.get("device", "")}"'
+        elif not identifier:
+            reason = 'Missing IMEI/serial'
+        elif identifier_type not in IDENTIFIER_TYPES:
+            reason = f'Unknown identifier type "{identifier_type}"'
+        elif identifier_type == 'imei' and not luhn_valid(identifier):
+            reason = 'Invalid IMEI: expected 15 digits with a valid check digit'
+        elif condition not in CONDITIONS:
+            reason = f'Unknown condition "{condition}"'
+        elif unit_price is None or not unit_price.is_finite() or unit_price < 0:
+            reason = f'Invalid unit price "{values.get("unit_price", "")}"'
+        elif identifier in registered:
+            reason = 'Already registered'
+        elif identifier in seen:
+            reason = 'Duplicate in this file'
+        else:
+            reason = None
+
+        if reason:
+            rejected.append((number, raw, reason))
+        else:
+            accepted.append((device, identifier_type, identifier, condition, unit_price))
+            seen.add(identifier)
+    return accepted, rejected
+
+
+def import_purchase(rows, dealer, purchase_date, invoice_number, user=None, purchase_type='new',
+                    payment_type='cash', rejects=None):
+    """
+    Create one purchase from manifest rows (as produced by ManifestReader).
+    Rejected rows are written to the `rejects` csv.writer as
+    [row number, reason, *original cells]. Returns a summary dict; no
+    purchase is created when every row is rejected.
+    """
+    resolver = DeviceResolver()
+    seen = set()
+    summary = {'purchase': None, 'accepted': 0, 'rejected': 0}
+    items = {}
+
+    with transaction.atomic():
+        purchase = None
+        for chunk in _chunks(rows):
+            accepted, rejected = _validate_chunk(chunk, resolver, seen)
+            for number, raw, reason in rejected:
+                if rejects is not None:
+                    rejects.writerow([number, reason, *raw])
+            summary['rejected'] += len(rejected)
+            if not accepted:
+                continue
+
+            if purchase is None:
+                purchase = Purchase.objects.create(
+                    dealer=dealer, purchase_date=purchase_date, dealer_invoice_number=invoice_number,
+                    purchase_type=purchase_type, total_amount=0, status='pending',
+                    notes='Imported from supplier manifest',
+                )
+            DeviceIdentifier.objects.bulk_create([
+                DeviceIdentifier(device=device, identifier_type=identifier_type, identifier_value=identifier,
+                                 purchase_condition=condition, purchase=purchase, status='in_stock')
+                for device, identifier_type, identifier, condition, _ in accepted
+            ], batch_size=BATCH_SIZE)
+            identifier_filter.add(identifier for _, _, identifier, _, _ in accepted)
+            adjust_stock(Counter(device.pk for device, *_ in accepted))
+            # One purchase line per (device, unit price)
+            for device, _, _, _, unit_price in accepted:
+                items[(device, unit_price)] = items.get((device, unit_price), 0) + 1
+            summary['accepted'] += len(accepted)
+
+        if purchase is None:
+            return summary
+
+        PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase=purchase, device=device, quantity=quantity,
+                         unit_price=unit_price, received_quantity=quantity)
+            for (device, unit_price), quantity in items.items()
+        ], batch_size=BATCH_SIZE)
+        purchase.total_amount = sum(unit_price * quantity for (_, unit_price), quantity in items.items())
+        purchase.save(update_fields=['total_amount', 'updated_at'])
+
+        if payment_type == 'credit':
+            Ledger.objects.create(
+                dealer=dealer, purchase=purchase, transaction_date=purchase_date,
+                amount=purchase.total_amount, payment_type='credit', created_by=user,
+            )
+
+    summary['purchase'] = purchase
+    return summary
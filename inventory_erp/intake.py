@@ -0,0 +1,207 @@
+"""
+Bulk purchase intake.
+
+A purchase with hundreds of handsets is validated up front with a fixed
+number of queries (one for the devices, one for already-registered
+identifiers) and written with bulk_create inside a single transaction, so a
+shipment is either recorded completely or not at all.
+"""
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from .identifiers import identifier_filter
+from .models import Dealer, Device, DeviceIdentifier, Ledger, Purchase, PurchaseItem
+from .stock import adjust_stock
+
+BATCH_SIZE = 1000
+
+IDENTIFIER_TYPES = dict(DeviceIdentifier.IDENTIFIER_TYPES)
+PURCHASE_TYPES = dict(Purchase._meta.get_field('purchase_type').choices)
+CONDITIONS = dict(DeviceIdentifier._meta.get_field('purchase_condition').choices)
+
+
+class IntakeError(Exception):
+    """Raised with every problem found; nothing has been written."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} problem(s) found in the purchase')
+
+
+def _error(line, field, message):
+    return {'line': line, 'field': field, 'message': message}
+
+
+def _parse_date(value, field, errors, required=True):
+    if not value:
+        if required:
+            errors.append(_error(None, field, 'This field is required'))
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        errors.append(_error(None, field, f'Invalid date "{value}", expected YYYY-MM-DD'))
+        return None
+
+
+def _parse_amount(value, line, field, errors):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        errors.append(_error(line, field, f'Invalid amount "{value}"'))
+        return None
+    if not amount.is_finite() or amount < 0:
+        errors.append(_error(line, field, 'Amount must be zero or more'))
+        return None
+    return amount
+
+
+def existing_identifiers(values):
+    """Identifier values from `values` that are already registered, in one query."""
+    return set(
+        DeviceIdentifier.objects.filter(identifier_value__in=values).values_list('identifier_value', flat=True)
+    )
+
+
+def validate_items(items):
+    """
+    Check purchase lines and return (lines, errors). Each line is
+    (line_number, device, quantity, unit_price, identifiers) with identifiers
+    as (type, value, condition) tuples.
+    """
+    errors = []
+    device_ids = set()
+    for item in items:
+        try:
+            device_ids.add(int(item.get('device_id')))
+        except (TypeError, ValueError):
+            pass
+    devices = Device.objects.in_bulk(device_ids)
+
+    lines = []
+    for line, item in enumerate(items, start=1):
+        try:
+            device = devices.get(int(item.get('device_id')))
+        except (TypeError, ValueError):
+            device = None
+        if device is None:
+            errors.append(_error(line, 'device_id', f'Unknown device "{item.get("device_id")}"'))
+
+        try:
+            quantity = int(item.get('quantity'))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            errors.append(_error(line, 'quantity', 'Quantity must be at least 1'))
+
+        unit_price = _parse_amount(item.get('unit_price'), line, 'unit_price', errors)
+
+        identifiers = []
+        for identifier in item.get('identifiers') or []:
+            identifier_type = identifier.get('type') or 'imei'
+            value = str(identifier.get('value') or '').strip()
+            condition = identifier.get('condition') or 'new'
+            if not value:
+                errors.append(_error(line, 'identifiers', 'Empty identifier'))
+            elif identifier_type not in IDENTIFIER_TYPES:
+                errors.append(_error(line, 'identifiers', f'Unknown identifier type "{identifier_type}" for {value}'))
+            elif condition not in CONDITIONS:
+                errors.append(_error(line, 'identifiers', f'Unknown condition "{condition}" for {value}'))
+            else:
+                identifiers.append((identifier_type, value, condition))
+        if quantity and len(identifiers) > quantity:
+            errors.append(_error(line, 'identifiers',
+                                 f'{len(identifiers)} identifiers given for a quantity of {quantity}'))
+
+        lines.append((line, device, quantity, unit_price, identifiers))
+
+    # Duplicates inside the shipment, then against the database in one query
+    seen = Counter(value for *_, identifiers in lines for _, value, _ in identifiers)
+    registered = existing_identifiers(list(seen))
+    for line, _, _, _, identifiers in lines:
+        for _, value, _ in identifiers:
+            if seen[value] > 1:
+                errors.append(_error(line, 'identifiers', f'{value} appears more than once in this purchase'))
+            if value in registered:
+                errors.append(_error(line, 'identifiers', f'{value} is already registered'))
+    return lines, errors
+
+
+def create_purchase(data, user):
+    """
+    Validate and record a purchase from the purchase_entry payload. Raises
+    IntakeError listing every problem (with its line number) if anything is
+    wrong; otherwise returns the saved Purchase.
+    """
+    errors = []
+    dealer = Dealer.objects.filter(pk=data.get('dealer_id')).first() if data.get('dealer_id') else None
+    if dealer is None:
+        errors.append(_error(None, 'dealer_id', 'Unknown dealer'))
+    purchase_date = _parse_date(data.get('purchase_date'), 'purchase_date', errors)
+    due_date = _parse_date(data.get('due_date'), 'due_date', errors, required=False)
+    total_amount = _parse_amount(data.get('total_amount'), None, 'total_amount', errors)
+    purchase_type = data.get('purchase_type') or 'new'
+    if purchase_type not in PURCHASE_TYPES:
+        errors.append(_error(None, 'purchase_type', f'Unknown purchase type "{purchase_type}"'))
+    elif purchase_type == 'second_hand' and not data.get('seller_cnic'):
+        errors.append(_error(None, 'seller_cnic', 'CNIC is required for second-hand purchases'))
+    if not data.get('invoice_number'):
+        errors.append(_error(None, 'invoice_number', 'This field is required'))
+
+    items = data.get('items') or []
+    if not items:
+        errors.append(_error(None, 'items', 'A purchase needs at least one item'))
+    lines, line_errors = validate_items(items)
+    errors.extend(line_errors)
+    if errors:
+        raise IntakeError(errors)
+
+    try:
+        with transaction.atomic():
+            purchase = Purchase.objects.create(
+                dealer=dealer,
+                purchase_date=purchase_date,
+                dealer_invoice_number=data['invoice_number'],
+                purchase_type=purchase_type,
+                seller_cnic=data.get('seller_cnic') or None,
+                total_amount=total_amount,
+                payment_due_date=due_date,
+                notes=data.get('notes') or '',
+                status='pending'
+            )
+            PurchaseItem.objects.bulk_create([
+                PurchaseItem(purchase=purchase, device=device, quantity=quantity,
+                             unit_price=unit_price, received_quantity=quantity)
+                for _, device, quantity, unit_price, _ in lines
+            ], batch_size=BATCH_SIZE)
+            DeviceIdentifier.objects.bulk_create([
+                DeviceIdentifier(device=device, identifier_type=identifier_type, identifier_value=value,
+                                 purchase_condition=condition, purchase=purchase, status='in_stock')
+                for _, device, _, _, identifiers in lines
+                for identifier_type, value, condition in identifiers
+            ], batch_size=BATCH_SIZE)
+            adjust_stock(Counter(
+                device.pk for _, device, _, _, identifiers in lines for _ in identifiers
+            ))
+
+            # Create ledger entry if credit purchase
+            if data.get('payment_type') == 'credit':
+                Ledger.objects.create(
+                    dealer=dealer,
+                    purchase=purchase,
+                    transaction_date=purchase.purchase_date,
+                    amount=purchase.total_amount,
+                    payment_type='credit',
+                    created_by=user
+                )
+    except IntegrityError:
+        # Another purchase registered one of these identifiers meanwhile
+        registered = existing_identifiers([value for *_, ids in lines for _, value, _ in ids])
+        raise IntakeError([
+            _error(line, 'identifiers', f'{value} is already registered')
+            for line, *_, identifiers in lines for _, value, _ in identifiers if value in registered
+        ] or [_error(None, None, 'The purchase conflicts with existing records')])
+
+    # bulk_create sends no post_save, so tell the scan prefilter directly
+    identifier_filter.add(value for *_, identifiers in lines for _, value, _ in identifiers)
+    return purchase
@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from docx import Document
+from inventory_erp.documents import generate_ledger_docx
+from inventory_erp.models import Dealer, Ledger
+from user_auth.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+def add_row_ledger_docx(dealer, ledger_entries):
+    """The previous implementation: one table.add_row() and cell.text per entry."""
+    doc = Document()
+    doc.add_heading('Dealer Ledger', 0)
+    doc.add_paragraph(f'Dealer: {dealer.name}')
+    table = doc.add_table(rows=1, cols=5)
+    table.style = 'Table Grid'
+    for cell, header in zip(table.rows[0].cells, ['Date', 'Transaction', 'Debit', 'Credit', 'Balance']):
+        cell.text = header
+    for entry in ledger_entries:
+        row_cells = table.add_row().cells
+        row_cells[0].text = str(entry.transaction_date)
+        row_cells[1].text = entry.get_payment_type_display()
+        row_cells[2 if entry.payment_type == 'credit' else 3].text = str(entry.amount)
+        row_cells[4].text = str(entry.balance_after)
+    doc.save(BytesIO())
+
+
+class Command(BaseCommand):
+    help = 'Time dealer ledger DOCX generation on a synthetic ledger (nothing is kept in the database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Ledger entries to generate (default: 5000)')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also time the old table.add_row() implementation')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(email='docx-benchmark@example.com', password=None)
+                dealer = Dealer.objects.create(name='Benchmark Dealer', dealer_type='main', contact_person='-',
+                                               phone='-', address='-')
+                start = date.today() - timedelta(days=rows)
+                balance = Decimal('0')
+                entries = []
+                for n in range(rows):
+                    credit = n % 3 != 2
+                    amount = Decimal(1000 + n % 97)
+                    balance += amount if credit else -amount
+                    entries.append(Ledger(dealer=dealer, transaction_date=start + timedelta(days=n), amount=amount,
+                                          payment_type='credit' if credit else 'net', balance_after=balance,
+                                          created_by=user))
+                # bulk_create skips Ledger.save(); balances are precomputed above
+                Ledger.objects.bulk_create(entries, batch_size=1000)
+                ledger = Ledger.objects.filter(dealer=dealer).order_by('transaction_date', 'id')
+
+                started = perf_counter()
+                size = len(generate_ledger_docx(dealer, ledger).getvalue())
+                self.stdout.write(self.style.SUCCESS(
+                    f'generate_ledger_docx: {rows} entries in {perf_counter() - started:.2f}s ({size / 1024:.0f} KiB)'
+                ))
+                if options['compare']:
+                    started = perf_counter()
+                    add_row_ledger_docx(dealer, ledger)
+                    self.stdout.write(f'table.add_row(): {rows} entries in {perf_counter() - started:.2f}s')
+                raise Rollback
+        except Rollback:
+            pass
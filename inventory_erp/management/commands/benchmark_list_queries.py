@@ -0,0 +1,142 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from inventory_erp.filters import filter_payments, filter_purchases, filter_sales
+from inventory_erp.models import Dealer, Payment, Purchase, Sale
+from inventory_erp.reports import build_report
+from user_auth.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+def page(queryset, per_page=20):
+    """What a list view runs: the paginator's COUNT and the first page."""
+    return list(Paginator(queryset, per_page).page(1).object_list)
+
+
+class Command(BaseCommand):
+    help = ('Show query plans and timings of the ERP list and report filters on synthetic sales, '
+            'purchases and payments (nothing is kept in the database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Sales to generate; purchases are a quarter and payments half of it '
+                                 '(default: 1000000)')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run EXPLAIN ANALYZE on PostgreSQL (actual row counts and times)')
+
+    def generate(self, rows, batch_size):
+        rng = random.Random(42)
+        self.today = date.today()
+        days = 3 * 365
+        start = self.today - timedelta(days=days)
+
+        user = User.objects.create_user(email='list-benchmark@example.com', password=None)
+        dealers = Dealer.objects.bulk_create([
+            Dealer(name=f'Benchmark Dealer {n}', dealer_type='sub' if n % 4 else 'main',
+                   contact_person='-', phone=f'0300{n:07d}', address='-')
+            for n in range(200)
+        ])
+        self.dealer = dealers[7]
+
+        def batches(make, count):
+            for offset in range(0, count, batch_size):
+                yield [make(n) for n in range(offset, min(offset + batch_size, count))]
+
+        def sale(n):
+            amount = Decimal(rng.randint(5000, 300000))
+            return Sale(
+                customer_name=f'Customer {rng.randint(1, 50000)}', customer_phone=f'03{rng.randint(0, 10 ** 9 - 1):09d}',
+                sale_type='wholesale' if rng.random() < 0.15 else 'retail',
+                sale_date=start + timedelta(days=rng.randint(0, days)), invoice_number=f'BENCH-{n:08d}',
+                total_amount=amount, final_amount=amount, received_amount=amount, payment_status='paid',
+                status=rng.choices(('completed', 'pending', 'cancelled'), (80, 15, 5))[0], created_by=user,
+            )
+
+        def purchase(n):
+            amount = Decimal(rng.randint(50000, 3000000))
+            return Purchase(
+                dealer=dealers[n % len(dealers)], purchase_date=start + timedelta(days=rng.randint(0, days)),
+                dealer_invoice_number=f'DI-{n:08d}', purchase_type='new', total_amount=amount,
+                paid_amount=amount, status=rng.choices(('received', 'pending', 'cancelled'), (80, 15, 5))[0],
+            )
+
+        for objects in batches(sale, rows):
+            Sale.objects.bulk_create(objects)
+        for objects in batches(purchase, rows // 4):
+            Purchase.objects.bulk_create(objects)
+        purchase_ids = list(Purchase.objects.filter(dealer__in=dealers).values_list('pk', flat=True))
+
+        def payment(n):
+            purchase_payment = n % 2
+            return Payment(
+                payment_type='purchase' if purchase_payment else 'sale',
+                payment_date=start + timedelta(days=rng.randint(0, days)), amount=Decimal(rng.randint(1000, 100000)),
+                payment_method='cash', purchase_id=rng.choice(purchase_ids) if purchase_payment else None,
+                created_by=user,
+            )
+
+        for objects in batches(payment, rows // 2):
+            Payment.objects.bulk_create(objects)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def scenarios(self):
+        end = self.today - timedelta(days=180)
+        month = {'start_date': end - timedelta(days=30), 'end_date': end}
+        return [
+            ('sale_list: date range', lambda: page(filter_sales(month))),
+            ('sale_list: status + date range', lambda: page(filter_sales({**month, 'status': 'pending'}))),
+            ('sale_list: sale type + date range', lambda: page(filter_sales({**month, 'sale_type': 'wholesale'}))),
+            ('sale_list: phone search', lambda: page(filter_sales({'search': '0312345'}))),
+            ('purchase_list: dealer + date range',
+             lambda: page(filter_purchases({**month, 'dealer': self.dealer.pk}))),
+            ('purchase_list: status', lambda: page(filter_purchases({'status': 'pending'}))),
+            ('purchase_list: invoice search', lambda: page(filter_purchases({'search': 'DI-000123'}))),
+            ('sale_payments: date range', lambda: page(filter_payments('sale', month))),
+            ('purchase_payments: dealer + date range',
+             lambda: page(filter_payments('purchase', {**month, 'dealer': self.dealer.pk}))),
+            ('sales_report: one month', lambda: build_report('sales', month['start_date'], month['end_date'])),
+            ('purchase_report: one month',
+             lambda: build_report('purchases', month['start_date'], month['end_date'])),
+        ]
+
+    def explain(self, sql, analyze):
+        options = {'analyze': True} if analyze and connection.vendor == 'postgresql' else {}
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix(**options)} {sql}')
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        try:
+            with transaction.atomic():
+                started = perf_counter()
+                self.generate(rows, options['batch_size'])
+                self.stdout.write(f'Generated {rows} sales, {rows // 4} purchases and {rows // 2} payments '
+                                  f'in {perf_counter() - started:.1f}s\n')
+
+                for name, run in self.scenarios():
+                    with CaptureQueriesContext(connection) as queries:
+                        started = perf_counter()
+                        run()
+                        elapsed = perf_counter() - started
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{name}: {elapsed * 1000:.1f} ms, {len(queries)} queries'
+                    ))
+                    for query in queries:
+                        for line in self.explain(query['sql'], options['analyze']):
+                            self.stdout.write(f'    {line}')
+                    self.stdout.write('')
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,73 @@
+import csv
+import os
+from datetime import datetime
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory_erp.imports import ImportFormatError, ManifestReader, import_purchase
+from inventory_erp.models import Dealer
+from user_auth.models import User
+
+
+class Command(BaseCommand):
+    help = 'Import a supplier manifest (CSV/XLSX rows of device, IMEI, condition, unit price) as one purchase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to the .csv or .xlsx manifest')
+        parser.add_argument('--dealer', type=int, required=True, help='Dealer id the stock was bought from')
+        parser.add_argument('--invoice', required=True, help='Dealer invoice number')
+        parser.add_argument('--date', help='Purchase date as YYYY-MM-DD (default: today)')
+        parser.add_argument('--purchase-type', choices=['new', 'second_hand'], default='new')
+        parser.add_argument('--credit', action='store_true',
+                            help='Bought on credit: add the total to the dealer ledger (needs --user)')
+        parser.add_argument('--user', help='Email of the staff user recorded on the ledger entry')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: <file>.rejected.csv)')
+
+    def handle(self, *args, **options):
+        dealer = Dealer.objects.filter(pk=options['dealer']).first()
+        if dealer is None:
+            raise CommandError(f'Dealer {options["dealer"]} does not exist')
+        try:
+            purchase_date = (datetime.strptime(options['date'], '%Y-%m-%d').date()
+                             if options['date'] else timezone.now().date())
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD')
+        user = None
+        if options['credit']:
+            user = User.objects.filter(email=options['user']).first() if options['user'] else None
+            if user is None:
+                raise CommandError('--credit needs --user with the email of an existing user')
+
+        path = options['file']
+        rejects_path = options['rejects'] or f'{os.path.splitext(path)[0]}.rejected.csv'
+        start = perf_counter()
+        try:
+            with open(path, 'rb') as manifest, open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+                reader = ManifestReader(manifest, path)
+                rejects = csv.writer(rejects_file)
+                rejects.writerow(['row', 'error', *reader.header])
+                try:
+                    summary = import_purchase(
+                        reader, dealer, purchase_date, options['invoice'], user=user,
+                        purchase_type=options['purchase_type'],
+                        payment_type='credit' if options['credit'] else 'cash',
+                        rejects=rejects,
+                    )
+                finally:
+                    reader.close()
+        except (OSError, ImportFormatError) as e:
+            if os.path.exists(rejects_path):
+                os.remove(rejects_path)
+            raise CommandError(str(e))
+
+        elapsed = perf_counter() - start
+        if summary['rejected']:
+            self.stdout.write(self.style.WARNING(f'{summary["rejected"]} rows rejected, see {rejects_path}'))
+        else:
+            os.remove(rejects_path)
+        if summary['purchase'] is None:
+            raise CommandError('No rows were accepted; nothing was imported')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {summary["accepted"]} devices into PO-{summary["purchase"].id} '
+            f'(Rs. {summary["purchase"].total_amount}) in {elapsed:.2f}s'
+        ))
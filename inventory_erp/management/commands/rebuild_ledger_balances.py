@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from inventory_erp.models import Ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored Ledger.balance_after running balances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dealer', type=int, action='append',
+                            help='Only rebuild this dealer (can be repeated; default: all dealers)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of entries written per UPDATE batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        entries = Ledger.objects.all()
+        if options['dealer']:
+            entries = entries.filter(dealer_id__in=options['dealer'])
+
+        fixed = entries.rebuild_balances(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ledger balances: {fixed} entries corrected'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from inventory_erp.search import SEARCHES, rebuild_index, trigram_index_available
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the search token table used instead of pg_trgm, e.g. after rows were '
+            'written with bulk_create() or update(), which skip the signals that keep it current')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entity', action='append', choices=sorted(SEARCHES),
+                            help='Only rebuild this entity (can be repeated; default: all)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if trigram_index_available():
+            raise CommandError('This database searches with pg_trgm indexes; there is no token table to rebuild')
+        with transaction.atomic():
+            counts = rebuild_index(options['entity'], batch_size=options['batch_size'])
+        for entity, count in counts.items():
+            self.stdout.write(self.style.SUCCESS(f'Indexed {count} {entity}'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from inventory_erp.stock import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = 'Recompute Device.stock from the IMEIs/serials on hand and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, action='append',
+                            help='Only reconcile this device (can be repeated; default: all devices)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without changing anything')
+        parser.add_argument('--include-untracked', action='store_true',
+                            help='Also zero devices that have never had an identifier registered')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of devices written per UPDATE batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        drift, untracked = reconcile_stock(
+            device_ids=options['device'],
+            include_untracked=options['include_untracked'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+
+        for device, recorded, actual in drift:
+            self.stdout.write(f'{device.name} (#{device.pk}): stock {recorded} -> {actual} ({actual - recorded:+d})')
+        if untracked:
+            self.stdout.write(f'Skipped {untracked} devices with no registered identifiers')
+        verb = 'would be corrected' if options['dry_run'] else 'corrected'
+        style = self.style.WARNING if drift and options['dry_run'] else self.style.SUCCESS
+        self.stdout.write(style(f'Stock reconciled: {len(drift)} devices {verb}'))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.2 on 2026-10-19 12:09
+
+from django.conf import settings
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_balance_after(apps, schema_editor):
+    Ledger = apps.get_model('inventory_erp', 'Ledger')
+
+    # Running balance per dealer in (transaction_date, id) order
+    balances = {}
+    batch = []
+    entries = Ledger.objects.order_by('dealer_id', 'transaction_date', 'id').only(
+        'id', 'dealer_id', 'amount', 'payment_type'
+    )
+    for entry in entries.iterator(chunk_size=2000):
+        amount = entry.amount if entry.payment_type == 'credit' else -entry.amount
+        balances[entry.dealer_id] = balances.get(entry.dealer_id, Decimal('0')) + amount
+        entry.balance_after = balances[entry.dealer_id]
+        batch.append(entry)
+        if len(batch) >= 2000:
+            Ledger.objects.bulk_update(batch, ['balance_after'])
+            batch = []
+    if batch:
+        Ledger.objects.bulk_update(batch, ['balance_after'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_erp', '0004_device_is_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledger',
+            name='balance_after',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['dealer', 'transaction_date', 'id'], name='ledger_dealer_date_idx'),
+        ),
+        migrations.RunPython(backfill_balance_after, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.2 on 2026-10-19 15:40
+
+from django.db import migrations
+
+INDEX_NAME = 'inv_devid_value_rev_idx'
+TABLE = 'inventory_erp_deviceidentifier'
+
+
+def create_suffix_index(apps, schema_editor):
+    # Suffix searches match reverse(identifier_value) LIKE 'reversed%'.
+    # PostgreSQL only uses a btree for LIKE with the pattern operator class;
+    # prefix searches are already covered by the "_like" index Django adds
+    # for the unique identifier_value column.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {TABLE} (reverse(identifier_value) text_pattern_ops)'
+        )
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {TABLE} (REVERSE(identifier_value))')
+
+
+def drop_suffix_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_erp', '0005_ledger_balance_after'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_suffix_index, drop_suffix_index),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.2 on 2026-10-19 12:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+# icontains searches of the sale and purchase lists. Django compiles them to
+# UPPER(column::text) LIKE UPPER('%term%'), which only a trigram index on the
+# same expression can serve.
+TRIGRAM_INDEXES = {
+    'inv_sale_invoice_trgm': ('inventory_erp_sale', 'invoice_number'),
+    'inv_sale_customer_trgm': ('inventory_erp_sale', 'customer_name'),
+    'inv_sale_phone_trgm': ('inventory_erp_sale', 'customer_phone'),
+    'inv_purchase_invoice_trgm': ('inventory_erp_purchase', 'dealer_invoice_number'),
+    'inv_dealer_name_trgm': ('inventory_erp_dealer', 'name'),
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, (table, column) in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_erp', '0008_rendereddocument'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_type', 'payment_date'], name='payment_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['dealer', 'purchase_date'], name='purchase_dealer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['status', 'purchase_date'], name='purchase_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['sale_date'], name='sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'sale_date'], name='sale_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['sale_type', 'sale_date'], name='sale_type_date_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.2 on 2026-10-19 12:49
+
+import unicodedata
+from django.db import migrations, models
+
+# The remaining search fields of the dealer and device lists; the sale and
+# purchase fields and dealer names are indexed by 0009
+TRIGRAM_INDEXES = {
+    'inv_dealer_contact_trgm': ('inventory_erp_dealer', 'contact_person'),
+    'inv_dealer_phone_trgm': ('inventory_erp_dealer', 'phone'),
+    'inv_dealer_email_trgm': ('inventory_erp_dealer', 'email'),
+    'inv_company_name_trgm': ('inventory_erp_company', 'name'),
+    'inv_device_name_trgm': ('inventory_erp_device', 'name'),
+    'inv_device_sku_trgm': ('inventory_erp_device', 'sku'),
+}
+
+# Mirrors search.SEARCHES as of this migration
+SEARCH_FIELDS = {
+    'dealers': ('Dealer', ('name', 'contact_person', 'phone', 'email')),
+    'companies': ('Company', ('name',)),
+    'sales': ('Sale', ('invoice_number', 'customer_name', 'customer_phone')),
+    'purchases': ('Purchase', ('dealer_invoice_number',)),
+    'devices': ('Device', ('name', 'sku')),
+}
+
+
+def _trigrams(value):
+    value = unicodedata.normalize('NFKD', str(value or '').casefold())
+    value = ''.join(c for c in value if c.isalnum())
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, (table, column) in TRIGRAM_INDEXES.items():
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+        return
+
+    # Without pg_trgm, fill the token table for the existing records
+    SearchToken = apps.get_model('inventory_erp', 'SearchToken')
+    db = schema_editor.connection.alias
+    for entity, (model_name, fields) in SEARCH_FIELDS.items():
+        model = apps.get_model('inventory_erp', model_name)
+        tokens = (
+            SearchToken(entity=entity, object_id=row[0], token=token)
+            for row in model.objects.using(db).values_list('pk', *fields).iterator(chunk_size=2000)
+            for token in set().union(*(_trigrams(value) for value in row[1:]))
+        )
+        SearchToken.objects.using(db).bulk_create(tokens, batch_size=2000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_erp', '0009_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('token', models.CharField(max_length=3)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity', 'token', 'object_id'], name='search_token_idx'), models.Index(fields=['entity', 'object_id'], name='search_token_object_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
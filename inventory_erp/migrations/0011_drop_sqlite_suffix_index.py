@@ -0,0 +1,25 @@
+# Generated by Django 5.2.2 on 2026-10-19 16:20
+
+from django.db import migrations
+
+INDEX_NAME = 'inv_devid_value_rev_idx'
+
+
+def drop_sqlite_suffix_index(apps, schema_editor):
+    # 0006 indexes REVERSE(identifier_value) on SQLite too. REVERSE is a
+    # function Django registers on its own connections, so the sqlite3 CLI,
+    # backups and raw connections fail writing identifiers; there suffix
+    # searches scan instead.
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_erp', '0010_searchtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_suffix_index, migrations.RunPython.noop),
+    ]
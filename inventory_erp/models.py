@@ -1,4 +1,7 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When, Window
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from user_auth.models import User
 from django.utils import timezone
@@ -105,6 +108,31 @@ class Device(models.Model):
         if self.discount_type == 'percentage':
             return (self.price * self.discount_value) / 100
 
+class DealerQuerySet(models.QuerySet):
+    def with_balances(self, start_date=None, end_date=None):
+        """
+        Annotate purchase totals computed in SQL: total_purchases, total_paid,
+        balance (outstanding) and overdue_amount. Cancelled purchases are
+        ignored; an optional purchase_date range limits the totals.
+        """
+        money = DecimalField(max_digits=14, decimal_places=2)
+        zero = Value(0, output_field=money)
+        purchases = ~Q(purchases__status='cancelled')
+        if start_date:
+            purchases &= Q(purchases__purchase_date__gte=start_date)
+        if end_date:
+            purchases &= Q(purchases__purchase_date__lte=end_date)
+        due = F('purchases__total_amount') - F('purchases__paid_amount')
+        overdue = purchases & Q(purchases__payment_due_date__lt=timezone.now().date())
+
+        return self.annotate(
+            total_purchases=Coalesce(Sum('purchases__total_amount', filter=purchases), zero, output_field=money),
+            total_paid=Coalesce(Sum('purchases__paid_amount', filter=purchases), zero, output_field=money),
+            balance=Coalesce(Sum(due, filter=purchases), zero, output_field=money),
+            overdue_amount=Coalesce(Sum(due, filter=overdue), zero, output_field=money),
+        )
+
+
 class Dealer(models.Model):
     DEALER_TYPES = (
         ('main', 'Main Dealer'),
@@ -128,6 +156,8 @@ class Dealer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DealerQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.get_dealer_type_display()})"
 
@@ -140,7 +170,13 @@ class Dealer(models.Model):
 
     @property
     def outstanding_balance(self):
-        return sum(p.balance_due for p in self.purchases.all())
+        # Use the with_balances() annotation when the queryset provided it
+        if hasattr(self, 'balance'):
+            return self.balance
+        total = self.purchases.exclude(status='cancelled').aggregate(
+            total=Sum(F('total_amount') - F('paid_amount'))
+        )['total']
+        return total or 0
 
 class Purchase(models.Model):
     STATUS_CHOICES = (
@@ -165,6 +201,15 @@ class Purchase(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # The purchase list and report filter a date range, optionally by
+        # dealer or status, and sort by date
+        indexes = [
+            models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+            models.Index(fields=['dealer', 'purchase_date'], name='purchase_dealer_date_idx'),
+            models.Index(fields=['status', 'purchase_date'], name='purchase_status_date_idx'),
+        ]
+
     def __str__(self):
         return f"PO-{self.id} - {self.dealer.name}"
 
@@ -261,6 +306,15 @@ class Sale(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
 
+    class Meta:
+        # The sale list and report filter a date range, optionally by status
+        # or sale type, and sort by date
+        indexes = [
+            models.Index(fields=['sale_date'], name='sale_date_idx'),
+            models.Index(fields=['status', 'sale_date'], name='sale_status_date_idx'),
+            models.Index(fields=['sale_type', 'sale_date'], name='sale_type_date_idx'),
+        ]
+
     def __str__(self):
         return f"INV-{self.invoice_number}"
 
@@ -308,6 +362,42 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_type', 'payment_date'], name='payment_type_date_idx'),
+        ]
+
+class LedgerQuerySet(models.QuerySet):
+    def opening_balance(self, dealer, before_date):
+        """Balance carried into before_date: balance_after of the last earlier entry."""
+        balance = self.filter(dealer=dealer, transaction_date__lt=before_date).order_by(
+            '-transaction_date', '-id'
+        ).values_list('balance_after', flat=True).first()
+        return balance if balance is not None else Decimal('0')
+
+    def rebuild_balances(self, batch_size=1000):
+        """
+        Recompute balance_after for every dealer in the queryset with a window
+        function and write back only the entries that drifted. Returns the
+        number of entries fixed.
+        """
+        money = DecimalField(max_digits=14, decimal_places=2)
+        signed = Case(When(payment_type='credit', then=F('amount')), default=-F('amount'), output_field=money)
+        entries = Ledger.objects.filter(dealer_id__in=self.values('dealer_id')).annotate(
+            running=Window(Sum(signed), partition_by=[F('dealer_id')],
+                           order_by=[F('transaction_date').asc(), F('id').asc()])
+        ).only('id', 'balance_after').order_by()
+
+        drifted = []
+        for entry in entries.iterator(chunk_size=batch_size):
+            running = Decimal(entry.running).quantize(Decimal('0.01'))
+            if entry.balance_after != running:
+                entry.balance_after = running
+                drifted.append(entry)
+        Ledger.objects.bulk_update(drifted, ['balance_after'], batch_size=batch_size)
+        return len(drifted)
+
+
 class Ledger(models.Model):
     dealer = models.ForeignKey('Dealer', on_delete=models.PROTECT, related_name='ledger_entries')
     purchase = models.ForeignKey('Purchase', on_delete=models.CASCADE, null=True, blank=True)
@@ -318,8 +408,117 @@ class Ledger(models.Model):
         ('net', 'Net Payment')
     ])
     notes = models.TextField(blank=True)
+    # Dealer balance including this entry, in (transaction_date, id) order
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
 
+    objects = LedgerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dealer', 'transaction_date', 'id'], name='ledger_dealer_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.dealer.name} - {self.amount} ({self.get_payment_type_display()})"
+
+    @property
+    def signed_amount(self):
+        amount = Decimal(str(self.amount))
+        return amount if self.payment_type == 'credit' else -amount
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if not self._state.adding:
+                # Edits are rare; recompute the dealer's balances from scratch,
+                # and those of the dealer the entry moved away from
+                dealers = {self.dealer_id, Ledger.objects.filter(pk=self.pk).values_list('dealer_id', flat=True).get()}
+                super().save(*args, **kwargs)
+                Ledger.objects.filter(dealer_id__in=dealers).rebuild_balances()
+                self.refresh_from_db(fields=['balance_after'])
+                return
+
+            # Lock the dealer so concurrent entries can't start from the same balance
+            Dealer.objects.select_for_update().only('id').get(pk=self.dealer_id)
+            previous = Ledger.objects.filter(
+                dealer_id=self.dealer_id, transaction_date__lte=self.transaction_date
+            ).order_by('-transaction_date', '-id').values_list('balance_after', flat=True).first()
+            self.balance_after = (previous or Decimal('0')) + self.signed_amount
+            super().save(*args, **kwargs)
+            # Back-dated entry: every later balance moves by this amount
+            self.shift_later_balances(self.signed_amount)
+
+    def shift_later_balances(self, delta):
+        Ledger.objects.filter(dealer_id=self.dealer_id).filter(
+            Q(transaction_date__gt=self.transaction_date) |
+            Q(transaction_date=self.transaction_date, id__gt=self.pk)
+        ).update(balance_after=F('balance_after') + delta)
+
+class InvoiceSequence(models.Model):
+    """
+    Gap-free document counters. The row is locked by the UPDATE that takes a
+    number, so concurrent sales queue on it, and a rolled-back sale returns
+    its number with the rest of the transaction.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+    @classmethod
+    def next_value(cls, name):
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(last_value=F('last_value') + 1):
+                cls.objects.get_or_create(name=name)
+                cls.objects.filter(name=name).update(last_value=F('last_value') + 1)
+            return cls.objects.filter(name=name).values_list('last_value', flat=True).get()
+
+class RenderedDocument(models.Model):
+    """
+    A printout rendered to PDF and kept in storage. Rows are keyed on the
+    SHA-256 of the printout's kind, parameters and a stamp of the records it
+    shows, so printing an unchanged document again (a finalized invoice, say)
+    serves the stored file.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=20)
+    params = models.JSONField(default=dict, blank=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    filename = models.CharField(max_length=100)
+    file = models.FileField(upload_to='documents/pdf/', blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+class SearchToken(models.Model):
+    """
+    Trigrams of the searchable text of dealers, companies, sales, purchases
+    and devices, for databases without pg_trgm (see search.py).
+    """
+    entity = models.CharField(max_length=10)
+    object_id = models.PositiveBigIntegerField()
+    token = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['entity', 'token', 'object_id'], name='search_token_idx'),
+            models.Index(fields=['entity', 'object_id'], name='search_token_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity}:{self.object_id} {self.token}"
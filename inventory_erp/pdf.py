@@ -0,0 +1,219 @@
+"""
+PDF rendering of printouts with pydyf.
+
+A printout (see documents.py) is a title, a few lines of details, one table
+and a few closing lines. That is laid out here directly on A4 pages with the
+standard Helvetica fonts, so no HTML engine or system libraries are needed:
+text is measured with Helvetica's glyph widths, cells that do not fit are
+cut short, numeric columns are right-aligned and the table header is
+repeated on every page.
+"""
+import re
+from io import BytesIO
+import pydyf
+
+PDF_CONTENT_TYPE = 'application/pdf'
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+TITLE_SIZE = 16
+TEXT_SIZE = 10
+TABLE_SIZE = 8
+LINE_HEIGHT = 14
+ROW_HEIGHT = 13
+CELL_PADDING = 3
+GREY = 0.88
+
+NUMBER_RE = re.compile(r'^-?[\d,]+(\.\d+)?$')
+
+# Helvetica advance widths (1/1000 em) for ' ' .. '~'; other characters are
+# measured as a digit
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+BOLD_FACTOR = 1.06
+
+
+def text_width(text, size, bold=False):
+    units = sum(HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in text)
+    return units * size / 1000 * (BOLD_FACTOR if bold else 1)
+
+
+def fit(text, width, size, bold=False):
+    """`text`, shortened with '...' if it is wider than `width`."""
+    width += 0.01  # rounding
+    if text_width(text, size, bold) <= width:
+        return text
+    while text and text_width(text + '...', size, bold) > width:
+        text = text[:-1]
+    return text + '...' if text else ''
+
+
+def _literal(text):
+    # The fonts use WinAnsiEncoding; anything outside it prints as '?'
+    data = ''.join(c for c in text if c >= ' ').encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class _Canvas:
+    """The pages of one PDF and the write position on the current one."""
+
+    def __init__(self):
+        self.pdf = pydyf.PDF()
+        self.fonts = pydyf.Dictionary()
+        for name, base_font in (('F1', 'Helvetica'), ('F2', 'Helvetica-Bold')):
+            font = pydyf.Dictionary({
+                'Type': '/Font', 'Subtype': '/Type1',
+                'BaseFont': f'/{base_font}', 'Encoding': '/WinAnsiEncoding',
+            })
+            self.pdf.add_object(font)
+            self.fonts[name] = font.reference
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.stream = pydyf.Stream()
+        self.pages.append(self.stream)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height):
+        """Start a new page unless `height` more points fit above the footer."""
+        if self.y - height < MARGIN + LINE_HEIGHT:
+            self.new_page()
+
+    def text(self, x, y, text, size, bold=False):
+        self.stream.begin_text()
+        self.stream.set_font_size('F2' if bold else 'F1', size)
+        self.stream.move_text_to(x, y)
+        self.stream.show_text(_literal(text))
+        self.stream.end_text()
+
+    def line(self, x1, y1, x2, y2):
+        self.stream.move_to(x1, y1)
+        self.stream.line_to(x2, y2)
+        self.stream.stroke()
+
+    def finish(self):
+        total = len(self.pages)
+        for number, stream in enumerate(self.pages, start=1):
+            self.stream = stream
+            label = f'Page {number} of {total}'
+            self.text(PAGE_WIDTH - MARGIN - text_width(label, TABLE_SIZE), MARGIN / 2, label, TABLE_SIZE)
+            self.pdf.add_object(stream)
+            self.pdf.add_page(pydyf.Dictionary({
+                'Type': '/Page',
+                'Parent': self.pdf.pages.reference,
+                'MediaBox': pydyf.Array([0, 0, PAGE_WIDTH, PAGE_HEIGHT]),
+                'Contents': stream.reference,
+                'Resources': pydyf.Dictionary({'Font': self.fonts}),
+            }))
+        output = BytesIO()
+        self.pdf.write(output, compress=True)
+        return output.getvalue()
+
+
+def _column_widths(headers, rows, available):
+    widths = [text_width(header, TABLE_SIZE, bold=True) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row):
+            if value:
+                widths[index] = max(widths[index], text_width(value, TABLE_SIZE))
+    widths = [width + 2 * CELL_PADDING for width in widths]
+    total = sum(widths)
+    if total <= available:
+        # Spread the spare room so the table spans the page
+        return [width + (available - total) / len(widths) for width in widths]
+    # Columns narrower than an even share keep their width, the rest are cut
+    share = available / len(widths)
+    narrow = [width for width in widths if width <= share]
+    wide = sum(width for width in widths if width > share)
+    scale = (available - sum(narrow)) / wide
+    return [width if width <= share else width * scale for width in widths]
+
+
+def _numeric_columns(headers, rows):
+    numeric = [True] * len(headers)
+    for row in rows:
+        for index, value in enumerate(row):
+            if value and not NUMBER_RE.match(value):
+                numeric[index] = False
+    return numeric
+
+
+def _table(canvas, headers, rows):
+    available = PAGE_WIDTH - 2 * MARGIN
+    widths = _column_widths(headers, rows, available)
+    numeric = _numeric_columns(headers, rows)
+    edges = [MARGIN]
+    for width in widths:
+        edges.append(edges[-1] + width)
+
+    def row(values, bold=False):
+        canvas.y -= ROW_HEIGHT
+        baseline = canvas.y + (ROW_HEIGHT - TABLE_SIZE) / 2 + 1
+        for index, value in enumerate(values):
+            if not value:
+                continue
+            text = fit(value, widths[index] - 2 * CELL_PADDING, TABLE_SIZE, bold)
+            if numeric[index] and not bold:
+                x = edges[index + 1] - CELL_PADDING - text_width(text, TABLE_SIZE)
+            else:
+                x = edges[index] + CELL_PADDING
+            canvas.text(x, baseline, text, TABLE_SIZE, bold)
+        canvas.line(MARGIN, canvas.y, edges[-1], canvas.y)
+
+    def header():
+        canvas.stream.set_color_rgb(GREY, GREY, GREY)
+        canvas.stream.rectangle(MARGIN, canvas.y - ROW_HEIGHT, available, ROW_HEIGHT)
+        canvas.stream.fill()
+        canvas.stream.set_color_rgb(0, 0, 0)
+        canvas.line(MARGIN, canvas.y, edges[-1], canvas.y)
+        row(headers, bold=True)
+
+    def close(top):
+        for x in edges:
+            canvas.line(x, top, x, canvas.y)
+
+    canvas.ensure(2 * ROW_HEIGHT)
+    canvas.stream.set_line_width(0.5)
+    top = canvas.y
+    header()
+    for values in rows:
+        if canvas.y - ROW_HEIGHT < MARGIN + LINE_HEIGHT:
+            close(top)
+            canvas.new_page()
+            canvas.stream.set_line_width(0.5)
+            top = canvas.y
+            header()
+        row(values)
+    close(top)
+
+
+def render_pdf(document):
+    """PDF bytes of a printout built by documents.py."""
+    canvas = _Canvas()
+
+    title = document['title']
+    canvas.y -= TITLE_SIZE
+    canvas.text((PAGE_WIDTH - text_width(title, TITLE_SIZE, bold=True)) / 2, canvas.y, title, TITLE_SIZE, bold=True)
+    canvas.y -= LINE_HEIGHT
+
+    for line in document['lines']:
+        canvas.ensure(LINE_HEIGHT)
+        canvas.y -= LINE_HEIGHT
+        canvas.text(MARGIN, canvas.y, line, TEXT_SIZE)
+    canvas.y -= LINE_HEIGHT / 2
+
+    _table(canvas, document['headers'], document['rows'])
+
+    canvas.y -= LINE_HEIGHT / 2
+    for line in document['footer']:
+        canvas.ensure(LINE_HEIGHT)
+        canvas.y -= LINE_HEIGHT
+        canvas.text(MARGIN, canvas.y, line, TEXT_SIZE, bold=True)
+    return canvas.finish()
@@ -0,0 +1,221 @@
+"""
+Point-of-sale sale entry.
+
+Handsets are scanned one by one, so a sale is a list of identifiers. When it
+is saved the scanned identifiers are locked with
+select_for_update(skip_locked=True): a handset another counter is selling at
+that moment is skipped instead of waited on and reported as unavailable,
+and the in_stock -> sold transition can only happen once. Sale lines are
+written with bulk_create, stock is decremented with F() in one UPDATE and
+the invoice number comes from the gap-free InvoiceSequence, all in one
+transaction.
+"""
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from .intake import _error, _parse_amount, _parse_date
+from .models import Dealer, DeviceIdentifier, InvoiceSequence, Payment, Sale, SaleItem
+from .stock import adjust_stock
+
+BATCH_SIZE = 1000
+DEFAULT_WARRANTY_MONTHS = SaleItem._meta.get_field('warranty_months').default
+
+SALE_TYPES = dict(Sale.SALE_TYPES)
+PAYMENT_METHODS = dict(Payment.PAYMENT_METHODS)
+
+
+class SaleError(Exception):
+    """Raised with every problem found; nothing has been written."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} problem(s) found in the sale')
+
+
+def next_invoice_number(sale_date):
+    """Next invoice number of the sale's year, e.g. 2025-000042."""
+    return f'{sale_date.year}-{InvoiceSequence.next_value(f"sale-{sale_date.year}"):06d}'
+
+
+def scan_identifier(value):
+    """What the counter needs to add a scanned handset to the basket."""
+    identifier = DeviceIdentifier.objects.select_related('device').filter(identifier_value=value).first()
+    if identifier is None:
+        return {'available': False, 'message': 'No device with this IMEI/serial'}
+    if identifier.status != 'in_stock':
+        return {'available': False, 'message': f'This device is {identifier.get_status_display().lower()}'}
+    device = identifier.device
+    return {
+        'available': True,
+        'identifier': identifier.identifier_value,
+        'type': identifier.identifier_type,
+        'device': device and {'id': device.pk, 'name': device.name, 'price': device.price},
+    }
+
+
+def _unavailable(values):
+    """Reason each identifier could not be locked for sale."""
+    statuses = dict(DeviceIdentifier.objects.filter(identifier_value__in=values).values_list(
+        'identifier_value', 'status'
+    ))
+    reasons = {}
+    for value in values:
+        status = statuses.get(value)
+        if status is None:
+            reasons[value] = f'{value} is not a registered device'
+        elif status == 'in_stock':
+            reasons[value] = f'{value} is being sold at another counter'
+        else:
+            reasons[value] = f'{value} is already {status}'
+    return reasons
+
+
+def _payment_status(final_amount, received_amount):
+    if received_amount >= final_amount:
+        return 'paid'
+    return 'partial' if received_amount > 0 else 'pending'
+
+
+def _validate(data):
+    errors = []
+    customer = {}
+    for field in ('customer_name', 'customer_phone'):
+        customer[field] = (data.get(field) or '').strip()
+        if not customer[field]:
+            errors.append(_error(None, field, 'This field is required'))
+    sale_type = data.get('sale_type') or 'retail'
+    sub_dealer = None
+    if sale_type not in SALE_TYPES:
+        errors.append(_error(None, 'sale_type', f'Unknown sale type "{sale_type}"'))
+    elif sale_type == 'wholesale':
+        sub_dealer = Dealer.objects.filter(pk=data.get('sub_dealer_id'), dealer_type='sub').first() \
+            if data.get('sub_dealer_id') else None
+        if sub_dealer is None:
+            errors.append(_error(None, 'sub_dealer_id', 'Sub-dealer is required for wholesale sales'))
+    sale_date = _parse_date(data.get('sale_date'), 'sale_date', errors)
+    tax_amount = _parse_amount(data.get('tax_amount') or 0, None, 'tax_amount', errors)
+    received_amount = _parse_amount(data.get('received_amount') or 0, None, 'received_amount', errors)
+    payment_method = data.get('payment_method') or 'cash'
+    if payment_method not in PAYMENT_METHODS:
+        errors.append(_error(None, 'payment_method', f'Unknown payment method "{payment_method}"'))
+
+    items = data.get('items') or []
+    if not items:
+        errors.append(_error(None, 'items', 'Scan at least one device'))
+    lines = []
+    for line, item in enumerate(items, start=1):
+        value = str(item.get('identifier') or '').strip()
+        if not value:
+            errors.append(_error(line, 'identifier', 'Empty identifier'))
+        # A missing price means the device's list price
+        unit_price = None
+        if item.get('unit_price') not in (None, ''):
+            unit_price = _parse_amount(item['unit_price'], line, 'unit_price', errors)
+        discount = _parse_amount(item.get('discount') or 0, line, 'discount', errors)
+        try:
+            warranty_months = int(item.get('warranty_months', DEFAULT_WARRANTY_MONTHS))
+        except (TypeError, ValueError):
+            warranty_months = -1
+        if warranty_months < 0:
+            errors.append(_error(line, 'warranty_months', 'Warranty must be a whole number of months'))
+        lines.append((line, value, unit_price, discount, warranty_months))
+
+    seen = Counter(value for _, value, *_ in lines if value)
+    for line, value, *_ in lines:
+        if seen[value] > 1:
+            errors.append(_error(line, 'identifier', f'{value} is scanned more than once'))
+
+    header = {
+        **customer,
+        'customer_email': data.get('customer_email') or None,
+        'customer_cnic': data.get('customer_cnic') or None,
+        'sale_type': sale_type,
+        'sub_dealer': sub_dealer,
+        'sale_date': sale_date,
+        'tax_amount': tax_amount,
+        'received_amount': received_amount,
+        'payment_method': payment_method,
+        'notes': data.get('notes') or '',
+    }
+    return header, lines, errors
+
+
+def create_sale(data, user):
+    """
+    Validate and record a counter sale. Raises SaleError listing every
+    problem (with its line number); otherwise returns the saved Sale.
+    """
+    header, lines, errors = _validate(data)
+    if errors:
+        raise SaleError(errors)
+
+    values = [value for _, value, *_ in lines]
+    with transaction.atomic():
+        locked = {
+            identifier.identifier_value: identifier
+            for identifier in DeviceIdentifier.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('device').filter(identifier_value__in=values, status='in_stock')
+        }
+        missing = [value for value in values if value not in locked]
+        if missing:
+            reasons = _unavailable(missing)
+            raise SaleError([_error(line, 'identifier', reasons[value])
+                             for line, value, *_ in lines if value in reasons])
+
+        items = []
+        for line, value, unit_price, discount, warranty_months in lines:
+            identifier = locked[value]
+            if unit_price is None:
+                unit_price = identifier.device.price if identifier.device and identifier.device.price else None
+            if unit_price is None:
+                errors.append(_error(line, 'unit_price', f'Enter a price for {value}; the device has no list price'))
+            elif discount > unit_price:
+                errors.append(_error(line, 'discount', 'Discount is more than the price'))
+            items.append((identifier, unit_price, discount, warranty_months))
+        if errors:
+            raise SaleError(errors)
+
+        total_amount = sum(unit_price for _, unit_price, _, _ in items)
+        discount = sum(discount for _, _, discount, _ in items)
+        final_amount = total_amount - discount + header['tax_amount']
+        received_amount = header['received_amount']
+
+        sale = Sale.objects.create(
+            customer_name=header['customer_name'],
+            customer_phone=header['customer_phone'],
+            customer_email=header['customer_email'],
+            customer_cnic=header['customer_cnic'],
+            sale_type=header['sale_type'],
+            sub_dealer=header['sub_dealer'],
+            sale_date=header['sale_date'],
+            invoice_number=next_invoice_number(header['sale_date']),
+            total_amount=total_amount,
+            discount=discount,
+            tax_amount=header['tax_amount'],
+            final_amount=final_amount,
+            received_amount=received_amount,
+            payment_status=_payment_status(final_amount, received_amount),
+            status='completed',
+            notes=header['notes'],
+            created_by=user,
+        )
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, device=identifier.device, device_identifier=identifier, quantity=1,
+                     unit_price=unit_price, discount=discount, total_price=unit_price - discount,
+                     warranty_months=warranty_months)
+            for identifier, unit_price, discount, warranty_months in items
+        ], batch_size=BATCH_SIZE)
+        DeviceIdentifier.objects.filter(pk__in=[identifier.pk for identifier in locked.values()]).update(
+            status='sold', sale=sale, updated_at=timezone.now()
+        )
+
+        # One UPDATE for every device in the basket
+        sold = Counter(identifier.device_id for identifier in locked.values())
+        adjust_stock({device_id: -count for device_id, count in sold.items()})
+
+        if received_amount > 0:
+            Payment.objects.create(
+                payment_type='sale', payment_date=header['sale_date'], amount=received_amount,
+                payment_method=header['payment_method'], sale=sale, created_by=user,
+                notes=f'Received at sale {sale}',
+            )
+    return sale
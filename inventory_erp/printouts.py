@@ -0,0 +1,198 @@
+"""
+PDF printouts, rendered in the request or in the background.
+
+request_pdf() first reads a stamp of the records a printout shows (one
+aggregate query: the record's columns, its lines' count, last id and sums)
+and looks for a PDF already rendered for the same kind, parameters and
+stamp, so reprinting an unchanged invoice or ledger is served from storage
+without loading its rows. Small printouts are then built (see documents.py)
+and rendered in the request. Bigger ones (a long ledger, the inventory
+report) go to a django-tasks worker, which stores the file, marks the
+RenderedDocument ready and emails whoever asked for it; the page that asked
+polls pdf_status meanwhile. Under the immediate backend (development) the
+job runs in the request and nobody is emailed.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.mail import send_mail
+from django.db.models import Count, Max, Sum
+from django.urls import reverse
+from django.utils import timezone
+from django_tasks import task
+from django_tasks.backends.immediate import ImmediateBackend
+from .documents import inventory_document, ledger_document, purchase_document, sale_document
+from .filters import filter_ledger
+from .models import Dealer, Device, Ledger, Purchase, RenderedDocument, Sale
+from .pdf import render_pdf
+from .valuation import METHODS as VALUATION_METHODS, get_valuation, valuation_key
+
+logger = logging.getLogger(__name__)
+
+# A pending job older than this is assumed lost and is not waited on
+STALE_AFTER = timedelta(hours=1)
+
+
+def _sale(params):
+    return sale_document(Sale.objects.get(pk=params['pk']))
+
+
+def _purchase(params):
+    return purchase_document(Purchase.objects.select_related('dealer').get(pk=params['pk']))
+
+
+def _ledger(params):
+    dealer = Dealer.objects.get(pk=params['pk'])
+    start_date = params.get('start_date')
+    opening_balance = Ledger.objects.opening_balance(dealer, start_date) if start_date else None
+    return ledger_document(dealer, filter_ledger(dealer, params), opening_balance)
+
+
+def _valuation_method(params):
+    method = params.get('method')
+    return method if method in VALUATION_METHODS else None
+
+
+def _inventory(params):
+    return inventory_document(get_valuation(_valuation_method(params)))
+
+
+# Each source returns (stamp, rows, filename) for a printout without loading
+# its rows: the stamp changes whenever what the printout shows does.
+
+def _lines_stamp(model, pk, related=()):
+    """The record's columns and a summary of its lines, in one query."""
+    lines = {
+        'lines': Count('items'),
+        'last_line': Max('items__id'),
+        'quantity': Sum('items__quantity'),
+        'unit_prices': Sum('items__unit_price'),
+        'devices_updated': Max('items__device__updated_at'),
+    }
+    fields = [field.attname for field in model._meta.concrete_fields]
+    return model.objects.filter(pk=pk).annotate(**lines).values(*fields, *related, *lines).get()
+
+
+def _sale_source(params):
+    stamp = _lines_stamp(Sale, params['pk'])
+    return stamp, stamp['lines'], f'sale_{params["pk"]}'
+
+
+def _purchase_source(params):
+    stamp = _lines_stamp(Purchase, params['pk'], related=('dealer__name', 'dealer__updated_at'))
+    return stamp, stamp['lines'], f'purchase_{params["pk"]}'
+
+
+def _ledger_source(params):
+    dealer = Dealer.objects.only('pk', 'updated_at').get(pk=params['pk'])
+    # Sum(balance_after) moves with any earlier entry too, so the opening balance is covered
+    entries = filter_ledger(dealer, params).order_by().aggregate(
+        lines=Count('id'), last_line=Max('id'), amount=Sum('amount'), balances=Sum('balance_after'),
+    )
+    rows = entries['lines'] + (1 if params.get('start_date') else 0)
+    return {'dealer_updated': dealer.updated_at, **entries}, rows, f'ledger_{dealer.pk}'
+
+
+def _inventory_source(params):
+    method = _valuation_method(params) or getattr(settings, 'ERP_VALUATION_METHOD', 'average')
+    rows = Device.objects.filter(is_active=True).count()
+    return valuation_key(method), rows, f'inventory_{method}'
+
+
+# kind: (builder, the parameters it reads, source)
+DOCUMENTS = {
+    'sale': (_sale, ('pk',), _sale_source),
+    'purchase': (_purchase, ('pk',), _purchase_source),
+    'ledger': (_ledger, ('pk', 'start_date', 'end_date'), _ledger_source),
+    'inventory': (_inventory, ('method',), _inventory_source),
+}
+
+
+def content_hash(kind, params, stamp):
+    return hashlib.sha256(
+        json.dumps([kind, params, stamp], sort_keys=True, separators=(',', ':'), default=str).encode()
+    ).hexdigest()
+
+
+def _cached(digest):
+    """A ready PDF of this content still in storage, or a job already rendering it."""
+    candidates = RenderedDocument.objects.filter(content_hash=digest).exclude(status='failed')
+    for rendered in candidates.order_by('-created_at'):
+        if rendered.status == 'pending':
+            if rendered.created_at >= timezone.now() - STALE_AFTER:
+                return rendered
+        elif rendered.file and rendered.file.storage.exists(rendered.file.name):
+            return rendered
+    return None
+
+
+def request_pdf(kind, params, user=None, site_url=None):
+    """
+    The RenderedDocument for a printout: ready if it was cached or small
+    enough to render now, pending if a background job was queued. Raises
+    KeyError for an unknown kind and DoesNotExist for a missing record.
+    """
+    build, keys, source = DOCUMENTS[kind]
+    params = {key: params[key] for key in keys if params.get(key) not in (None, '')}
+    stamp, rows, filename = source(params)
+    digest = content_hash(kind, params, stamp)
+    rendered = _cached(digest)
+    if rendered is not None:
+        return rendered
+
+    rendered = RenderedDocument.objects.create(
+        kind=kind, params=params, content_hash=digest, filename=f'{filename}.pdf', requested_by=user,
+    )
+    if rows <= getattr(settings, 'ERP_PDF_SYNC_MAX_ROWS', 500):
+        _render(rendered)
+    else:
+        # Backends enqueue on commit, once the row is visible to the worker.
+        # The immediate backend has run the job by now outside a transaction,
+        # and its requester is looking at the result already.
+        in_request = isinstance(render_pdf_document.get_backend(), ImmediateBackend)
+        render_pdf_document.enqueue(rendered.pk, site_url, notify=not in_request)
+        rendered.refresh_from_db()
+    return rendered
+
+
+def _render(rendered):
+    try:
+        document = DOCUMENTS[rendered.kind][0](rendered.params)
+        pdf = render_pdf(document)
+        rendered.file.save(f'{rendered.kind}/{rendered.content_hash}.pdf', ContentFile(pdf), save=False)
+        rendered.status = 'ready'
+    except Exception as e:
+        logger.exception('Rendering %s failed', rendered.filename)
+        rendered.status = 'failed'
+        rendered.error = str(e)
+    rendered.finished_at = timezone.now()
+    rendered.save()
+
+
+def _notify(rendered, site_url):
+    user = rendered.requested_by
+    if not user or not user.email or not getattr(settings, 'ERP_PDF_NOTIFY_EMAIL', True):
+        return
+    if rendered.status == 'ready':
+        url = urljoin(site_url or '', reverse('inventory_erp:pdf_download', args=[rendered.pk]))
+        subject = f'{rendered.filename} is ready'
+        message = f'Your PDF is ready to download: {url}'
+    else:
+        subject = f'{rendered.filename} could not be generated'
+        message = f'Generating {rendered.filename} failed: {rendered.error}'
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=True)
+
+
+@task()
+def render_pdf_document(document_id, site_url=None, notify=True):
+    rendered = RenderedDocument.objects.select_related('requested_by').get(pk=document_id)
+    if rendered.status != 'pending':
+        return rendered.status
+    _render(rendered)
+    if notify:
+        _notify(rendered, site_url)
+    return rendered.status
@@ -0,0 +1,178 @@
+import time
+from datetime import datetime
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Purchase, Sale
+
+CACHE_PREFIX = 'inventory_erp:report'
+
+# Per report: model, date field, billed amount, settled amount and the dealer
+# foreign key used for the per-dealer series.
+REPORTS = {
+    'sales': {
+        'model': Sale,
+        'date_field': 'sale_date',
+        'amount_field': 'final_amount',
+        'settled_field': 'received_amount',
+        'dealer_field': 'sub_dealer',
+        'unassigned_label': 'Retail customers',
+    },
+    'purchases': {
+        'model': Purchase,
+        'date_field': 'purchase_date',
+        'amount_field': 'total_amount',
+        'settled_field': 'paid_amount',
+        'dealer_field': 'dealer',
+        'unassigned_label': 'Unknown dealer',
+    },
+}
+
+
+def default_report_range(today=None):
+    """Month to date."""
+    today = today or timezone.now().date()
+    return today.replace(day=1), today
+
+
+def parse_report_range(params, today=None):
+    """
+    Read start_date/end_date from request parameters, defaulting to month to
+    date. Raises ValidationError for malformed, inverted or overlong ranges.
+    """
+    default_start, default_end = default_report_range(today)
+    dates = []
+    for name, default in (('start_date', default_start), ('end_date', default_end)):
+        raw = params.get(name)
+        if not raw:
+            dates.append(default)
+            continue
+        try:
+            value = parse_date(raw)
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError(f'Invalid {name.replace("_", " ")} "{raw}", expected YYYY-MM-DD')
+        dates.append(value)
+
+    start_date, end_date = dates
+    if start_date > end_date:
+        raise ValidationError('Start date must be on or before the end date')
+    max_days = getattr(settings, 'ERP_REPORT_MAX_DAYS', 731)
+    if (end_date - start_date).days >= max_days:
+        raise ValidationError(f'Report range cannot exceed {max_days} days')
+    return start_date, end_date
+
+
+def build_report(kind, start_date, end_date):
+    """
+    Compute totals, the daily series and the per-dealer series for one report
+    from a single query grouped by (date, dealer). Cancelled documents are
+    left out.
+    """
+    spec = REPORTS[kind]
+    date_field = spec['date_field']
+    dealer_field = spec['dealer_field']
+    amount = F(spec['amount_field'])
+    settled = F(spec['settled_field'])
+
+    rows = spec['model'].objects.filter(
+        **{f'{date_field}__range': (start_date, end_date)}
+    ).exclude(status='cancelled').order_by().values(
+        date_field, f'{dealer_field}_id', f'{dealer_field}__name'
+    ).annotate(
+        count=Count('id'),
+        amount=Sum(amount),
+        settled=Sum(settled),
+        pending=Sum(amount - settled),
+    )
+
+    zero = Decimal('0')
+    totals = {'count': 0, 'amount': zero, 'settled': zero, 'pending': zero}
+    daily = {}
+    dealers = {}
+    for row in rows:
+        day = daily.setdefault(row[date_field], {'date': row[date_field], 'count': 0, 'amount': zero})
+        dealer_id = row[f'{dealer_field}_id']
+        dealer = dealers.setdefault(dealer_id, {
+            'dealer_id': dealer_id,
+            'name': row[f'{dealer_field}__name'] or spec['unassigned_label'],
+            'count': 0, 'amount': zero, 'settled': zero, 'pending': zero,
+        })
+        for bucket in (totals, day, dealer):
+            bucket['count'] += row['count']
+            bucket['amount'] += row['amount'] or zero
+        for bucket in (totals, dealer):
+            bucket['settled'] += row['settled'] or zero
+            bucket['pending'] += row['pending'] or zero
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'totals': totals,
+        'daily': [daily[key] for key in sorted(daily)],
+        'dealers': sorted(dealers.values(), key=lambda d: d['amount'], reverse=True),
+    }
+
+
+def _version(kind):
+    return cache.get_or_set(f'{CACHE_PREFIX}:{kind}:version', 0, None)
+
+
+def invalidate_reports(kind):
+    """
+    Drop every cached closed-period report of this kind. The version lives in
+    the default cache, so while that is LocMemCache (no CACHES setting) the
+    bump only reaches the current process; other workers serve their copy
+    until ERP_REPORT_CACHE_SECONDS runs out.
+    """
+    cache.set(f'{CACHE_PREFIX}:{kind}:version', time.time_ns(), None)
+
+
+def get_report(kind, start_date, end_date, today=None):
+    """
+    Return the report for the range. Ranges that ended before today are
+    closed and cached for ERP_REPORT_CACHE_SECONDS; any range touching today
+    is always computed live.
+    """
+    today = today or timezone.now().date()
+    if end_date >= today:
+        return build_report(kind, start_date, end_date)
+
+    key = f'{CACHE_PREFIX}:{kind}:{_version(kind)}:{start_date.isoformat()}:{end_date.isoformat()}'
+    report = cache.get(key)
+    if report is None:
+        report = build_report(kind, start_date, end_date)
+        cache.set(key, report, getattr(settings, 'ERP_REPORT_CACHE_SECONDS', 86400))
+    return report
+
+
+def _as_date(value):
+    """A date from a date, datetime or ISO string; None if it can't be read."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        try:
+            return parse_date(value)
+        except ValueError:
+            return None
+    return value
+
+
+def invalidate_for_instance(kind, *document_dates):
+    """
+    Only documents dated before today can change a closed period. Pass both
+    the date the document had in the database and the one it has now, so
+    moving a document out of a closed period invalidates it too.
+    """
+    today = timezone.now().date()
+    for document_date in document_dates:
+        # The instance holds whatever it was saved with, not the stored date
+        document_date = _as_date(document_date)
+        if document_date is None or document_date < today:
+            invalidate_reports(kind)
+            return
@@ -0,0 +1,221 @@
+"""
+One search for dealers, sales, purchases and devices.
+
+Each entity lists the fields staff search by (names, phones, emails,
+invoice numbers, SKUs). On PostgreSQL a term matches a field containing it,
+served by the pg_trgm GIN indexes on UPPER(field) (migrations 0009 and
+0010), or a field word-similar to it through the same indexes, so a typo
+still finds the record. Other databases have no trigram index, so the
+searchable text is normalised (lower case, letters and digits only) and its
+trigrams are stored in SearchToken; a record matches when it holds most of
+the term's trigrams, which also finds '0300-1234567' from '3001234'.
+
+Matches are ranked exact > prefix > substring > similar, most recent first.
+Purchases and devices also match through their dealer's or company's name.
+"""
+import math
+import unicodedata
+from urllib.parse import urlencode
+from django.db import connections
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.urls import reverse
+from .models import Company, Dealer, Device, Purchase, Sale, SearchToken
+
+MIN_TERM_LENGTH = 2
+SEARCH_LIMIT = 20
+# Share of the term's trigrams a record must hold to match without
+# containing the term
+SIMILARITY = 0.6
+
+SEARCHES = {
+    'dealers': {
+        'model': Dealer,
+        'fields': ('name', 'contact_person', 'phone', 'email'),
+    },
+    'companies': {
+        'model': Company,
+        'fields': ('name',),
+    },
+    'sales': {
+        'model': Sale,
+        'fields': ('invoice_number', 'customer_name', 'customer_phone'),
+    },
+    'purchases': {
+        'model': Purchase,
+        'fields': ('dealer_invoice_number',),
+        'via': ('dealer', 'dealers'),
+    },
+    'devices': {
+        'model': Device,
+        'fields': ('name', 'sku'),
+        'via': ('company', 'companies'),
+    },
+}
+# The entities the ERP lists and the search endpoint offer
+LIST_ENTITIES = ('dealers', 'sales', 'purchases', 'devices')
+ENTITY_BY_MODEL = {spec['model']: entity for entity, spec in SEARCHES.items()}
+
+
+def normalize(value):
+    """Lower-case letters and digits of `value`, accents and punctuation dropped."""
+    value = unicodedata.normalize('NFKD', str(value or '').casefold())
+    return ''.join(c for c in value if c.isalnum())
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def trigram_index_available(model=Dealer):
+    return connections[model.objects.db].vendor == 'postgresql'
+
+
+def _contains(fields, term):
+    match = Q()
+    for field in fields:
+        match |= Q(**{f'{field}__icontains': term})
+    return match
+
+
+def _trigram_match(entity, term):
+    spec = SEARCHES[entity]
+    match = _contains(spec['fields'], term)
+    if len(term) >= 3:
+        # Imported here: django.contrib.postgres needs psycopg
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+        from django.db.models.functions import Upper
+        for field in spec['fields']:
+            match |= Q(TrigramWordSimilar(Upper(field), term.upper()))
+    return match
+
+
+def _token_match(entity, term):
+    spec = SEARCHES[entity]
+    tokens = trigrams(normalize(term))
+    if not tokens:
+        return _contains(spec['fields'], term)
+    matching = SearchToken.objects.filter(entity=entity, token__in=tokens).values('object_id').annotate(
+        hits=Count('token')
+    ).filter(hits__gte=math.ceil(len(tokens) * SIMILARITY)).values('object_id')
+    return Q(pk__in=matching)
+
+
+def search_filter(entity, term):
+    """Q matching the records of `entity` found by `term`."""
+    spec = SEARCHES[entity]
+    if trigram_index_available(spec['model']):
+        match = _trigram_match(entity, term)
+    else:
+        match = _token_match(entity, term)
+    if 'via' in spec:
+        field, related = spec['via']
+        match |= Q(**{f'{field}__in': SEARCHES[related]['model'].objects.filter(search_filter(related, term))})
+    return match
+
+
+def search_rank(entity, term):
+    """3 for an exact field, 2 for a prefix, 1 for a substring, 0 otherwise."""
+    fields = SEARCHES[entity]['fields']
+    whens = []
+    for rank, lookup in ((3, 'iexact'), (2, 'istartswith'), (1, 'icontains')):
+        whens += [When(**{f'{field}__{lookup}': term}, then=Value(rank)) for field in fields]
+    if 'via' in SEARCHES[entity]:
+        field, related = SEARCHES[entity]['via']
+        whens += [When(**{f'{field}__{name}__icontains': term}, then=Value(1))
+                  for name in SEARCHES[related]['fields']]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def search_queryset(entity, term, queryset=None):
+    """
+    `queryset` (all records by default) narrowed to matches of `term`, best
+    first; its own ordering breaks ties.
+    """
+    spec = SEARCHES[entity]
+    if queryset is None:
+        queryset = spec['model'].objects.all()
+    ordering = queryset.query.order_by or spec['model']._meta.ordering or ('-pk',)
+    return queryset.filter(search_filter(entity, term)).annotate(
+        search_rank=search_rank(entity, term)
+    ).order_by('-search_rank', *ordering)
+
+
+def _result(entity, record):
+    if entity == 'dealers':
+        return record.name, ' · '.join(filter(None, [record.contact_person, record.phone, record.email])), \
+            reverse('inventory_erp:dealer_detail', args=[record.pk])
+    if entity == 'sales':
+        return record.invoice_number, f'{record.customer_name} · {record.customer_phone} · {record.sale_date}', \
+            f'{reverse("inventory_erp:sale_list")}?{urlencode({"search": record.invoice_number})}'
+    if entity == 'purchases':
+        return record.dealer_invoice_number, f'{record.dealer.name} · {record.purchase_date}', \
+            f'{reverse("inventory_erp:purchase_list")}?{urlencode({"search": record.dealer_invoice_number})}'
+    return record.name, f'{record.company.name} · {record.sku}', \
+        reverse('inventory_erp:device_detail', args=[record.pk])
+
+
+def search(term, entities=LIST_ENTITIES, limit=SEARCH_LIMIT):
+    """Best matches of `term` across `entities`, as dicts for the search endpoint."""
+    term = term.strip()
+    if len(term) < MIN_TERM_LENGTH:
+        return []
+    results = []
+    for entity in entities:
+        records = search_queryset(entity, term)
+        if 'via' in SEARCHES[entity]:
+            records = records.select_related(SEARCHES[entity]['via'][0])
+        for record in records[:limit]:
+            label, detail, url = _result(entity, record)
+            results.append({
+                'type': entity, 'id': record.pk, 'label': label, 'detail': detail,
+                'url': url, 'rank': record.search_rank,
+            })
+    # Stable: within a rank, entities keep their order and records theirs
+    results.sort(key=lambda result: -result['rank'])
+    return results[:limit]
+
+
+def _tokens(entity, records):
+    fields = SEARCHES[entity]['fields']
+    for record in records:
+        tokens = set()
+        for field in fields:
+            tokens |= trigrams(normalize(getattr(record, field)))
+        for token in tokens:
+            yield SearchToken(entity=entity, object_id=record.pk, token=token)
+
+
+def index_objects(entity, records, created=False, batch_size=1000):
+    """(Re)write the search tokens of `records`; a no-op on PostgreSQL."""
+    if trigram_index_available(SEARCHES[entity]['model']):
+        return
+    if not created:
+        SearchToken.objects.filter(entity=entity, object_id__in=[record.pk for record in records]).delete()
+    SearchToken.objects.bulk_create(_tokens(entity, records), batch_size=batch_size)
+
+
+def unindex_objects(entity, pks):
+    if not trigram_index_available(SEARCHES[entity]['model']):
+        SearchToken.objects.filter(entity=entity, object_id__in=pks).delete()
+
+
+def rebuild_index(entities=None, batch_size=1000):
+    """Rebuild the token table from scratch; returns {entity: records indexed}."""
+    counts = {}
+    for entity in entities or SEARCHES:
+        model = SEARCHES[entity]['model']
+        if trigram_index_available(model):
+            continue
+        SearchToken.objects.filter(entity=entity).delete()
+        counts[entity] = 0
+        records = model.objects.only('pk', *SEARCHES[entity]['fields']).order_by('pk')
+        batch = []
+        for record in records.iterator(chunk_size=batch_size):
+            batch.append(record)
+            if len(batch) == batch_size:
+                SearchToken.objects.bulk_create(_tokens(entity, batch), batch_size=batch_size)
+                counts[entity] += len(batch)
+                batch = []
+        SearchToken.objects.bulk_create(_tokens(entity, batch), batch_size=batch_size)
+        counts[entity] += len(batch)
+    return counts
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .identifiers import identifier_filter
+from .models import Company, Dealer, Device, DeviceIdentifier, Ledger, Purchase, PurchaseItem, Sale
+from .reports import invalidate_for_instance
+from .search import ENTITY_BY_MODEL, index_objects, unindex_objects
+from .valuation import invalidate_valuation
+
+
+REPORT_DATES = {Sale: ('sales', 'sale_date'), Purchase: ('purchases', 'purchase_date')}
+
+
+@receiver([pre_save, pre_delete], sender=Sale)
+@receiver([pre_save, pre_delete], sender=Purchase)
+def remember_report_date(sender, instance, **kwargs):
+    # The stored date, which the save or delete may move out of a closed period
+    if not instance._state.adding:
+        field = REPORT_DATES[sender][1]
+        instance._stored_report_date = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Sale)
+@receiver([post_save, post_delete], sender=Purchase)
+def invalidate_document_reports(sender, instance, **kwargs):
+    kind, field = REPORT_DATES[sender]
+    dates = [getattr(instance, field)]
+    stored = instance.__dict__.pop('_stored_report_date', None)
+    if stored is not None:
+        dates.append(stored)
+    invalidate_for_instance(kind, *dates)
+
+
+@receiver(post_delete, sender=Ledger)
+def shift_ledger_balances(sender, instance, **kwargs):
+    # Also runs for entries removed by a cascading Purchase delete
+    instance.shift_later_balances(-instance.signed_amount)
+
+
+@receiver(post_save, sender=DeviceIdentifier)
+def remember_identifier(sender, instance, **kwargs):
+    identifier_filter.add([instance.identifier_value])
+
+
+@receiver([post_save, post_delete], sender=Device)
+@receiver([post_save, post_delete], sender=Purchase)
+@receiver([post_save, post_delete], sender=PurchaseItem)
+def invalidate_stock_valuation(sender, **kwargs):
+    # After commit, so a valuation computed mid-transaction isn't cached for the day
+    transaction.on_commit(invalidate_valuation)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Dealer)
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Sale)
+def index_for_search(sender, instance, created, **kwargs):
+    index_objects(ENTITY_BY_MODEL[sender], [instance], created=created)
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Dealer)
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Sale)
+def unindex_for_search(sender, instance, **kwargs):
+    unindex_objects(ENTITY_BY_MODEL[sender], [instance.pk])
@@ -0,0 +1,73 @@
+"""
+Device.stock bookkeeping.
+
+Stock on hand is the number of a device's identifiers (IMEIs/serials) that
+are in stock or reserved. Purchases and sales move it incrementally with
+adjust_stock(), one UPDATE per batch of devices. reconcile_stock()
+recomputes it for every device from one grouped COUNT and writes back only
+the devices that drifted.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from .models import Device, DeviceIdentifier
+from .valuation import invalidate_valuation
+
+ON_HAND_STATUSES = ('in_stock', 'reserved')
+
+
+def adjust_stock(deltas):
+    """Apply {device_id: change} to Device.stock in a single UPDATE."""
+    deltas = {device_id: delta for device_id, delta in deltas.items() if device_id and delta}
+    if not deltas:
+        return
+    Device.objects.filter(pk__in=deltas).update(stock=F('stock') + Case(
+        *[When(pk=device_id, then=Value(delta)) for device_id, delta in deltas.items()]
+    ))
+    # update() sends no signals
+    transaction.on_commit(invalidate_valuation)
+
+
+def on_hand_counts(device_ids=None):
+    """{device_id: (units on hand, identifiers ever registered)} from one grouped query."""
+    identifiers = DeviceIdentifier.objects.filter(device__isnull=False)
+    if device_ids is not None:
+        identifiers = identifiers.filter(device_id__in=device_ids)
+    rows = identifiers.order_by().values('device_id').annotate(
+        on_hand=Count('id', filter=Q(status__in=ON_HAND_STATUSES)),
+        registered=Count('id'),
+    ).values_list('device_id', 'on_hand', 'registered')
+    return {device_id: (on_hand, registered) for device_id, on_hand, registered in rows}
+
+
+def reconcile_stock(device_ids=None, include_untracked=False, dry_run=False, batch_size=1000):
+    """
+    Set Device.stock to the units on hand. Devices that have never had an
+    identifier registered keep their hand-entered stock unless
+    include_untracked is set. Returns (drift, untracked): drift is a list of
+    (device, recorded stock, actual stock) for every device that was off.
+    """
+    devices = Device.objects.only('id', 'name', 'stock').order_by('pk')
+    if device_ids is not None:
+        devices = devices.filter(pk__in=device_ids)
+
+    with transaction.atomic():
+        if not dry_run:
+            # Hold the devices so a sale committing meanwhile can't be overwritten
+            devices = devices.select_for_update()
+        devices = list(devices)
+        counts = on_hand_counts(device_ids)
+
+        drift, untracked = [], 0
+        for device in devices:
+            on_hand, registered = counts.get(device.pk, (0, 0))
+            if not registered and not include_untracked:
+                untracked += 1
+            elif device.stock != on_hand:
+                drift.append((device, device.stock, on_hand))
+
+        if drift and not dry_run:
+            for device, _, on_hand in drift:
+                device.stock = on_hand
+            Device.objects.bulk_update([device for device, _, _ in drift], ['stock'], batch_size=batch_size)
+            transaction.on_commit(invalidate_valuation)
+    return drift, untracked
@@ -1,3 +1,1135 @@
-from django.test import TestCase
+from datetime import date, datetime
+from decimal import Decimal
+import csv
+import json
+import os
+import re
+import tempfile
+import zlib
+from io import BytesIO, StringIO
+from unittest import mock
+from docx import Document
+from openpyxl import Workbook, load_workbook
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DataError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from user_auth.models import User
+from .dashboard import compute_dashboard_kpis, get_dashboard_kpis
+from .documents import generate_ledger_docx, generate_sale_docx, ledger_document
+from .identifiers import BloomFilter, check_identifiers, identifier_filter, luhn_valid
+from .imports import ImportFormatError, ManifestReader, import_purchase
+from .intake import IntakeError, create_purchase
+from .pdf import render_pdf
+from .printouts import render_pdf_document, request_pdf
+from .pos import SaleError, create_sale as create_counter_sale
+from .filters import filter_sales
+from .models import Company, Dealer, Device, DeviceIdentifier, Ledger, InvoiceSequence, Payment, Purchase, PurchaseItem, Sale, SaleItem, SearchToken
+from .reports import build_report, get_report, parse_report_range
+from .search import index_objects, search
+from .stock import reconcile_stock
+from .traceability import add_months, search_identifiers, trace_identifier
+from .valuation import build_valuation, get_valuation
 
-# Create your tests here.
+
+class ErpTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='Str0ngPass!23', is_staff=True)
+        cls.company = Company.objects.create(name='Samsung', contact_person='Ali', phone='0300')
+        cls.dealer = Dealer.objects.create(
+            name='Main Dealer', dealer_type='main', contact_person='Ali',
+            phone='0300', address='Bahawalpur', credit_limit=Decimal('100000')
+        )
+
+    def setUp(self):
+        # The report views record their durations in /metrics
+        self.enterContext(override_settings(METRICS_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def create_purchase(self, total, paid=0, status='pending', purchase_date=date(2025, 1, 10), dealer=None):
+        return Purchase.objects.create(
+            dealer=dealer or self.dealer, purchase_date=purchase_date, dealer_invoice_number='INV',
+            purchase_type='new', total_amount=Decimal(total), paid_amount=Decimal(paid), status=status
+        )
+
+    def create_sale(self, final, received=0, status='completed', sale_date=date(2025, 1, 10), invoice=None):
+        return Sale.objects.create(
+            customer_name='Customer', customer_phone='0300', sale_type='retail',
+            sale_date=sale_date, invoice_number=invoice or f'S-{Sale.objects.count() + 1}',
+            total_amount=Decimal(final), final_amount=Decimal(final), received_amount=Decimal(received),
+            payment_status='partial', status=status, created_by=self.staff
+        )
+
+
+class DashboardKpiTest(ErpTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_kpis_in_a_single_query(self):
+        today = date(2025, 1, 10)
+        self.create_purchase(1000, paid=400)
+        self.create_purchase(500, status='cancelled')
+        self.create_sale(700, received=200)
+        self.create_sale(300, received=300, sale_date=date(2025, 1, 9))
+        Device.objects.create(name='S24', company=self.company, price=Decimal('100'), stock=3)
+        Device.objects.create(name='A15', company=self.company, price=Decimal('50'), stock=0)
+        get_valuation()
+
+        with self.assertNumQueries(1):
+            kpis = compute_dashboard_kpis(today=today)
+
+        self.assertEqual(kpis['total_purchases'], 2)
+        self.assertEqual(kpis['payables'], Decimal('600'))
+        self.assertEqual(kpis['total_sales'], 2)
+        self.assertEqual(kpis['receivables'], Decimal('500'))
+        self.assertEqual(kpis['today_sales'], 1)
+        self.assertEqual(kpis['today_sales_amount'], Decimal('700'))
+        self.assertEqual(kpis['total_dealers'], 1)
+        self.assertEqual(kpis['stock_value'], Decimal('300'))
+        self.assertEqual(kpis['out_of_stock'], 1)
+
+    def test_stock_value_is_at_cost(self):
+        phone = Device.objects.create(name='S24', company=self.company, price=Decimal('150'), stock=2)
+        purchase = self.create_purchase(200)
+        PurchaseItem.objects.create(purchase=purchase, device=phone, quantity=2, unit_price=Decimal('100'))
+        self.assertEqual(compute_dashboard_kpis()['stock_value'], Decimal('200.00'))
+
+    def test_empty_tables(self):
+        Dealer.objects.all().delete()
+        kpis = compute_dashboard_kpis()
+        self.assertEqual(kpis['total_dealers'], 0)
+        self.assertEqual(kpis['receivables'], Decimal('0'))
+
+    def test_cached_snapshot_and_json_endpoint(self):
+        get_dashboard_kpis()
+        with self.assertNumQueries(0):
+            get_dashboard_kpis()
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:dashboard_data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_dealers'], 1)
+
+
+class DealerBalanceTest(ErpTestCase):
+    def test_with_balances_annotations(self):
+        self.create_purchase(1000, paid=300)
+        overdue = self.create_purchase(500, paid=100)
+        Purchase.objects.filter(pk=overdue.pk).update(payment_due_date=date(2020, 1, 1))
+        self.create_purchase(800, status='cancelled')
+
+        dealer = Dealer.objects.with_balances().get(pk=self.dealer.pk)
+
+        self.assertEqual(dealer.total_purchases, Decimal('1500'))
+        self.assertEqual(dealer.total_paid, Decimal('400'))
+        self.assertEqual(dealer.balance, Decimal('1100'))
+        self.assertEqual(dealer.overdue_amount, Decimal('400'))
+        with self.assertNumQueries(0):
+            self.assertEqual(dealer.outstanding_balance, Decimal('1100'))
+
+    def test_date_range_and_fallback_property(self):
+        self.create_purchase(1000, purchase_date=date(2025, 1, 10))
+        self.create_purchase(200, purchase_date=date(2025, 3, 1))
+
+        dealer = Dealer.objects.with_balances(start_date='2025-02-01').get(pk=self.dealer.pk)
+        self.assertEqual(dealer.balance, Decimal('200'))
+
+        plain = Dealer.objects.get(pk=self.dealer.pk)
+        self.assertEqual(plain.outstanding_balance, Decimal('1200'))
+
+    def test_dealer_without_purchases_has_zero_balance(self):
+        dealer = Dealer.objects.with_balances().get(pk=self.dealer.pk)
+        self.assertEqual(dealer.balance, Decimal('0'))
+
+
+class ReportEngineTest(ErpTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_sales_report_in_a_single_query(self):
+        sub = Dealer.objects.create(name='Sub Dealer', dealer_type='sub', contact_person='Bilal', phone='0301', address='Multan')
+        self.create_sale(1000, received=400)
+        Sale.objects.filter(pk=self.create_sale(500, received=500).pk).update(sub_dealer=sub)
+        self.create_sale(300, sale_date=date(2025, 1, 12))
+        self.create_sale(900, status='cancelled')
+
+        with self.assertNumQueries(1):
+            report = build_report('sales', date(2025, 1, 1), date(2025, 1, 31))
+
+        totals = report['totals']
+        self.assertEqual(totals['count'], 3)
+        self.assertEqual(totals['amount'], Decimal('1800'))
+        self.assertEqual(totals['settled'], Decimal('900'))
+        self.assertEqual(totals['pending'], Decimal('900'))
+        self.assertEqual([(d['date'], d['count']) for d in report['daily']],
+                         [(date(2025, 1, 10), 2), (date(2025, 1, 12), 1)])
+        self.assertEqual([(d['name'], d['amount']) for d in report['dealers']],
+                         [('Retail customers', Decimal('1300')), ('Sub Dealer', Decimal('500'))])
+
+    def test_purchase_report_pending(self):
+        self.create_purchase(1000, paid=250)
+        self.create_purchase(400, paid=400, purchase_date=date(2025, 2, 1))
+        report = build_report('purchases', date(2025, 1, 1), date(2025, 1, 31))
+        self.assertEqual(report['totals']['pending'], Decimal('750'))
+        self.assertEqual(report['dealers'][0]['name'], 'Main Dealer')
+
+    def test_date_range_validation(self):
+        today = date(2025, 3, 15)
+        self.assertEqual(parse_report_range({}, today=today), (date(2025, 3, 1), today))
+        for params in ({'start_date': '2025-13-01'}, {'start_date': 'yesterday'},
+                       {'start_date': '2025-03-10', 'end_date': '2025-03-01'},
+                       {'start_date': '2020-01-01', 'end_date': '2025-01-01'}):
+            with self.assertRaises(ValidationError):
+                parse_report_range(params, today=today)
+
+    def test_closed_periods_are_cached_until_a_document_changes(self):
+        sale = self.create_sale(1000)
+        start, end = date(2025, 1, 1), date(2025, 1, 31)
+        get_report('sales', start, end)
+        with self.assertNumQueries(0):
+            get_report('sales', start, end)
+
+        sale.received_amount = Decimal('1000')
+        sale.save()
+        self.assertEqual(get_report('sales', start, end)['totals']['pending'], Decimal('0'))
+
+    def test_documents_saved_with_a_datetime_or_string_date_invalidate(self):
+        start, end = date(2025, 1, 1), date(2025, 1, 31)
+        for purchase_date in (datetime(2025, 1, 10, 12, 30), '2025-01-10'):
+            with self.subTest(purchase_date=purchase_date):
+                get_report('purchases', start, end)
+                self.create_purchase(1000, purchase_date=purchase_date)
+                with self.assertNumQueries(1):
+                    get_report('purchases', start, end)
+
+    def test_document_moved_or_deleted_out_of_a_closed_period_invalidates(self):
+        start, end = date(2025, 1, 1), date(2025, 1, 31)
+        sale = self.create_sale(1000)
+        get_report('sales', start, end)
+        sale.sale_date = timezone.now().date()
+        sale.save()
+        self.assertEqual(get_report('sales', start, end)['totals']['count'], 0)
+
+        purchase = self.create_purchase(1000)
+        get_report('purchases', start, end)
+        purchase.purchase_date = timezone.now().date()
+        purchase.delete()
+        self.assertEqual(get_report('purchases', start, end)['totals']['count'], 0)
+
+    def test_open_period_is_not_cached(self):
+        today = date(2025, 1, 31)
+        get_report('sales', date(2025, 1, 1), today, today=today)
+        with self.assertNumQueries(1):
+            get_report('sales', date(2025, 1, 1), today, today=today)
+
+    def test_report_views(self):
+        self.create_purchase(1000, paid=250)
+        self.create_sale(700, received=200)
+        self.client.force_login(self.staff)
+        params = {'start_date': '2025-01-01', 'end_date': '2025-01-31'}
+
+        response = self.client.get(reverse('inventory_erp:sales_report'), params)
+        self.assertEqual(response.context['summary']['pending_amount'], Decimal('500'))
+
+        response = self.client.get(reverse('inventory_erp:purchase_report'), params)
+        self.assertEqual(response.context['summary']['pending_amount'], Decimal('750'))
+
+        response = self.client.get(reverse('inventory_erp:purchase_report'), {'start_date': 'bad'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(list(response.context['messages'])), 1)
+
+
+class ExportTest(ErpTestCase):
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, name, fmt, **params):
+        return self.client.get(reverse('inventory_erp:export', args=[name, fmt]), params)
+
+    def test_sales_csv_is_streamed_with_filters(self):
+        self.create_sale(1000, received=400, invoice='S-1')
+        self.create_sale(500, invoice='S-2', status='cancelled')
+
+        response = self.export('sales', 'csv', status='completed')
+
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['Invoice', 'Date'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('S-1,2025-01-10', lines[1])
+        self.assertEqual(Decimal(lines[1].split(',')[11]), Decimal('600'))
+        self.assertTrue(lines[1].endswith('Partial,Completed'))
+
+    def test_ledger_xlsx_has_running_balance(self):
+        for amount, payment_type in ((1000, 'credit'), (300, 'net')):
+            Ledger.objects.create(dealer=self.dealer, transaction_date=date(2025, 1, 10), amount=Decimal(amount),
+                                  payment_type=payment_type, created_by=self.staff)
+
+        response = self.export('dealer-ledger', 'xlsx', dealer=self.dealer.pk)
+
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], ('Date', 'Type', 'Amount', 'Notes', 'Balance'))
+        self.assertEqual([row[-1] for row in rows[1:]], [1000, 700])
+
+    def test_every_export_renders(self):
+        Device.objects.create(name='S24', company=self.company, price=Decimal('100'), stock=3)
+        for name in ('purchases', 'purchase-payments', 'sale-payments', 'inventory'):
+            for fmt in ('csv', 'xlsx'):
+                response = self.export(name, fmt)
+                self.assertEqual(response.status_code, 200, (name, fmt))
+                b''.join(response.streaming_content)
+
+    def test_inventory_export_values_stock_at_cost(self):
+        cache.clear()
+        phone = Device.objects.create(name='S24', company=self.company, price=Decimal('150'), stock=2)
+        PurchaseItem.objects.create(purchase=self.create_purchase(200), device=phone, quantity=2,
+                                    unit_price=Decimal('100'))
+
+        lines = b''.join(self.export('inventory', 'csv').streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[-2:], ['Unit Cost', 'Stock Value'])
+        self.assertEqual(lines[1].split(',')[-2:], ['100.00', '200.00'])
+
+    def test_text_cannot_become_a_formula(self):
+        sale = self.create_sale(100, invoice='S-1')
+        Sale.objects.filter(pk=sale.pk).update(customer_name='=HYPERLINK("http://x")', customer_phone='+92300')
+
+        lines = b''.join(self.export('sales', 'csv').streaming_content).decode('utf-8-sig').splitlines()
+        self.assertIn(''',"'=HYPERLINK(""http://x"")",'+92300,''', lines[1])
+
+        response = self.export('sales', 'xlsx')
+        cell = load_workbook(BytesIO(b''.join(response.streaming_content))).active['C2']
+        self.assertEqual((cell.value, cell.data_type), ('=HYPERLINK("http://x")', 's'))
+
+    def test_unknown_export_or_dealer_is_404(self):
+        self.assertEqual(self.export('users', 'csv').status_code, 404)
+        self.assertEqual(self.export('sales', 'pdf').status_code, 404)
+        self.assertEqual(self.export('dealer-ledger', 'csv').status_code, 404)
+
+
+class LedgerBalanceTest(ErpTestCase):
+    def add_entry(self, amount, payment_type='credit', transaction_date=date(2025, 1, 10)):
+        return Ledger.objects.create(dealer=self.dealer, transaction_date=transaction_date, amount=Decimal(amount),
+                                     payment_type=payment_type, created_by=self.staff)
+
+    def balances(self):
+        return list(self.dealer.ledger_entries.order_by('transaction_date', 'id').values_list('balance_after', flat=True))
+
+    def test_balance_maintained_on_insert(self):
+        self.add_entry(1000)
+        self.add_entry(300, 'net')
+        self.add_entry(200, transaction_date=date(2025, 1, 12))
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('700'), Decimal('900')])
+
+    def test_back_dated_insert_and_delete_shift_later_balances(self):
+        self.add_entry(1000)
+        self.add_entry(300, 'net', transaction_date=date(2025, 1, 20))
+        back_dated = self.add_entry(500, transaction_date=date(2025, 1, 15))
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('1500'), Decimal('1200')])
+
+        back_dated.delete()
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('700')])
+
+    def test_edit_recomputes_balances(self):
+        first = self.add_entry(1000)
+        self.add_entry(300, 'net')
+        first.amount = Decimal('400')
+        first.save()
+        self.assertEqual(first.balance_after, Decimal('400'))
+        self.assertEqual(self.balances(), [Decimal('400'), Decimal('100')])
+
+    def test_moving_an_entry_rebuilds_both_dealers(self):
+        other = Dealer.objects.create(name='Other Dealer', dealer_type='main', contact_person='Bilal',
+                                      phone='0301', address='Multan', credit_limit=Decimal('1000'))
+        moved = self.add_entry(1000)
+        self.add_entry(300, transaction_date=date(2025, 1, 20))
+        moved.dealer = other
+        moved.save()
+        self.assertEqual(self.balances(), [Decimal('300')])
+        self.assertEqual(moved.balance_after, Decimal('1000'))
+
+    def test_opening_balance(self):
+        self.add_entry(1000, transaction_date=date(2025, 1, 1))
+        self.add_entry(250, 'net', transaction_date=date(2025, 1, 5))
+        self.add_entry(100, transaction_date=date(2025, 2, 1))
+        with self.assertNumQueries(1):
+            opening = Ledger.objects.opening_balance(self.dealer, date(2025, 2, 1))
+        self.assertEqual(opening, Decimal('750'))
+        self.assertEqual(Ledger.objects.opening_balance(self.dealer, date(2024, 1, 1)), Decimal('0'))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.add_entry(1000)
+        self.add_entry(300, 'net')
+        Ledger.objects.update(balance_after=0)
+
+        out = StringIO()
+        call_command('rebuild_ledger_balances', stdout=out)
+        self.assertIn('2 entries corrected', out.getvalue())
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('700')])
+
+    def test_ledger_page_shows_stored_and_opening_balances(self):
+        self.add_entry(1000, transaction_date=date(2025, 1, 1))
+        self.add_entry(300, 'net', transaction_date=date(2025, 1, 10))
+        self.client.force_login(self.staff)
+
+        response = self.client.get(reverse('inventory_erp:dealer_ledger', args=[self.dealer.pk]),
+                                   {'start_date': '2025-01-05'})
+
+        self.assertEqual(response.context['opening_balance'], Decimal('1000'))
+        self.assertEqual([e.balance_after for e in response.context['ledger_entries']], [Decimal('700')])
+        self.assertContains(response, 'Opening Balance')
+
+
+class PurchaseIntakeTest(ErpTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.phone = Device.objects.create(name='S24', company=cls.company, price=Decimal('100'))
+        cls.tablet = Device.objects.create(name='Tab S9', company=cls.company, price=Decimal('200'))
+
+    def payload(self, items, **extra):
+        data = {
+            'dealer_id': self.dealer.pk, 'purchase_date': '2025-01-10', 'invoice_number': 'INV-1',
+            'purchase_type': 'new', 'total_amount': '5000', 'due_date': '', 'payment_type': 'credit', 'items': items,
+        }
+        data.update(extra)
+        return data
+
+    def imeis(self, prefix, count):
+        return [{'type': 'imei', 'value': f'{prefix}{n:05d}'} for n in range(count)]
+
+    def test_large_purchase_uses_constant_queries(self):
+        items = [
+            {'device_id': self.phone.pk, 'quantity': 300, 'unit_price': '10', 'identifiers': self.imeis('35', 300)},
+            {'device_id': self.tablet.pk, 'quantity': 200, 'unit_price': '15', 'identifiers': self.imeis('36', 200)},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            purchase = create_purchase(self.payload(items), self.staff)
+
+        # A handful of reads plus batched inserts (SQLite caps the rows per
+        # INSERT), nowhere near one query per handset
+        self.assertLess(len(queries), 25)
+
+        self.assertEqual(PurchaseItem.objects.filter(purchase=purchase).count(), 2)
+        self.assertEqual(DeviceIdentifier.objects.filter(purchase=purchase).count(), 500)
+        self.assertEqual(Ledger.objects.get(purchase=purchase).balance_after, Decimal('5000'))
+
+    def test_errors_are_reported_per_line_and_nothing_is_written(self):
+        DeviceIdentifier.objects.create(device=self.phone, identifier_type='imei', identifier_value='35000001')
+        items = [
+            {'device_id': self.phone.pk, 'quantity': 2, 'unit_price': '10',
+             'identifiers': [{'type': 'imei', 'value': '35000001'}, {'type': 'imei', 'value': '35000002'}]},
+            {'device_id': 9999, 'quantity': 1, 'unit_price': '-1',
+             'identifiers': [{'type': 'imei', 'value': '35000002'}]},
+        ]
+
+        with self.assertRaises(IntakeError) as raised:
+            create_purchase(self.payload(items), self.staff)
+
+        errors = {(e['line'], e['field'], e['message']) for e in raised.exception.errors}
+        self.assertIn((1, 'identifiers', '35000001 is already registered'), errors)
+        self.assertIn((2, 'device_id', 'Unknown device "9999"'), errors)
+        self.assertIn((2, 'unit_price', 'Amount must be zero or more'), errors)
+        self.assertIn((2, 'identifiers', '35000002 appears more than once in this purchase'), errors)
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_purchase_entry_view(self):
+        self.client.force_login(self.staff)
+        url = reverse('inventory_erp:purchase_entry')
+        items = [{'device_id': self.phone.pk, 'quantity': 1, 'unit_price': '10', 'identifiers': self.imeis('35', 1)}]
+
+        response = self.client.post(url, json.dumps(self.payload(items)), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'success')
+
+        response = self.client.post(url, json.dumps(self.payload(items)), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['line'], 1)
+
+
+def make_imei(body):
+    """Append the Luhn check digit to a 14-digit body."""
+    for check in '0123456789':
+        if luhn_valid(body + check):
+            return body + check
+
+
+class LuhnBloomTest(SimpleTestCase):
+    def test_luhn(self):
+        self.assertTrue(luhn_valid('490154203237518'))
+        self.assertFalse(luhn_valid('490154203237519'))
+        self.assertFalse(luhn_valid('49015420323751'))
+        self.assertFalse(luhn_valid('49015420323751a'))
+
+    def test_bloom_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=5000)
+        values = [f'35{n:013d}' for n in range(5000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f'86{n:013d}' in bloom for n in range(5000))
+        self.assertLess(false_positives, 150)
+
+
+@override_settings(ERP_IDENTIFIER_BLOOM_REFRESH_SECONDS=3600)
+class IdentifierValidationTest(ErpTestCase):
+    def setUp(self):
+        identifier_filter.reset()
+        self.registered = make_imei('35693803564380')
+        DeviceIdentifier.objects.create(identifier_type='imei', identifier_value=self.registered)
+
+    def test_new_identifiers_skip_the_database(self):
+        check_identifiers([('imei', self.registered)])  # builds the filter
+        fresh = [('imei', make_imei(f'35693803{n:06d}')) for n in range(50)]
+        fresh = [entry for entry in fresh if entry[1] != self.registered]
+
+        with CaptureQueriesContext(connection) as queries:
+            results = check_identifiers(fresh)
+        self.assertTrue(all(r['valid'] for r in results))
+        self.assertLessEqual(len(queries), 1)  # only Bloom false positives reach the database
+
+        with self.assertNumQueries(1):
+            results = check_identifiers(fresh + [('imei', self.registered)])
+        self.assertEqual(results[-1]['message'], 'This IMEI Number is already registered')
+
+    def test_identifiers_saved_later_are_caught(self):
+        check_identifiers([('imei', self.registered)])
+        later = make_imei('35693803999999')
+        DeviceIdentifier.objects.create(identifier_type='imei', identifier_value=later)
+        self.assertFalse(check_identifiers([('imei', later)])[0]['valid'])
+
+    def test_scans_during_a_rebuild_keep_the_old_filter(self):
+        check_identifiers([('imei', self.registered)])
+        old_bloom = identifier_filter.bloom
+        identifier_filter.rebuilding = True
+        identifier_filter.built_at = 0
+        with self.assertNumQueries(1):
+            results = check_identifiers([('imei', self.registered)])
+        self.assertFalse(results[0]['valid'])
+        self.assertIs(identifier_filter.bloom, old_bloom)
+
+        # Without a filter yet, every identifier is looked up in the database
+        identifier_filter.reset()
+        identifier_filter.rebuilding = True
+        fresh = make_imei('35693803000001')
+        with self.assertNumQueries(1):
+            results = check_identifiers([('imei', fresh), ('imei', self.registered)])
+        self.assertEqual([r['valid'] for r in results], [True, False])
+        self.assertIsNone(identifier_filter.bloom)
+
+    def test_local_format_checks(self):
+        with self.assertNumQueries(0):
+            results = check_identifiers([('imei', '123'), ('serial', 'R58M'), ('serial', 'R58M'), ('foo', 'x')])
+        self.assertEqual([r['valid'] for r in results], [False, False, False, False])
+        self.assertIn('check digit', results[0]['message'])
+        self.assertEqual(results[1]['message'], 'Scanned more than once')
+
+    def test_batch_endpoint(self):
+        self.client.force_login(self.staff)
+        fresh = make_imei('35693803000001')
+        response = self.client.post(
+            reverse('inventory_erp:validate_identifiers'),
+            json.dumps({'identifiers': [fresh, self.registered, {'type': 'serial', 'value': 'R58M123'}]}),
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertFalse(data['valid'])
+        self.assertEqual([r['valid'] for r in data['results']], [True, False, True])
+
+        response = self.client.get(reverse('inventory_erp:validate_identifier'), {'identifier': self.registered})
+        self.assertEqual(response.json()['valid'], False)
+
+
+class ManifestImportTest(ErpTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.phone = Device.objects.create(name='S24', company=cls.company, price=Decimal('100'))
+        cls.registered = make_imei('35693803564380')
+        DeviceIdentifier.objects.create(device=cls.phone, identifier_type='imei', identifier_value=cls.registered)
+
+    def manifest(self):
+        good = [make_imei(f'35693803{n:06d}') for n in range(1, 4)]
+        rows = [
+            ['Device', 'IMEI', 'Condition', 'Unit Price'],
+            [self.phone.name, good[0], 'new', '100'],
+            [self.phone.sku, good[1], 'used', '80'],
+            [str(self.phone.pk), good[2], '', '100'],
+            ['Nokia 3310', make_imei('35693803000100'), 'new', '10'],
+            [self.phone.name, '356938035643801', 'new', '100'],
+            [self.phone.name, self.registered, 'new', '100'],
+            [self.phone.name, good[0], 'new', '100'],
+            ['', '', '', ''],
+        ]
+        return good, rows
+
+    def csv_file(self, rows):
+        output = StringIO()
+        csv.writer(output).writerows(rows)
+        return BytesIO(output.getvalue().encode('utf-8-sig'))
+
+    def test_csv_import_writes_valid_rows_and_reports_rejects(self):
+        good, rows = self.manifest()
+        output = StringIO()
+        reader = ManifestReader(self.csv_file(rows), 'manifest.csv')
+        summary = import_purchase(reader, self.dealer, date(2025, 1, 10), 'INV-9', user=self.staff,
+                                  payment_type='credit', rejects=csv.writer(output))
+
+        purchase = summary['purchase']
+        self.assertEqual((summary['accepted'], summary['rejected']), (3, 4))
+        self.assertEqual(purchase.total_amount, Decimal('280'))
+        self.assertEqual(
+            sorted(PurchaseItem.objects.filter(purchase=purchase).values_list('unit_price', 'quantity')),
+            [(Decimal('80'), 1), (Decimal('100'), 2)],
+        )
+        self.assertEqual(set(DeviceIdentifier.objects.filter(purchase=purchase).values_list('identifier_value', flat=True)), set(good))
+        self.assertEqual(Ledger.objects.get(purchase=purchase).amount, Decimal('280'))
+
+        rejects = list(csv.reader(StringIO(output.getvalue())))
+        self.assertEqual([r[0] for r in rejects], ['5', '6', '7', '8'])
+        self.assertEqual(rejects[0][1], 'Unknown device "Nokia 3310"')
+        self.assertIn('check digit', rejects[1][1])
+        self.assertEqual(rejects[2][1], 'Already registered')
+        self.assertEqual(rejects[3][1], 'Duplicate in this file')
+        self.assertEqual(rejects[3][2:], rows[7])
+
+    def test_xlsx_import(self):
+        good, rows = self.manifest()
+        workbook = Workbook()
+        for row in rows[:4]:
+            workbook.active.append(row)
+        upload = BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+
+        summary = import_purchase(ManifestReader(upload, 'manifest.xlsx'), self.dealer, date(2025, 1, 10), 'INV-9')
+        self.assertEqual((summary['accepted'], summary['rejected']), (3, 0))
+        self.assertFalse(Ledger.objects.exists())
+
+    def test_bad_files(self):
+        with self.assertRaises(ImportFormatError):
+            ManifestReader(self.csv_file([['Device', 'Price']]), 'manifest.csv')
+        with self.assertRaises(ImportFormatError):
+            ManifestReader(BytesIO(b'x'), 'manifest.pdf')
+
+    def test_command(self):
+        good, rows = self.manifest()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'manifest.csv')
+            with open(path, 'wb') as f:
+                f.write(self.csv_file(rows).getvalue())
+            out = StringIO()
+            call_command('import_purchase', path, dealer=self.dealer.pk, invoice='INV-9', stdout=out)
+            self.assertIn('Imported 3 devices', out.getvalue())
+            with open(os.path.join(directory, 'manifest.rejected.csv'), encoding='utf-8') as f:
+                self.assertEqual(len(list(csv.reader(f))), 5)
+
+            # Everything is now registered, so a second run imports nothing
+            with self.assertRaises(CommandError):
+                call_command('import_purchase', path, dealer=self.dealer.pk, invoice='INV-9', stdout=StringIO())
+            self.assertEqual(Purchase.objects.count(), 1)
+
+    def test_upload_view_and_rejects_download(self):
+        good, rows = self.manifest()
+        self.client.force_login(self.staff)
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post(reverse('inventory_erp:purchase_import'), {
+                'dealer': self.dealer.pk, 'invoice_number': 'INV-9', 'purchase_date': '2025-01-10',
+                'payment_type': 'cash',
+                'file': SimpleUploadedFile('manifest.csv', self.csv_file(rows).getvalue(), 'text/csv'),
+            })
+            self.assertEqual(response.context['summary']['accepted'], 3)
+            download = reverse('inventory_erp:purchase_import_rejects', args=[response.context['rejects_name']])
+            self.assertContains(response, download)
+
+            response = self.client.get(download)
+            content = b''.join(response.streaming_content).decode('utf-8')
+            response.close()
+            self.assertEqual(len(list(csv.reader(StringIO(content)))), 5)
+            self.assertEqual(self.client.get(reverse(
+                'inventory_erp:purchase_import_rejects', args=['0' * 32])).status_code, 404)
+
+    def test_identifier_registered_during_the_upload_is_a_form_error(self):
+        _, rows = self.manifest()
+        self.client.force_login(self.staff)
+        import_purchase(ManifestReader(self.csv_file(rows), 'manifest.csv'), self.dealer, date(2025, 1, 10),
+                        'INV-8', user=self.staff)
+        # As if that import had committed between this one's check and insert
+        with mock.patch('inventory_erp.imports.existing_identifiers', return_value=set()):
+            response = self.client.post(reverse('inventory_erp:purchase_import'), {
+                'dealer': self.dealer.pk, 'invoice_number': 'INV-9', 'purchase_date': '2025-01-10',
+                'file': SimpleUploadedFile('manifest.csv', self.csv_file(rows).getvalue(), 'text/csv'),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'please upload it again')
+        self.assertFalse(Purchase.objects.filter(dealer_invoice_number='INV-9').exists())
+
+    def test_value_too_large_for_its_column_is_a_form_error(self):
+        _, rows = self.manifest()
+        self.client.force_login(self.staff)
+        with mock.patch('inventory_erp.views.import_purchase',
+                        side_effect=DataError('value too long for type character varying(100)')):
+            response = self.client.post(reverse('inventory_erp:purchase_import'), {
+                'dealer': self.dealer.pk, 'invoice_number': 'INV-9' * 50, 'purchase_date': '2025-01-10',
+                'file': SimpleUploadedFile('manifest.csv', self.csv_file(rows).getvalue(), 'text/csv'),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'too long or too large')
+
+
+class TraceabilityTest(ErpTestCase):
+    def setUp(self):
+        self.phone = Device.objects.create(name='S24', company=self.company, price=Decimal('100'))
+        self.purchase = self.create_purchase('1000')
+        self.sold = DeviceIdentifier.objects.create(
+            device=self.phone, identifier_type='imei', identifier_value='356938035643809',
+            purchase=self.purchase, status='sold',
+        )
+        self.sale = self.create_sale('120', sale_date=date(2025, 1, 31))
+        self.sold.sale = self.sale
+        self.sold.save()
+        SaleItem.objects.create(sale=self.sale, device=self.phone, device_identifier=self.sold,
+                                unit_price=Decimal('120'), total_price=Decimal('120'), warranty_months=1)
+        DeviceIdentifier.objects.create(device=self.phone, identifier_type='imei',
+                                        identifier_value='356938035600000', purchase=self.purchase)
+
+    def test_trace_is_one_query(self):
+        with self.assertNumQueries(1):
+            trace = trace_identifier('356938035643809', today=date(2025, 3, 1))
+        self.assertEqual(trace['purchase']['dealer']['name'], 'Main Dealer')
+        self.assertEqual(trace['sale']['invoice_number'], self.sale.invoice_number)
+        self.assertEqual(trace['sale']['unit_price'], Decimal('120'))
+        self.assertEqual(trace['warranty'], {'months': 1, 'expires': date(2025, 2, 28), 'active': False})
+        self.assertIsNone(trace_identifier('000'))
+
+        unsold = trace_identifier('356938035600000')
+        self.assertIsNone(unsold['sale'])
+        self.assertIsNone(unsold['warranty'])
+
+    def test_add_months(self):
+        self.assertEqual(add_months(date(2024, 1, 31), 1), date(2024, 2, 29))
+        self.assertEqual(add_months(date(2024, 11, 15), 14), date(2026, 1, 15))
+
+    def test_prefix_and_suffix_search(self):
+        with self.assertNumQueries(1):
+            results = search_identifiers('3809')
+        self.assertEqual([r['value'] for r in results], ['356938035643809'])
+        self.assertEqual(len(search_identifiers('35693803')), 2)
+        self.assertEqual(search_identifiers('938'), [])
+        self.assertEqual(search_identifiers('0356'), [])  # neither the start nor the end
+
+    def test_views(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:trace_device'), {'identifier': '356938035643809'})
+        self.assertEqual(response.json()['device']['sale']['customer_name'], 'Customer')
+        response = self.client.get(reverse('inventory_erp:trace_device'), {'identifier': 'nope'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('inventory_erp:search_devices'), {'q': '0000'})
+        self.assertEqual([r['value'] for r in response.json()['results']], ['356938035600000'])
+        self.assertEqual(self.client.get(reverse('inventory_erp:search_devices'), {'q': '35'}).status_code, 400)
+
+
+class ValuationTest(ErpTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.phone = Device.objects.create(name='S24', company=self.company, price=Decimal('150'), stock=5)
+        self.tablet = Device.objects.create(name='Tab S9', company=self.company, price=Decimal('300'), stock=2)
+        self.watch = Device.objects.create(name='Watch', company=self.company, price=Decimal('50'), stock=0)
+        # Phone layers, oldest first: 4 @ 100, 3 @ 110, 2 @ 130
+        for day, quantity, price in [(1, 4, '100'), (5, 3, '110'), (9, 2, '130')]:
+            purchase = self.create_purchase('0', purchase_date=date(2025, 1, day))
+            PurchaseItem.objects.create(purchase=purchase, device=self.phone, quantity=quantity,
+                                        unit_price=Decimal(price))
+        cancelled = self.create_purchase('0', status='cancelled', purchase_date=date(2025, 1, 10))
+        PurchaseItem.objects.create(purchase=cancelled, device=self.phone, quantity=10, unit_price=Decimal('1'))
+        # Tablet: one unit bought, one unit of opening stock with no history
+        purchase = self.create_purchase('0', purchase_date=date(2025, 1, 3))
+        PurchaseItem.objects.create(purchase=purchase, device=self.tablet, quantity=1, unit_price=Decimal('250'))
+
+    def values(self, valuation):
+        return {device['name']: device['value'] for device in valuation['devices']}
+
+    def test_fifo_values_the_newest_layers(self):
+        valuation = build_valuation('fifo')
+        # 2 @ 130 + 3 @ 110 for the phone; 250 + 300 at list price for the tablet
+        self.assertEqual(self.values(valuation), {'S24': Decimal('590.00'), 'Tab S9': Decimal('550.00'),
+                                                  'Watch': Decimal('0.00')})
+        tablet = next(d for d in valuation['devices'] if d['name'] == 'Tab S9')
+        self.assertEqual(tablet['at_list_price'], 1)
+        self.assertEqual(valuation['totals']['cost_value'], Decimal('1140.00'))
+        self.assertEqual(valuation['totals']['list_value'], Decimal('1350.00'))
+
+    def test_weighted_average(self):
+        valuation = build_valuation('average')
+        # (400 + 330 + 260) / 9 = 110 per phone
+        self.assertEqual(self.values(valuation)['S24'], Decimal('550.00'))
+        self.assertEqual(self.values(valuation)['Tab S9'], Decimal('500.00'))
+        self.assertEqual(valuation['categories'][0]['units'], 7)
+
+    def test_weighted_average_keeps_fractions(self):
+        # (300 + 305) / 2 = 302.5 a unit, not the 302 an integer division gives
+        device = Device.objects.create(name='Pixel', company=self.company, price=Decimal('400'), stock=2)
+        for price in ('300', '305'):
+            PurchaseItem.objects.create(purchase=self.create_purchase('0'), device=device, quantity=1,
+                                        unit_price=Decimal(price))
+        self.assertEqual(self.values(build_valuation('average'))['Pixel'], Decimal('605.00'))
+
+    def test_cached_until_stock_changes(self):
+        get_valuation('fifo')
+        with self.assertNumQueries(0):
+            get_valuation('fifo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.stock = 1
+            self.phone.save()
+        self.assertEqual(self.values(get_valuation('fifo'))['S24'], Decimal('130.00'))
+
+    def test_inventory_report(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:inventory_report'), {'method': 'fifo'})
+        self.assertEqual(response.context['summary']['total_stock_value'], Decimal('1140.00'))
+        self.assertEqual(response.context['summary']['out_of_stock'], 1)
+
+
+class PosSaleTest(ErpTestCase):
+    def setUp(self):
+        self.phone = Device.objects.create(name='S24', company=self.company, price=Decimal('100'), stock=3)
+        self.tablet = Device.objects.create(name='Tab S9', company=self.company, price=Decimal('200'), stock=1)
+        self.imeis = [make_imei(f'35693803{n:06d}') for n in range(1, 4)]
+        for value in self.imeis:
+            DeviceIdentifier.objects.create(device=self.phone, identifier_type='imei', identifier_value=value)
+        DeviceIdentifier.objects.create(device=self.tablet, identifier_type='serial', identifier_value='TAB-1')
+
+    def payload(self, items, **extra):
+        data = {
+            'customer_name': 'Ahmed', 'customer_phone': '0300', 'sale_type': 'retail',
+            'sale_date': '2025-02-01', 'tax_amount': '0', 'received_amount': '250', 'items': items,
+        }
+        data.update(extra)
+        return data
+
+    def test_sale_marks_devices_sold_and_decrements_stock(self):
+        items = [
+            {'identifier': self.imeis[0]},
+            {'identifier': self.imeis[1], 'unit_price': '90', 'discount': '5', 'warranty_months': 6},
+            {'identifier': 'TAB-1'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            sale = create_counter_sale(self.payload(items), self.staff)
+        self.assertLess(len(queries), 20)
+
+        self.assertEqual(sale.invoice_number, '2025-000001')
+        self.assertEqual((sale.total_amount, sale.discount, sale.final_amount), (390, 5, 385))
+        self.assertEqual(sale.payment_status, 'partial')
+        self.assertEqual(SaleItem.objects.filter(sale=sale).count(), 3)
+        self.assertEqual(SaleItem.objects.get(device_identifier__identifier_value=self.imeis[1]).warranty_months, 6)
+        self.assertEqual(DeviceIdentifier.objects.filter(sale=sale, status='sold').count(), 3)
+        self.phone.refresh_from_db()
+        self.tablet.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.tablet.stock), (1, 0))
+        self.assertEqual(Payment.objects.get(sale=sale).amount, Decimal('250'))
+
+        second = create_counter_sale(self.payload([{'identifier': self.imeis[2]}]), self.staff)
+        self.assertEqual(second.invoice_number, '2025-000002')
+
+    def test_unavailable_devices_write_nothing(self):
+        create_counter_sale(self.payload([{'identifier': self.imeis[0]}]), self.staff)
+
+        with self.assertRaises(SaleError) as raised:
+            create_counter_sale(self.payload([
+                {'identifier': self.imeis[1]}, {'identifier': self.imeis[0]}, {'identifier': 'NOPE'},
+            ]), self.staff)
+        messages = [(e['line'], e['message']) for e in raised.exception.errors]
+        self.assertEqual(messages, [(2, f'{self.imeis[0]} is already sold'), (3, 'NOPE is not a registered device')])
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(DeviceIdentifier.objects.get(identifier_value=self.imeis[1]).status, 'in_stock')
+        # The failed sale didn't use up an invoice number
+        self.assertEqual(InvoiceSequence.objects.get(name='sale-2025').last_value, 1)
+
+    def test_validation(self):
+        with self.assertRaises(SaleError) as raised:
+            create_counter_sale(self.payload(
+                [{'identifier': self.imeis[0]}, {'identifier': self.imeis[0], 'discount': '-1'}],
+                customer_name='', sale_type='wholesale',
+            ), self.staff)
+        fields = {(e['line'], e['field']) for e in raised.exception.errors}
+        self.assertEqual(fields, {(None, 'customer_name'), (None, 'sub_dealer_id'),
+                                  (2, 'discount'), (1, 'identifier'), (2, 'identifier')})
+
+    def test_views(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:scan_device'), {'identifier': 'TAB-1'})
+        self.assertEqual(response.json()['device']['name'], 'Tab S9')
+
+        url = reverse('inventory_erp:sale_entry')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, json.dumps(self.payload([{'identifier': 'TAB-1'}])),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['invoice_number'], '2025-000001')
+        response = self.client.post(url, json.dumps(self.payload([{'identifier': 'TAB-1'}])),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('inventory_erp:scan_device'), {'identifier': 'TAB-1'})
+        self.assertEqual(response.json(), {'available': False, 'message': 'This device is sold'})
+
+
+class StockReconciliationTest(ErpTestCase):
+    def setUp(self):
+        self.phone = Device.objects.create(name='S24', company=self.company, price=Decimal('100'), stock=7)
+        self.tablet = Device.objects.create(name='Tab S9', company=self.company, price=Decimal('200'), stock=2)
+        self.charger = Device.objects.create(name='Charger', company=self.company, price=Decimal('5'), stock=40)
+        for n, status in enumerate(['in_stock', 'in_stock', 'reserved', 'sold']):
+            DeviceIdentifier.objects.create(device=self.phone, identifier_type='serial',
+                                            identifier_value=f'P{n}', status=status)
+        for n in range(2):
+            DeviceIdentifier.objects.create(device=self.tablet, identifier_type='serial', identifier_value=f'T{n}')
+
+    def test_intake_updates_stock(self):
+        create_purchase({
+            'dealer_id': self.dealer.pk, 'purchase_date': '2025-01-10', 'invoice_number': 'INV-1',
+            'total_amount': '200', 'items': [{'device_id': self.tablet.pk, 'quantity': 2, 'unit_price': '100',
+                                              'identifiers': [{'type': 'serial', 'value': 'T8'},
+                                                              {'type': 'serial', 'value': 'T9'}]}],
+        }, self.staff)
+        self.tablet.refresh_from_db()
+        self.assertEqual(self.tablet.stock, 4)
+
+    def test_reconcile_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            drift, untracked = reconcile_stock(dry_run=True)
+        # The devices and one grouped count, whatever the number of devices
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 2)
+        self.assertEqual([(d.name, recorded, actual) for d, recorded, actual in drift], [('S24', 7, 3)])
+        self.assertEqual(untracked, 1)
+
+        reconcile_stock()
+        self.assertEqual(
+            dict(Device.objects.values_list('name', 'stock')), {'S24': 3, 'Tab S9': 2, 'Charger': 40}
+        )
+        reconcile_stock(include_untracked=True)
+        self.charger.refresh_from_db()
+        self.assertEqual(self.charger.stock, 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('reconcile_stock', '--dry-run', stdout=out)
+        self.assertIn('S24 (#%d): stock 7 -> 3 (-4)' % self.phone.pk, out.getvalue())
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 7)
+
+        call_command('reconcile_stock', device=[self.phone.pk], stdout=StringIO())
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 3)
+
+
+class DocumentTest(ErpTestCase):
+    def test_ledger_rows_come_from_one_query(self):
+        Ledger.objects.bulk_create([
+            Ledger(dealer=self.dealer, transaction_date=date(2025, 1, 1 + n % 28), amount=Decimal('10'),
+                   payment_type='credit' if n % 2 else 'net', balance_after=Decimal(n), created_by=self.staff)
+            for n in range(300)
+        ])
+        entries = Ledger.objects.filter(dealer=self.dealer).order_by('transaction_date', 'id')
+        with self.assertNumQueries(1):
+            docx_file = generate_ledger_docx(self.dealer, entries, opening_balance=Decimal('5'))
+
+        table = Document(docx_file).tables[0]
+        self.assertEqual(len(table.rows), 302)
+        self.assertEqual([c.text for c in table.rows[1].cells], ['', 'Opening Balance', '', '', '5'])
+        first = entries.first()
+        self.assertEqual([c.text for c in table.rows[2].cells], [
+            str(first.transaction_date), first.get_payment_type_display(),
+            '10.00' if first.payment_type == 'credit' else '', '' if first.payment_type == 'credit' else '10.00',
+            str(first.balance_after),
+        ])
+
+    def test_sale_invoice_escapes_text(self):
+        phone = Device.objects.create(name='S24 <Ultra> & Co', company=self.company, price=Decimal('100'))
+        identifier = DeviceIdentifier.objects.create(device=phone, identifier_type='serial', identifier_value='R58\x01')
+        sale = self.create_sale('100')
+        SaleItem.objects.create(sale=sale, device=phone, device_identifier=identifier,
+                                unit_price=Decimal('100'), total_price=Decimal('100'))
+
+        rows = Document(generate_sale_docx(sale)).tables[0].rows
+        self.assertEqual([c.text for c in rows[1].cells], ['S24 <Ultra> & Co', 'R58', '1', '100.00', '100.00'])
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:print_sale', args=[sale.pk]))
+        self.assertEqual(response.status_code, 200)
+
+
+def pdf_content(pdf):
+    """Every stream of a PDF, inflated."""
+    content = []
+    for match in re.finditer(rb'stream\r?\n(.*?)\r?\nendstream', pdf, re.S):
+        try:
+            content.append(zlib.decompress(match.group(1)))
+        except zlib.error:
+            content.append(match.group(1))
+    return b''.join(content)
+
+
+class PdfTest(ErpTestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.phone = Device.objects.create(name='S24 (Ultra)', company=self.company, price=Decimal('100'))
+        self.sale = self.create_sale('100')
+        identifier = DeviceIdentifier.objects.create(device=self.phone, identifier_type='serial', identifier_value='R58')
+        SaleItem.objects.create(sale=self.sale, device=self.phone, device_identifier=identifier,
+                                unit_price=Decimal('100'), total_price=Decimal('100'))
+
+    def test_render_paginates_and_repeats_header(self):
+        document = ledger_document(self.dealer, Ledger.objects.none())
+        document['rows'] = [['2025-01-01', 'Credit ' * 30, '10.00', None, str(n)] for n in range(150)]
+        content = pdf_content(render_pdf(document))
+        self.assertIn(b'[(Page 3 of 3)] TJ', content)
+        self.assertEqual(content.count(b'[(Balance)] TJ'), 3)
+        # Overlong cells are cut to the column
+        self.assertIn(b'...)] TJ', content)
+
+    def test_reprint_is_served_from_cache(self):
+        first = request_pdf('sale', {'pk': self.sale.pk})
+        self.assertEqual(first.status, 'ready')
+        self.assertIn(b'[(S24 \\(Ultra\\))] TJ', pdf_content(first.file.read()))
+        first.file.close()
+        # The invoice's stamp and the stored PDF; its lines are not loaded
+        with self.assertNumQueries(2):
+            self.assertEqual(request_pdf('sale', {'pk': self.sale.pk}), first)
+
+        # A changed invoice is a different document
+        Sale.objects.filter(pk=self.sale.pk).update(received_amount=Decimal('50'))
+        second = request_pdf('sale', {'pk': self.sale.pk})
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertNotEqual(second.content_hash, first.content_hash)
+
+    def test_earlier_ledger_entry_changes_the_printout(self):
+        Ledger.objects.create(dealer=self.dealer, transaction_date=date(2025, 2, 1), amount=Decimal('10'),
+                              payment_type='credit', created_by=self.staff)
+        params = {'pk': self.dealer.pk, 'start_date': '2025-02-01'}
+        first = request_pdf('ledger', params)
+        self.assertEqual(request_pdf('ledger', params), first)
+
+        # Moves the opening balance, though no entry in the range changed
+        Ledger.objects.create(dealer=self.dealer, transaction_date=date(2025, 1, 1), amount=Decimal('5'),
+                              payment_type='credit', created_by=self.staff)
+        self.assertNotEqual(request_pdf('ledger', params), first)
+
+    @override_settings(ERP_PDF_SYNC_MAX_ROWS=0)
+    def test_large_documents_render_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rendered = request_pdf('inventory', {'method': 'fifo'}, self.staff, site_url='http://shop.test/')
+            self.assertEqual(rendered.status, 'pending')
+            # Asked again while the job is queued: wait for the same job
+            self.assertEqual(request_pdf('inventory', {'method': 'fifo'}), rendered)
+        rendered.refresh_from_db()
+        self.assertEqual(rendered.status, 'ready')
+        self.assertEqual(rendered.params, {'method': 'fifo'})
+        # The immediate backend rendered it in this request: nobody to email
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(ERP_PDF_SYNC_MAX_ROWS=0,
+                       TASKS={'default': {'BACKEND': 'django_tasks.backends.dummy.DummyBackend'}})
+    def test_worker_emails_the_requester(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rendered = request_pdf('inventory', {'method': 'fifo'}, self.staff, site_url='http://shop.test/')
+        job, = render_pdf_document.get_backend().results
+        self.assertEqual(job.kwargs, {'notify': True})
+        self.assertEqual(rendered.status, 'pending')
+
+        render_pdf_document.call(*job.args, **job.kwargs)
+        rendered.refresh_from_db()
+        self.assertEqual(rendered.status, 'ready')
+        self.assertEqual(len(mail.outbox), 1)
+        download = reverse('inventory_erp:pdf_download', args=[rendered.pk])
+        self.assertIn(f'http://shop.test{download}', mail.outbox[0].body)
+
+    def test_views(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('inventory_erp:pdf_report', args=['sale', self.sale.pk]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+        self.assertEqual(self.client.get(reverse('inventory_erp:pdf_report', args=['sale', 0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('inventory_erp:pdf_report', args=['invoice', 1])).status_code, 404)
+
+        Ledger.objects.create(dealer=self.dealer, transaction_date=date(2025, 1, 1), amount=Decimal('10'),
+                              payment_type='credit', created_by=self.staff)
+        with override_settings(ERP_PDF_SYNC_MAX_ROWS=0):
+            response = self.client.get(reverse('inventory_erp:pdf_report', args=['ledger', self.dealer.pk]),
+                                       HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['download_url']), ('pending', None))
+
+
+class ListQueryBenchmarkTest(TestCase):
+    def test_plans_use_the_composite_indexes(self):
+        out = StringIO()
+        call_command('benchmark_list_queries', rows=400, batch_size=100, stdout=out)
+        output = out.getvalue()
+        for index in ('sale_status_date_idx', 'purchase_dealer_date_idx', 'payment_type_date_idx'):
+            self.assertIn(index, output)
+        # Everything generated is rolled back
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(User.objects.filter(email='list-benchmark@example.com').exists())
+
+
+class SearchTest(ErpTestCase):
+    def setUp(self):
+        self.sale = self.create_sale('100', invoice='INV-100')
+        Sale.objects.filter(pk=self.sale.pk).update(customer_name='Muhammad Ali', customer_phone='0300-1234567')
+        index_objects('sales', [Sale.objects.get(pk=self.sale.pk)])
+        self.longer = self.create_sale('100', invoice='INV-1000')
+
+    def test_partial_phone_and_typos(self):
+        self.assertEqual([r['id'] for r in search('1234567', ['sales'])], [self.sale.pk])
+        self.assertEqual([r['id'] for r in search('3001234', ['sales'])], [self.sale.pk])
+        self.assertEqual([r['id'] for r in search('Muhamad', ['sales'])], [self.sale.pk])
+
+    def test_exact_match_ranks_first(self):
+        results = search('INV-100', ['sales'])
+        self.assertEqual([(r['id'], r['rank']) for r in results], [(self.sale.pk, 3), (self.longer.pk, 2)])
+        self.assertEqual(list(filter_sales({'search': 'inv-100'})), [self.sale, self.longer])
+
+    def test_purchases_and_devices_match_through_dealer_and_company(self):
+        purchase = self.create_purchase('500')
+        Device.objects.create(name='Galaxy A15', company=self.company, price=Decimal('100'))
+        self.assertEqual([r['id'] for r in search('Main Deal', ['purchases'])], [purchase.pk])
+        self.assertEqual([r['label'] for r in search('samsung', ['devices'])], ['Galaxy A15'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.dealer.name = 'Khan Traders'
+        self.dealer.save()
+        self.assertEqual([r['id'] for r in search('khan trad', ['dealers'])], [self.dealer.pk])
+        self.assertEqual(search('Main Dealer', ['dealers']), [])
+        sale_pk = self.longer.pk
+        self.longer.delete()
+        self.assertFalse(SearchToken.objects.filter(entity='sales', object_id=sale_pk).exists())
+
+    def test_rebuild_command_picks_up_bulk_writes(self):
+        Sale.objects.filter(pk=self.longer.pk).update(customer_phone='0345-7654321')
+        self.assertEqual(search('7654321', ['sales']), [])
+        call_command('rebuild_search_index', entity=['sales'], stdout=StringIO())
+        self.assertEqual([r['id'] for r in search('7654321', ['sales'])], [self.longer.pk])
+
+    def test_endpoint(self):
+        self.client.force_login(self.staff)
+        url = reverse('inventory_erp:search')
+        self.assertEqual(self.client.get(url, {'q': '1'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': '1234', 'type': 'users'}).status_code, 400)
+        results = self.client.get(url, {'q': '1234567'}).json()['results']
+        self.assertEqual([(r['type'], r['id']) for r in results], [('sales', self.sale.pk)])
+        response = self.client.get(reverse('inventory_erp:dealer_list'), {'search': 'main'})
+        self.assertEqual(list(response.context['dealers']), [self.dealer])
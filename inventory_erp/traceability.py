@@ -0,0 +1,113 @@
+"""
+IMEI/serial traceability: where a handset came from, who bought it and
+whether it is still under warranty.
+
+A full trace is a single query: the purchase, dealer, sale and device are
+joined with select_related and the sale line (price, warranty) is pulled in
+with a subquery. Partial searches match the start or the end of the
+identifier, both served by an index on PostgreSQL (see migration 0006), so
+typing the last few digits of an IMEI at the counter does not scan the
+table. SQLite scans for suffixes.
+"""
+import calendar
+from datetime import date
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Reverse
+from .models import DeviceIdentifier, SaleItem
+
+MIN_SEARCH_LENGTH = 4
+SEARCH_LIMIT = 20
+
+
+def add_months(value, months):
+    """`value` plus a number of calendar months, clamped to the month's last day."""
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def _traced():
+    sale_item = SaleItem.objects.filter(device_identifier=OuterRef('pk')).order_by('-pk')
+    return DeviceIdentifier.objects.select_related(
+        'device__company', 'device__category', 'purchase__dealer', 'sale__sub_dealer',
+    ).annotate(
+        sale_item_id=Subquery(sale_item.values('pk')[:1]),
+        sale_unit_price=Subquery(sale_item.values('unit_price')[:1]),
+        sale_total_price=Subquery(sale_item.values('total_price')[:1]),
+        warranty_months=Subquery(sale_item.values('warranty_months')[:1]),
+    )
+
+
+def _as_dict(identifier, today):
+    device = identifier.device
+    purchase = identifier.purchase
+    sale = identifier.sale
+    data = {
+        'id': identifier.pk,
+        'type': identifier.identifier_type,
+        'value': identifier.identifier_value,
+        'status': identifier.status,
+        'condition': identifier.purchase_condition,
+        'device': device and {
+            'id': device.pk,
+            'name': device.name,
+            'sku': device.sku,
+            'company': device.company.name,
+            'category': device.category.name if device.category else None,
+        },
+        'purchase': purchase and {
+            'id': purchase.pk,
+            'date': purchase.purchase_date,
+            'invoice_number': purchase.dealer_invoice_number,
+            'type': purchase.purchase_type,
+            'status': purchase.status,
+            'dealer': purchase.dealer and {'id': purchase.dealer.pk, 'name': purchase.dealer.name},
+        },
+        'sale': sale and {
+            'id': sale.pk,
+            'date': sale.sale_date,
+            'invoice_number': sale.invoice_number,
+            'customer_name': sale.customer_name,
+            'customer_phone': sale.customer_phone,
+            'status': sale.status,
+            'sub_dealer': sale.sub_dealer and {'id': sale.sub_dealer.pk, 'name': sale.sub_dealer.name},
+            'sale_item_id': identifier.sale_item_id,
+            'unit_price': identifier.sale_unit_price,
+            'total_price': identifier.sale_total_price,
+        },
+        'warranty': None,
+    }
+    if sale and identifier.warranty_months is not None:
+        expires = add_months(sale.sale_date, identifier.warranty_months)
+        data['warranty'] = {
+            'months': identifier.warranty_months,
+            'expires': expires,
+            'active': expires >= today,
+        }
+    return data
+
+
+def trace_identifier(value, today=None):
+    """Full history of one identifier as a dict, or None if it is unknown."""
+    identifier = _traced().filter(identifier_value=value).first()
+    if identifier is None:
+        return None
+    return _as_dict(identifier, today or date.today())
+
+
+def search_identifiers(term, limit=SEARCH_LIMIT, today=None):
+    """
+    Identifiers starting or ending with `term` (exact matches first), traced
+    in the same single query.
+    """
+    term = term.strip()
+    if len(term) < MIN_SEARCH_LENGTH:
+        return []
+    matches = _traced().annotate(value_reversed=Reverse('identifier_value')).filter(
+        Q(identifier_value__startswith=term) | Q(value_reversed__startswith=term[::-1])
+    ).order_by('identifier_value')[:limit]
+    today = today or date.today()
+    results = [_as_dict(identifier, today) for identifier in matches]
+    results.sort(key=lambda result: result['value'] != term)
+    return results
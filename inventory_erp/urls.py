@@ -5,6 +5,7 @@ app_name = 'inventory_erp'
 
 urlpatterns = [
     path('', views.erp_dashboard, name='dashboard'),
+    path('api/dashboard/', views.erp_dashboard_data, name='dashboard_data'),
     path('devices/', views.device_list, name='device_list'),
     path('devices/add/', views.add_device, name='add_device'),
     path('devices/<int:pk>/', views.device_detail, name='device_detail'),
@@ -14,6 +15,11 @@ urlpatterns = [
     path('purchase/print/<int:pk>/', views.print_purchase, name='print_purchase'),
     path('dealer/ledger/<int:dealer_id>/', views.dealer_ledger, name='dealer_ledger'),
     path('api/validate-identifier/', views.validate_identifier, name='validate_identifier'),
+    path('api/validate-identifiers/', views.validate_identifiers, name='validate_identifiers'),
+    path('api/scan-device/', views.scan_device, name='scan_device'),
+    path('api/trace-device/', views.trace_device, name='trace_device'),
+    path('api/search-devices/', views.search_devices, name='search_devices'),
+    path('api/search/', views.erp_search, name='search'),
     path('companies/', views.CompanyListView.as_view(), name='company_list'),
     path('companies/add/', views.CompanyCreateView.as_view(), name='company_create'),
     path('companies/<int:pk>/', views.CompanyDetailView.as_view(), name='company_detail'),
@@ -31,6 +37,8 @@ urlpatterns = [
     # Purchase Management
     path('purchases/', views.purchase_list, name='purchase_list'),
     path('purchases/new/', views.purchase_entry, name='purchase_entry'),
+    path('purchases/import/', views.purchase_import, name='purchase_import'),
+    path('purchases/import/rejects/<slug:name>/', views.purchase_import_rejects, name='purchase_import_rejects'),
     path('purchases/<int:pk>/print/', views.print_purchase, name='print_purchase'),
     path('purchases/returns/', views.purchase_return_list, name='purchase_return_list'),
     path('purchase/payments/', views.purchase_payments, name='purchase_payments'),
@@ -46,6 +54,13 @@ urlpatterns = [
     path('reports/sales/', views.sales_report, name='sales_report'),
     path('reports/purchases/', views.purchase_report, name='purchase_report'),
     path('reports/inventory/', views.inventory_report, name='inventory_report'),
+    path('export/<slug:name>/<slug:fmt>/', views.export_data, name='export'),
+
+    # PDF printouts
+    path('pdf/documents/<int:pk>/', views.pdf_status, name='pdf_status'),
+    path('pdf/documents/<int:pk>/download/', views.pdf_download, name='pdf_download'),
+    path('pdf/<slug:kind>/', views.generate_pdf_report, name='pdf_report'),
+    path('pdf/<slug:kind>/<int:pk>/', views.generate_pdf_report, name='pdf_report'),
 
     # Dealer Management
     path('dealers/<int:dealer_id>/ledger/print/', views.print_ledger, name='print_ledger'),
@@ -0,0 +1,175 @@
+"""
+Stock valuation at cost.
+
+Stock on hand is valued from the PurchaseItem.unit_price history rather than
+the list price, with either costing method:
+
+- average: every unit in stock at the device's weighted-average purchase cost.
+- fifo: stock is made of the most recently received units (the oldest are
+  sold first), so it is valued layer by layer from the newest purchases back.
+
+The purchase history is reduced to one cost per device in SQL (an aggregate
+for average, a window over the purchase layers for FIFO), so the work stays
+in the database however long the history gets. Units not covered by any
+purchase, e.g. opening stock entered by hand, fall back to the list price.
+
+Results are cached for the day and dropped whenever a device, purchase or
+purchase line changes (see signals.py).
+"""
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from .models import Device, Purchase, PurchaseItem
+
+METHODS = {'average': 'Weighted average', 'fifo': 'FIFO'}
+CACHE_PREFIX = 'inventory_erp:valuation'
+CENT = Decimal('0.01')
+
+# Per device: stock, units bought and their total cost. The average is taken
+# in Python, as SQLite divides integer sums as integers
+AVERAGE_SQL = """
+SELECT item.device_id,
+       device.stock,
+       SUM(item.quantity),
+       SUM(item.quantity * item.unit_price)
+FROM {item} item
+JOIN {purchase} purchase ON purchase.id = item.purchase_id
+JOIN {device} device ON device.id = item.device_id
+WHERE purchase.status <> 'cancelled' AND device.is_active AND device.stock > 0
+GROUP BY item.device_id, device.stock
+HAVING SUM(item.quantity) > 0
+"""
+
+# Each purchase line is a cost layer; `newer` is how many units arrived after
+# it. A layer still holds min(quantity, stock - newer) units of the stock.
+FIFO_SQL = """
+WITH layers AS (
+    SELECT item.device_id, item.quantity, item.unit_price, device.stock,
+           COALESCE(SUM(item.quantity) OVER (
+               PARTITION BY item.device_id
+               ORDER BY purchase.purchase_date DESC, item.id DESC
+               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+           ), 0) AS newer
+    FROM {item} item
+    JOIN {purchase} purchase ON purchase.id = item.purchase_id
+    JOIN {device} device ON device.id = item.device_id
+    WHERE purchase.status <> 'cancelled' AND device.is_active AND device.stock > 0
+)
+SELECT device_id,
+       SUM(CASE WHEN quantity < stock - newer THEN quantity ELSE stock - newer END),
+       SUM((CASE WHEN quantity < stock - newer THEN quantity ELSE stock - newer END) * unit_price)
+FROM layers
+WHERE newer < stock
+GROUP BY device_id
+"""
+
+
+def _run(sql):
+    tables = {
+        'item': PurchaseItem._meta.db_table,
+        'purchase': Purchase._meta.db_table,
+        'device': Device._meta.db_table,
+    }
+    with connections[PurchaseItem.objects.db].cursor() as cursor:
+        cursor.execute(sql.format(**tables))
+        return cursor.fetchall()
+
+
+def _decimal(value):
+    # SQLite hands back floats for computed values
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def cost_layers(method):
+    """{device_id: (units valued at cost, cost of those units)}"""
+    if method == 'average':
+        return {
+            device_id: (stock, _decimal(cost) * stock / _decimal(units))
+            for device_id, stock, units, cost in _run(AVERAGE_SQL)
+        }
+    return {
+        device_id: (int(units), _decimal(cost))
+        for device_id, units, cost in _run(FIFO_SQL)
+    }
+
+
+def build_valuation(method):
+    if method not in METHODS:
+        raise ValueError(f'Unknown valuation method "{method}"')
+    costs = cost_layers(method)
+
+    devices = []
+    categories = {}
+    totals = {'units': 0, 'cost_value': Decimal('0'), 'list_value': Decimal('0')}
+    rows = Device.objects.filter(is_active=True).order_by('name').values_list(
+        'id', 'name', 'sku', 'stock', 'price', 'company__name', 'category__name'
+    )
+    for device_id, name, sku, stock, price, company, category in rows:
+        price = price or Decimal('0')
+        stock = max(stock, 0)
+        costed_units, cost = costs.get(device_id, (0, Decimal('0')))
+        value = (cost + (stock - costed_units) * price).quantize(CENT)
+        list_value = (stock * price).quantize(CENT)
+        devices.append({
+            'id': device_id,
+            'name': name,
+            'sku': sku,
+            'company': company,
+            'category': category,
+            'stock': stock,
+            'price': price,
+            'unit_cost': (value / stock).quantize(CENT) if stock else None,
+            'value': value,
+            'list_value': list_value,
+            'at_list_price': stock - costed_units,
+        })
+        summary = categories.setdefault(category, {
+            'category': category, 'count': 0, 'units': 0,
+            'value': Decimal('0'), 'list_value': Decimal('0'),
+        })
+        summary['count'] += 1
+        summary['units'] += stock
+        summary['value'] += value
+        summary['list_value'] += list_value
+        totals['units'] += stock
+        totals['cost_value'] += value
+        totals['list_value'] += list_value
+
+    return {
+        'method': method,
+        'totals': totals,
+        'categories': sorted(categories.values(), key=lambda c: c['value'], reverse=True),
+        'devices': devices,
+    }
+
+
+def _version():
+    version = cache.get(f'{CACHE_PREFIX}:version')
+    if version is None:
+        version = time.time_ns()
+        cache.set(f'{CACHE_PREFIX}:version', version, None)
+    return version
+
+
+def valuation_key(method=None):
+    """Cache key of today's valuation; it changes with every stock/cost change."""
+    method = method or getattr(settings, 'ERP_VALUATION_METHOD', 'average')
+    return f'{CACHE_PREFIX}:{method}:{_version()}:{timezone.now().date().isoformat()}'
+
+
+def get_valuation(method=None):
+    """Today's valuation, cached until the end of the day or the next stock/cost change."""
+    method = method or getattr(settings, 'ERP_VALUATION_METHOD', 'average')
+    key = valuation_key(method)
+    valuation = cache.get(key)
+    if valuation is None:
+        valuation = build_valuation(method)
+        cache.set(key, valuation, getattr(settings, 'ERP_VALUATION_CACHE_SECONDS', 86400))
+    return valuation
+
+
+def invalidate_valuation():
+    cache.set(f'{CACHE_PREFIX}:version', time.time_ns(), None)
@@ -1,24 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.template.loader import render_to_string
+from django.db import DataError, IntegrityError
 from django.db.models import Sum, F, Q, Count
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from .models import *
+from .dashboard import get_dashboard_kpis
+from .documents import DOCX_CONTENT_TYPE, generate_ledger_docx, generate_purchase_docx, generate_sale_docx
+from .exports import export_response
+from .identifiers import check_identifiers
+from .imports import ImportFormatError, ManifestReader, import_purchase
+from .intake import IntakeError, create_purchase
+from .filters import filter_ledger, filter_payments, filter_purchases, filter_sales
+from .pdf import PDF_CONTENT_TYPE
+from .pos import PAYMENT_METHODS, SaleError, create_sale, scan_identifier
+from .printouts import DOCUMENTS as PDF_DOCUMENTS, request_pdf
+from .search import LIST_ENTITIES as SEARCH_ENTITIES, MIN_TERM_LENGTH, search as search_records, search_queryset
+from .reports import default_report_range, get_report, parse_report_range
+from .traceability import MIN_SEARCH_LENGTH, search_identifiers, trace_identifier
+from .valuation import METHODS as VALUATION_METHODS, get_valuation
+from setting.metrics import ERP_REPORT_SECONDS
+import csv
 import json
+import tempfile
+import uuid
 from datetime import datetime
 from decimal import Decimal
-from docx import Document
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from io import BytesIO
 # import weasyprint  # For PDF generation - temporarily disabled
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.paginator import Paginator
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+MAX_IDENTIFIER_BATCH = 1000
+IMPORT_REJECTS_DIR = 'imports/rejected'
 
 @staff_member_required
 def erp_dashboard(request):
@@ -31,15 +51,18 @@ def erp_dashboard(request):
     ).filter(total_pending__gt=0)
 
     context = {
-        'total_purchases': Purchase.objects.count(),
-        'total_sales': Sale.objects.count(),
-        'total_dealers': Dealer.objects.count(),
-        'recent_purchases': Purchase.objects.order_by('-created_at')[:5],
+        **get_dashboard_kpis(),
+        'recent_purchases': Purchase.objects.select_related('dealer').order_by('-created_at')[:5],
         'recent_sales': Sale.objects.order_by('-created_at')[:5],
         'pending_payments': dealers_with_pending
     }
     return render(request, 'inventory_erp/dashboard.html', context)
 
+@staff_member_required
+def erp_dashboard_data(request):
+    """KPI snapshot for the dashboard to poll without re-rendering"""
+    return JsonResponse(get_dashboard_kpis())
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def device_list(request):
@@ -60,11 +83,7 @@ def device_list(request):
     if category_id:
         devices = devices.filter(category_id=category_id)
     if search:
-        devices = devices.filter(
-            Q(name__icontains=search) |
-            Q(sku__icontains=search) |
-            Q(company__name__icontains=search)
-        )
+        devices = search_queryset('devices', search, devices)
 
     # Paginate results
     paginator = Paginator(devices, 10)
@@ -184,54 +203,15 @@ def delete_device(request, pk):
 @staff_member_required
 def purchase_entry(request):
     if request.method == 'POST':
-        data = json.loads(request.body)
         try:
-            dealer = Dealer.objects.get(id=data['dealer_id'])
-            purchase = Purchase.objects.create(
-                dealer=dealer,
-                purchase_date=datetime.strptime(data['purchase_date'], '%Y-%m-%d').date(),
-                dealer_invoice_number=data['invoice_number'],
-                purchase_type=data['purchase_type'],
-                total_amount=data['total_amount'],
-                payment_due_date=datetime.strptime(data['due_date'], '%Y-%m-%d').date() if data['due_date'] else None,
-                status='pending'
-            )
-            
-            # Create purchase items and device identifiers
-            for item in data['items']:
-                device = Device.objects.get(id=item['device_id'])
-                purchase_item = PurchaseItem.objects.create(
-                    purchase=purchase,
-                    device=device,
-                    quantity=item['quantity'],
-                    unit_price=item['unit_price'],
-                    received_quantity=item['quantity']
-                )
-                
-                # Create device identifiers
-                for identifier in item['identifiers']:
-                    DeviceIdentifier.objects.create(
-                        device=device,
-                        identifier_type=identifier['type'],
-                        identifier_value=identifier['value'],
-                        purchase=purchase,
-                        status='in_stock'
-                    )
-            
-            # Create ledger entry if credit purchase
-            if data['payment_type'] == 'credit':
-                Ledger.objects.create(
-                    dealer=dealer,
-                    purchase=purchase,
-                    transaction_date=purchase.purchase_date,
-                    amount=purchase.total_amount,
-                    payment_type='credit',
-                    created_by=request.user
-                )
-            
-            return JsonResponse({'status': 'success', 'purchase_id': purchase.id})
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)})
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON payload'}, status=400)
+        try:
+            purchase = create_purchase(data, request.user)
+        except IntakeError as e:
+            return JsonResponse({'status': 'error', 'message': str(e), 'errors': e.errors}, status=400)
+        return JsonResponse({'status': 'success', 'purchase_id': purchase.id})
     
     dealers = Dealer.objects.filter(is_active=True)
     devices = Device.objects.filter(is_active=True).select_related('company')
@@ -243,26 +223,84 @@ def purchase_entry(request):
 
 @staff_member_required
 def validate_identifier(request):
-    identifier = request.GET.get('identifier')
-    device_id = request.GET.get('device_id')
-    
-    existing = DeviceIdentifier.objects.filter(identifier_value=identifier).first()
-    if existing:
-        return JsonResponse({
-            'valid': False,
-            'message': f'This {existing.get_identifier_type_display()} is already registered'
-        })
+    identifier = (request.GET.get('identifier') or '').strip()
+    result = check_identifiers([(request.GET.get('type'), identifier)])[0]
+    if not result['valid']:
+        return JsonResponse({'valid': False, 'message': result['message']})
     return JsonResponse({'valid': True})
 
+@staff_member_required
+def validate_identifiers(request):
+    """
+    Validate a box of scanned identifiers in one request. Expects JSON
+    {"type": "imei", "identifiers": ["3567...", {"type": "serial", "value": "R58..."}]}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=405)
+    try:
+        data = json.loads(request.body)
+        default_type = data.get('type', 'imei')
+        entries = [
+            (item.get('type', default_type), str(item.get('value') or '').strip())
+            if isinstance(item, dict) else (default_type, str(item).strip())
+            for item in data.get('identifiers', [])
+        ]
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON payload'}, status=400)
+    if len(entries) > MAX_IDENTIFIER_BATCH:
+        return JsonResponse({
+            'status': 'error', 'message': f'At most {MAX_IDENTIFIER_BATCH} identifiers per request'
+        }, status=400)
+
+    results = check_identifiers(entries)
+    return JsonResponse({'valid': all(r['valid'] for r in results), 'results': results})
+
+@staff_member_required
+def scan_device(request):
+    """Look up a scanned IMEI/serial for the sale counter."""
+    identifier = (request.GET.get('identifier') or '').strip()
+    if not identifier:
+        return JsonResponse({'available': False, 'message': 'Scan an IMEI or serial number'})
+    return JsonResponse(scan_identifier(identifier))
+
+@staff_member_required
+def trace_device(request):
+    """Purchase, sale and warranty history of one IMEI/serial."""
+    identifier = (request.GET.get('identifier') or '').strip()
+    trace = trace_identifier(identifier) if identifier else None
+    if trace is None:
+        return JsonResponse({'found': False, 'message': 'No device with this IMEI/serial'}, status=404)
+    return JsonResponse({'found': True, 'device': trace})
+
+@staff_member_required
+def search_devices(request):
+    """Devices whose IMEI/serial starts or ends with `q`."""
+    term = (request.GET.get('q') or '').strip()
+    if len(term) < MIN_SEARCH_LENGTH:
+        return JsonResponse({
+            'status': 'error', 'message': f'Enter at least {MIN_SEARCH_LENGTH} characters'
+        }, status=400)
+    return JsonResponse({'results': search_identifiers(term)})
+
+@staff_member_required
+def erp_search(request):
+    """Dealers, sales, purchases and devices matching `q`, best first; `type` narrows it to one of them."""
+    term = (request.GET.get('q') or '').strip()
+    if len(term) < MIN_TERM_LENGTH:
+        return JsonResponse({
+            'status': 'error', 'message': f'Enter at least {MIN_TERM_LENGTH} characters'
+        }, status=400)
+    entity = request.GET.get('type')
+    if entity and entity not in SEARCH_ENTITIES:
+        return JsonResponse({'status': 'error', 'message': f'Unknown type "{entity}"'}, status=400)
+    return JsonResponse({'results': search_records(term, (entity,) if entity else SEARCH_ENTITIES)})
+
 @staff_member_required
 def print_purchase(request, pk):
     purchase = get_object_or_404(Purchase, pk=pk)
     docx_file = generate_purchase_docx(purchase)
     
-    response = HttpResponse(
-        docx_file.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    )
+    response = HttpResponse(docx_file.getvalue(), content_type=DOCX_CONTENT_TYPE)
     response['Content-Disposition'] = f'attachment; filename=purchase_{purchase.id}.docx'
     return response
 
@@ -321,22 +359,13 @@ def dealer_list(request):
     # Apply filters
     if dealer_type:
         dealers = dealers.filter(dealer_type=dealer_type)
-    if search:
-        dealers = dealers.filter(
-            Q(name__icontains=search) |
-            Q(contact_person__icontains=search) |
-            Q(phone__icontains=search) |
-            Q(email__icontains=search)
-        )
     if is_active:
         dealers = dealers.filter(is_active=is_active == 'active')
 
     # Add aggregated data
-    dealers = dealers.annotate(
-        total_purchases=Sum('purchases__total_amount'),
-        total_paid=Sum('purchases__paid_amount'),
-        balance=F('total_purchases') - F('total_paid')
-    )
+    dealers = dealers.with_balances().order_by('name')
+    if search:
+        dealers = search_queryset('dealers', search, dealers)
 
     # Paginate results
     paginator = Paginator(dealers, 10)
@@ -386,7 +415,7 @@ def dealer_create(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def dealer_detail(request, pk):
-    dealer = get_object_or_404(Dealer, pk=pk)
+    dealer = get_object_or_404(Dealer.objects.with_balances(), pk=pk)
     
     # Get recent purchases
     recent_purchases = dealer.purchases.all().order_by('-purchase_date')[:5]
@@ -396,9 +425,10 @@ def dealer_detail(request, pk):
     
     # Calculate summary
     summary = {
-        'total_purchases': dealer.purchases.aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-        'total_paid': dealer.purchases.aggregate(Sum('paid_amount'))['paid_amount__sum'] or 0,
+        'total_purchases': dealer.total_purchases,
+        'total_paid': dealer.total_paid,
         'outstanding_balance': dealer.outstanding_balance,
+        'overdue_amount': dealer.overdue_amount,
     }
     
     context = {
@@ -461,40 +491,33 @@ def dealer_delete(request, pk):
 def dealer_ledger(request, dealer_id=None):
     dealer = None
     ledger_entries = []
+    opening_balance = None
     dealers = Dealer.objects.filter(is_active=True)
+    dealer_id = dealer_id or request.GET.get('dealer')
     
     if dealer_id:
         dealer = get_object_or_404(Dealer, pk=dealer_id)
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
         
-        # Get ledger entries
-        ledger_entries = dealer.ledger_entries.all()
+        # Entries carry their stored balance_after, so each page is a single
+        # index range scan on (dealer, transaction_date)
+        paginator = Paginator(filter_ledger(dealer, request.GET), 50)
+        ledger_entries = paginator.get_page(request.GET.get('page'))
+
+        start_date = request.GET.get('start_date')
         if start_date:
-            ledger_entries = ledger_entries.filter(transaction_date__gte=start_date)
-        if end_date:
-            ledger_entries = ledger_entries.filter(transaction_date__lte=end_date)
-            
-        ledger_entries = ledger_entries.order_by('transaction_date')
-        
-        # Calculate running balance
-        balance = 0
-        for entry in ledger_entries:
-            if entry.payment_type == 'credit':
-                balance += entry.amount
-            else:
-                balance -= entry.amount
-            entry.running_balance = balance
+            opening_balance = Ledger.objects.opening_balance(dealer, start_date)
     
     context = {
         'dealer': dealer,
         'dealers': dealers,
         'ledger_entries': ledger_entries,
+        'opening_balance': opening_balance,
     }
     return render(request, 'inventory_erp/dealer_ledger.html', context)
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@ERP_REPORT_SECONDS.time(report='dealers')
 def dealer_report(request):
     # Get filter parameters
     dealer_type = request.GET.get('type')
@@ -507,17 +530,7 @@ def dealer_report(request):
         dealers = dealers.filter(dealer_type=dealer_type)
         
     # Add aggregated data within date range
-    purchase_filter = Q()
-    if start_date:
-        purchase_filter &= Q(purchases__purchase_date__gte=start_date)
-    if end_date:
-        purchase_filter &= Q(purchases__purchase_date__lte=end_date)
-        
-    dealers = dealers.annotate(
-        total_purchases=Sum('purchases__total_amount', filter=purchase_filter),
-        total_paid=Sum('purchases__paid_amount', filter=purchase_filter),
-        balance=F('total_purchases') - F('total_paid')
-    )
+    dealers = dealers.with_balances(start_date=start_date, end_date=end_date).order_by('name')
     
     context = {
         'dealers': dealers,
@@ -525,38 +538,14 @@ def dealer_report(request):
         'start_date': start_date,
         'end_date': end_date,
         'dealer_types': Dealer.DEALER_TYPES,
-        'total_outstanding': sum(d.balance or 0 for d in dealers),
+        'total_outstanding': sum(d.balance for d in dealers),
     }
     return render(request, 'inventory_erp/dealer_report.html', context)
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def purchase_list(request):
-    purchases = Purchase.objects.all().order_by('-purchase_date')
-    
-    # Filter by date range
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    if start_date and end_date:
-        purchases = purchases.filter(purchase_date__range=[start_date, end_date])
-
-    # Filter by dealer
-    dealer_id = request.GET.get('dealer')
-    if dealer_id:
-        purchases = purchases.filter(dealer_id=dealer_id)
-
-    # Filter by status
-    status = request.GET.get('status')
-    if status:
-        purchases = purchases.filter(status=status)
-
-    # Search
-    search = request.GET.get('search')
-    if search:
-        purchases = purchases.filter(
-            Q(dealer_invoice_number__icontains=search) |
-            Q(dealer__name__icontains=search)
-        )
+    purchases = filter_purchases(request.GET)
 
     paginator = Paginator(purchases, 20)
     page = request.GET.get('page')
@@ -569,6 +558,69 @@ def purchase_list(request):
     }
     return render(request, 'inventory_erp/purchase_list.html', context)
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def purchase_import(request):
+    context = {
+        'dealers': Dealer.objects.filter(is_active=True),
+        'today': datetime.now().date().isoformat(),
+        'form_data': request.POST,
+    }
+    if request.method == 'POST':
+        dealer = Dealer.objects.filter(pk=request.POST.get('dealer') or 0).first()
+        upload = request.FILES.get('file')
+        try:
+            purchase_date = datetime.strptime(request.POST.get('purchase_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            purchase_date = None
+        if dealer is None or upload is None or purchase_date is None or not request.POST.get('invoice_number'):
+            messages.error(request, 'Dealer, invoice number, purchase date and a file are required')
+            return render(request, 'inventory_erp/purchase_import.html', context)
+
+        rejects_name = uuid.uuid4().hex
+        with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as rejects_file:
+            try:
+                reader = ManifestReader(upload.file, upload.name)
+                rejects = csv.writer(rejects_file)
+                rejects.writerow(['row', 'error', *reader.header])
+                try:
+                    summary = import_purchase(
+                        reader, dealer, purchase_date, request.POST['invoice_number'], user=request.user,
+                        payment_type=request.POST.get('payment_type', 'cash'), rejects=rejects,
+                    )
+                finally:
+                    reader.close()
+            except ImportFormatError as e:
+                messages.error(request, str(e))
+                return render(request, 'inventory_erp/purchase_import.html', context)
+            except IntegrityError:
+                # An identifier in the file was registered by another request
+                # after it was checked; the import was rolled back as a whole
+                messages.error(request, 'Some identifiers in this file were registered by someone else '
+                                        'while it was being imported. Nothing was saved; please upload it again.')
+                return render(request, 'inventory_erp/purchase_import.html', context)
+            except DataError:
+                # A value too long or too large for its column (PostgreSQL);
+                # the import was rolled back as a whole
+                messages.error(request, 'A value in this file is too long or too large to be saved, such as an '
+                                        'overlong identifier or invoice number. Nothing was saved; please fix '
+                                        'the file and upload it again.')
+                return render(request, 'inventory_erp/purchase_import.html', context)
+            if summary['rejected']:
+                rejects_file.seek(0)
+                default_storage.save(f'{IMPORT_REJECTS_DIR}/{rejects_name}.csv', File(rejects_file))
+
+        context.update({'summary': summary, 'rejects_name': rejects_name})
+    return render(request, 'inventory_erp/purchase_import.html', context)
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def purchase_import_rejects(request, name):
+    path = f'{IMPORT_REJECTS_DIR}/{name}.csv'
+    if not default_storage.exists(path):
+        raise Http404('Rejected rows file not found')
+    return FileResponse(default_storage.open(path, 'rb'), as_attachment=True, filename=f'rejected-rows-{name[:8]}.csv')
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def purchase_return_list(request):
@@ -581,18 +633,7 @@ def purchase_return_list(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def purchase_payments(request):
-    payments = Payment.objects.filter(payment_type='purchase').order_by('-payment_date')
-    
-    # Filter by date range
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    if start_date and end_date:
-        payments = payments.filter(payment_date__range=[start_date, end_date])
-
-    # Filter by dealer through purchase
-    dealer_id = request.GET.get('dealer')
-    if dealer_id:
-        payments = payments.filter(purchase__dealer_id=dealer_id)
+    payments = filter_payments('purchase', request.GET)
 
     paginator = Paginator(payments, 20)
     page = request.GET.get('page')
@@ -607,32 +648,7 @@ def purchase_payments(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def sale_list(request):
-    sales = Sale.objects.all().order_by('-sale_date')
-    
-    # Filter by date range
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    if start_date and end_date:
-        sales = sales.filter(sale_date__range=[start_date, end_date])
-
-    # Filter by sale type
-    sale_type = request.GET.get('sale_type')
-    if sale_type:
-        sales = sales.filter(sale_type=sale_type)
-
-    # Filter by status
-    status = request.GET.get('status')
-    if status:
-        sales = sales.filter(status=status)
-
-    # Search
-    search = request.GET.get('search')
-    if search:
-        sales = sales.filter(
-            Q(invoice_number__icontains=search) |
-            Q(customer_name__icontains=search) |
-            Q(customer_phone__icontains=search)
-        )
+    sales = filter_sales(request.GET)
 
     paginator = Paginator(sales, 20)
     page = request.GET.get('page')
@@ -649,11 +665,18 @@ def sale_list(request):
 @user_passes_test(lambda u: u.is_staff)
 def sale_entry(request):
     if request.method == 'POST':
-        # Process sale form data
-        pass
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON payload'}, status=400)
+        try:
+            sale = create_sale(data, request.user)
+        except SaleError as e:
+            return JsonResponse({'status': 'error', 'message': str(e), 'errors': e.errors}, status=400)
+        return JsonResponse({'status': 'success', 'sale_id': sale.id, 'invoice_number': sale.invoice_number})
     context = {
-        'devices': Device.objects.filter(is_active=True),
         'dealers': Dealer.objects.filter(dealer_type='sub', is_active=True),
+        'payment_methods': PAYMENT_METHODS,
         'today': datetime.now().date(),
     }
     return render(request, 'inventory_erp/sale_entry.html', context)
@@ -670,13 +693,7 @@ def sale_return_list(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def sale_payments(request):
-    payments = Payment.objects.filter(payment_type='sale').order_by('-payment_date')
-    
-    # Filter by date range
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    if start_date and end_date:
-        payments = payments.filter(payment_date__range=[start_date, end_date])
+    payments = filter_payments('sale', request.GET)
 
     paginator = Paginator(payments, 20)
     page = request.GET.get('page')
@@ -689,30 +706,23 @@ def sale_payments(request):
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@ERP_REPORT_SECONDS.time(report='sales')
 def sales_report(request):
-    start_date = request.GET.get('start_date', timezone.now().date().replace(day=1))
-    end_date = request.GET.get('end_date', timezone.now().date())
-
-    sales = Sale.objects.filter(
-        sale_date__range=[start_date, end_date]
-    )
+    start_date, end_date = _report_range(request)
+    report = get_report('sales', start_date, end_date)
+    totals = report['totals']
 
     summary = {
-        'total_sales': sales.count(),
-        'total_amount': sales.aggregate(total=Sum('final_amount'))['total'] or 0,
-        'received_amount': sales.aggregate(total=Sum('received_amount'))['total'] or 0,
-        'pending_amount': sales.aggregate(total=Sum('balance_due'))['total'] or 0,
+        'total_sales': totals['count'],
+        'total_amount': totals['amount'],
+        'received_amount': totals['settled'],
+        'pending_amount': totals['pending'],
     }
 
-    # Daily sales chart data
-    daily_sales = sales.values('sale_date').annotate(
-        count=Count('id'),
-        amount=Sum('final_amount')
-    ).order_by('sale_date')
-
     context = {
         'summary': summary,
-        'daily_sales': list(daily_sales),
+        'daily_sales': report['daily'],
+        'dealer_summary': report['dealers'],
         'start_date': start_date,
         'end_date': end_date,
     }
@@ -720,229 +730,130 @@ def sales_report(request):
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@ERP_REPORT_SECONDS.time(report='purchases')
 def purchase_report(request):
-    start_date = request.GET.get('start_date', timezone.now().date().replace(day=1))
-    end_date = request.GET.get('end_date', timezone.now().date())
-
-    purchases = Purchase.objects.filter(
-        purchase_date__range=[start_date, end_date]
-    )
+    start_date, end_date = _report_range(request)
+    report = get_report('purchases', start_date, end_date)
+    totals = report['totals']
 
     summary = {
-        'total_purchases': purchases.count(),
-        'total_amount': purchases.aggregate(total=Sum('total_amount'))['total'] or 0,
-        'paid_amount': purchases.aggregate(total=Sum('paid_amount'))['total'] or 0,
-        'pending_amount': purchases.aggregate(total=Sum('balance_due'))['total'] or 0,
+        'total_purchases': totals['count'],
+        'total_amount': totals['amount'],
+        'paid_amount': totals['settled'],
+        'pending_amount': totals['pending'],
     }
 
-    # Dealer-wise summary
-    dealer_summary = purchases.values('dealer__name').annotate(
-        count=Count('id'),
-        total=Sum('total_amount'),
-        paid=Sum('paid_amount')
-    ).order_by('-total')
-
     context = {
         'summary': summary,
-        'dealer_summary': dealer_summary,
+        'daily_purchases': report['daily'],
+        'dealer_summary': report['dealers'],
         'start_date': start_date,
         'end_date': end_date,
     }
     return render(request, 'inventory_erp/purchase_report.html', context)
 
+def _report_range(request):
+    """Validated report dates; invalid input falls back to month to date."""
+    try:
+        return parse_report_range(request.GET)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return default_report_range()
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@ERP_REPORT_SECONDS.time(report='inventory')
 def inventory_report(request):
-    # Get all active devices with their stock levels
-    devices = Device.objects.filter(is_active=True)
+    # Stock valued at purchase cost (weighted average or FIFO)
+    method = request.GET.get('method')
+    valuation = get_valuation(method if method in VALUATION_METHODS else None)
+    devices = valuation['devices']
 
     summary = {
-        'total_devices': devices.count(),
-        'low_stock': devices.filter(stock__gt=0, stock__lte=10).count(),
-        'out_of_stock': devices.filter(stock=0).count(),
-         'total_stock_value': sum(device.stock * (device.price or 0) for device in devices),
+        'total_devices': len(devices),
+        'low_stock': sum(1 for device in devices if 0 < device['stock'] <= 10),
+        'out_of_stock': sum(1 for device in devices if device['stock'] == 0),
+        'total_stock_value': valuation['totals']['cost_value'],
+        'list_stock_value': valuation['totals']['list_value'],
     }
 
-    # Category-wise summary using annotate
-    category_summary = devices.values('category__name').annotate(
-        count=Count('id'),
-        total_stock=Sum('stock'),
-        stock_value=Sum(F('stock') * F('price'))
-    ).order_by('-count')
-
     context = {
         'summary': summary,
-        'category_summary': category_summary,
+        'category_summary': valuation['categories'],
         'devices': devices,
+        'method': valuation['method'],
+        'methods': VALUATION_METHODS,
     }
     return render(request, 'inventory_erp/inventory_report.html', context)
 
-def generate_pdf_report(request):
-    # Temporary response while PDF generation is disabled
-    return HttpResponse("PDF generation is temporarily disabled. Please check back later.", content_type="text/plain")
-    
-    # Original PDF generation code - temporarily commented out
-    # context = {
-    #     'products': Product.objects.all(),
-    #     'date': timezone.now()
-    # }
-    # html = render_to_string('inventory_erp/pdf_report.html', context)
-    # response = HttpResponse(content_type='application/pdf')
-    # response['Content-Disposition'] = 'attachment; filename="inventory_report.pdf"'
-    # weasyprint.HTML(string=html).write_pdf(response)
-    # return response
-
-def generate_purchase_docx(purchase):
-    doc = Document()
-    
-    # Add title
-    title = doc.add_heading('Purchase Invoice', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Add purchase details
-    doc.add_paragraph(f'Invoice Number: {purchase.dealer_invoice_number}')
-    doc.add_paragraph(f'Date: {purchase.purchase_date}')
-    doc.add_paragraph(f'Dealer: {purchase.dealer.name}')
-    doc.add_paragraph(f'Type: {purchase.get_purchase_type_display()}')
-    
-    # Add items table
-    table = doc.add_table(rows=1, cols=5)
-    table.style = 'Table Grid'
-    
-    # Add headers
-    header_cells = table.rows[0].cells
-    headers = ['Device', 'Quantity', 'Unit Price', 'Total']
-    for i, header in enumerate(headers):
-        header_cells[i].text = header
-    
-    # Add items
-    for item in purchase.items.all():
-        row_cells = table.add_row().cells
-        row_cells[0].text = item.device.name
-        row_cells[1].text = str(item.quantity)
-        row_cells[2].text = str(item.unit_price)
-        row_cells[3].text = str(item.quantity * item.unit_price)
-    
-    # Add totals
-    doc.add_paragraph(f'Total Amount: Rs. {purchase.total_amount}')
-    doc.add_paragraph(f'Paid Amount: Rs. {purchase.paid_amount}')
-    doc.add_paragraph(f'Balance Due: Rs. {purchase.balance_due}')
-    
-    # Save to BytesIO
-    docx_file = BytesIO()
-    doc.save(docx_file)
-    docx_file.seek(0)
-    return docx_file
-
-def generate_sale_docx(sale):
-    doc = Document()
-    
-    # Add title
-    title = doc.add_heading('Sale Invoice', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Add sale details
-    doc.add_paragraph(f'Invoice Number: {sale.invoice_number}')
-    doc.add_paragraph(f'Date: {sale.sale_date}')
-    doc.add_paragraph(f'Customer: {sale.customer_name}')
-    doc.add_paragraph(f'Phone: {sale.customer_phone}')
-    
-    # Add items table
-    table = doc.add_table(rows=1, cols=5)
-    table.style = 'Table Grid'
-    
-    # Add headers
-    header_cells = table.rows[0].cells
-    headers = ['Device', 'Quantity', 'Unit Price', 'Total']
-    for i, header in enumerate(headers):
-        header_cells[i].text = header
-    
-    # Add items
-    for item in sale.items.all():
-        row_cells = table.add_row().cells
-        row_cells[0].text = item.device.name
-        row_cells[1].text = str(item.quantity)
-        row_cells[2].text = str(item.unit_price)
-        row_cells[3].text = str(item.quantity * item.unit_price)
-    
-    # Add totals
-    doc.add_paragraph(f'Total Amount: Rs. {sale.final_amount}')
-    doc.add_paragraph(f'Received Amount: Rs. {sale.received_amount}')
-    doc.add_paragraph(f'Balance Due: Rs. {sale.balance_due}')
-    
-    # Save to BytesIO
-    docx_file = BytesIO()
-    doc.save(docx_file)
-    docx_file.seek(0)
-    return docx_file
-
-def generate_ledger_docx(dealer, ledger_entries):
-    doc = Document()
-    
-    # Add title
-    title = doc.add_heading('Dealer Ledger', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Add dealer details
-    doc.add_paragraph(f'Dealer: {dealer.name}')
-    doc.add_paragraph(f'Type: {dealer.get_dealer_type_display()}')
-    
-    # Add ledger table
-    table = doc.add_table(rows=1, cols=5)
-    table.style = 'Table Grid'
-    
-    # Add headers
-    header_cells = table.rows[0].cells
-    headers = ['Date', 'Transaction', 'Debit', 'Credit', 'Balance']
-    for i, header in enumerate(headers):
-        header_cells[i].text = header
-    
-    # Add entries
-    balance = 0
-    for entry in ledger_entries:
-        row_cells = table.add_row().cells
-        row_cells[0].text = str(entry.transaction_date)
-        row_cells[1].text = entry.get_payment_type_display()
-        
-        if entry.payment_type == 'credit':
-            row_cells[2].text = str(entry.amount)
-            balance += entry.amount
-        else:
-            row_cells[3].text = str(entry.amount)
-            balance -= entry.amount
-            
-        row_cells[4].text = str(balance)
-    
-    # Add summary
-    doc.add_paragraph(f'Current Balance: Rs. {balance}')
-    
-    # Save to BytesIO
-    docx_file = BytesIO()
-    doc.save(docx_file)
-    docx_file.seek(0)
-    return docx_file
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_data(request, name, fmt):
+    """Stream a list or report as CSV/XLSX, honouring the page's filters."""
+    return export_response(name, fmt, request.GET)
+
+@staff_member_required
+def generate_pdf_report(request, kind, pk=None):
+    """
+    PDF of a printout. Served straight away when it is cached or small;
+    otherwise it is rendered in the background and this page waits for it.
+    """
+    if kind not in PDF_DOCUMENTS:
+        raise Http404('Unknown document')
+    params = {**request.GET.dict(), 'pk': pk}
+    try:
+        rendered = request_pdf(kind, params, request.user, site_url=request.build_absolute_uri('/'))
+    except ObjectDoesNotExist:
+        raise Http404('Document not found')
+
+    if rendered.status == 'ready':
+        return _pdf_response(rendered)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(_pdf_status(rendered), status=202)
+    return render(request, 'inventory_erp/pdf_status.html', {'document': rendered})
+
+def _pdf_status(rendered):
+    return {
+        'id': rendered.pk,
+        'status': rendered.status,
+        'filename': rendered.filename,
+        'status_url': reverse('inventory_erp:pdf_status', args=[rendered.pk]),
+        'download_url': reverse('inventory_erp:pdf_download', args=[rendered.pk])
+        if rendered.status == 'ready' else None,
+        'error': rendered.error or None,
+    }
+
+def _pdf_response(rendered):
+    if not rendered.file or not rendered.file.storage.exists(rendered.file.name):
+        raise Http404('File not found')
+    return FileResponse(rendered.file.open('rb'), as_attachment=True,
+                        filename=rendered.filename, content_type=PDF_CONTENT_TYPE)
+
+@staff_member_required
+def pdf_status(request, pk):
+    return JsonResponse(_pdf_status(get_object_or_404(RenderedDocument, pk=pk)))
+
+@staff_member_required
+def pdf_download(request, pk):
+    return _pdf_response(get_object_or_404(RenderedDocument, pk=pk, status='ready'))
 
 @staff_member_required
 def print_sale(request, pk):
     sale = get_object_or_404(Sale, pk=pk)
     docx_file = generate_sale_docx(sale)
     
-    response = HttpResponse(
-        docx_file.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    )
+    response = HttpResponse(docx_file.getvalue(), content_type=DOCX_CONTENT_TYPE)
     response['Content-Disposition'] = f'attachment; filename=sale_{sale.id}.docx'
     return response
 
 @staff_member_required
 def print_ledger(request, dealer_id):
     dealer = get_object_or_404(Dealer, pk=dealer_id)
-    ledger_entries = dealer.ledger_entries.all().order_by('transaction_date')
-    docx_file = generate_ledger_docx(dealer, ledger_entries)
+    ledger_entries = filter_ledger(dealer, request.GET)
+    start_date = request.GET.get('start_date')
+    opening_balance = Ledger.objects.opening_balance(dealer, start_date) if start_date else None
+    docx_file = generate_ledger_docx(dealer, ledger_entries, opening_balance)
     
-    response = HttpResponse(
-        docx_file.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    )
+    response = HttpResponse(docx_file.getvalue(), content_type=DOCX_CONTENT_TYPE)
     response['Content-Disposition'] = f'attachment; filename=ledger_{dealer.id}.docx'
     return response
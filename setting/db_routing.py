@@ -0,0 +1,100 @@
+"""
+Read-replica routing.
+
+ReplicaRoutingMiddleware marks requests to read-heavy views (catalog, blog,
+ERP reports) as replica-eligible, and ReplicaRouter sends their reads to the
+'replica' database. Any write pins the browser to the primary for
+DB_REPLICA_PIN_SECONDS so users always read their own writes (e.g. the order
+they just placed) even if the replica lags behind.
+"""
+import time
+from contextvars import ContextVar
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE_NAME = 'db_primary_pin'
+
+# Apps whose reads must always hit the primary. Sessions are loaded lazily
+# and a fresh login session may not have replicated yet.
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_routing_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def view_uses_replica(view_func):
+    """Check a view against settings.REPLICA_READ_VIEWS (paths or module prefixes)."""
+    path = f'{view_func.__module__}.{view_func.__name__}'
+    return any(
+        path == entry or path.startswith(entry + '.')
+        for entry in getattr(settings, 'REPLICA_READ_VIEWS', [])
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing_state.get()
+        if (state and state.use_replica and not state.wrote
+                and model._meta.app_label not in PRIMARY_ONLY_APPS):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            # Later reads in this request (and the next few requests from
+            # this browser) must see the write
+            state.wrote = True
+        # Explicit, so objects read from the replica are saved to the primary
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'DB_REPLICA_PIN_SECONDS', 10)
+
+    def __call__(self, request):
+        state = RoutingState(use_replica=False)
+        token = _routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                str(int(time.time()) + self.pin_seconds),
+                max_age=self.pin_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing_state.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if self.is_pinned(request):
+            return None
+        state.use_replica = view_uses_replica(view_func)
+        return None
+
+    def is_pinned(self, request):
+        try:
+            return int(request.COOKIES.get(PIN_COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            return False
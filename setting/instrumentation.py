@@ -0,0 +1,369 @@
+"""
+Opt-in request instrumentation.
+
+RequestInstrumentationMiddleware looks at REQUEST_INSTRUMENTATION_SAMPLE_RATE
+of the requests. For those it counts the SQL queries and their time on every
+database (through execute_wrapper, so without the debug cursor), notes
+statements run more than once with the line of project code that ran them,
+and times template rendering and cache lookups. Each sampled request is
+logged as one JSON line on the 'setting.instrumentation' logger, answered
+with a Server-Timing header and added to per-view histograms shown to staff
+by request_metrics.
+
+With the rate at 0 (the default) the middleware removes itself at startup;
+requests that are not sampled cost one random() call.
+
+Histograms are kept per process. Every REQUEST_INSTRUMENTATION_PUBLISH_SECONDS
+a process stores its snapshot in the cache and request_metrics merges the
+snapshots, so with a shared cache (Redis, Memcached) the page covers every
+gunicorn worker; with the local-memory cache only the worker serving it.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import monotonic, perf_counter
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the request duration histogram buckets; one more
+# bucket holds everything slower
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SNAPSHOT_KEY = 'instrumentation:{}'
+PROCESSES_KEY = 'instrumentation:processes'
+SNAPSHOT_TIMEOUT = 24 * 3600
+# Duplicate statements listed per request in the log line
+MAX_DUPLICATES = 10
+
+_current = ContextVar('request_instrumentation', default=None)
+_MISSING = object()
+_FILE = os.path.abspath(__file__)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # SQL: [times run, call site of the first repeat]
+        self.statements = {}
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+
+    def duplicates(self):
+        repeated = [(sql, count, site) for sql, (count, site) in self.statements.items() if count > 1]
+        repeated.sort(key=lambda statement: -statement[1])
+        return [{'sql': sql[:300], 'count': count, 'call_site': site} for sql, count, site in repeated]
+
+
+def _call_site():
+    """The innermost frame of project code outside this module, as 'path:line in function'."""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and 'site-packages' not in filename and filename != _FILE:
+            return f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += perf_counter() - started
+            seen = stats.statements.get(sql)
+            if seen is None:
+                stats.statements[sql] = [1, None]
+            else:
+                seen[0] += 1
+                if seen[1] is None:
+                    # Only repeats pay for walking the stack
+                    seen[1] = _call_site()
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        stats = _current.get()
+        # Templates rendered while rendering (render_to_string in a tag) are
+        # already inside the outer timing
+        if stats is None or stats.template_depth:
+            return render(self, *args, **kwargs)
+        stats.template_depth += 1
+        started = perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_depth -= 1
+            stats.template_time += perf_counter() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, *args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats.cache_depth:
+            return get(self, key, default, *args, **kwargs)
+        stats.cache_depth += 1
+        try:
+            value = get(self, key, _MISSING, *args, **kwargs)
+        finally:
+            stats.cache_depth -= 1
+        if value is _MISSING:
+            stats.cache_misses += 1
+            return default
+        stats.cache_hits += 1
+        return value
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, *args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats.cache_depth:
+            return get_many(self, keys, *args, **kwargs)
+        keys = list(keys)
+        stats.cache_depth += 1
+        try:
+            found = get_many(self, keys, *args, **kwargs)
+        finally:
+            stats.cache_depth -= 1
+        stats.cache_hits += len(found)
+        stats.cache_misses += len(keys) - len(found)
+        return found
+    wrapper.instrumented = True
+    return wrapper
+
+
+_installed = threading.Lock()
+
+
+def install():
+    """
+    Wrap template rendering and the configured cache backends' lookups. The
+    wrappers only measure inside collect(); outside they call straight through.
+    """
+    from django.template.backends.django import Template
+    with _installed:
+        if not getattr(Template.render, 'instrumented', False):
+            Template.render = _timed_render(Template.render)
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if not getattr(backend.get, 'instrumented', False):
+                backend.get = _counted_get(backend.get)
+            if not getattr(backend.get_many, 'instrumented', False):
+                backend.get_many = _counted_get_many(backend.get_many)
+
+
+@contextmanager
+def collect():
+    """Measure the queries, templates and cache lookups run inside the block."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_record_query))
+            yield stats
+    finally:
+        _current.reset(token)
+
+
+class ViewHistograms:
+    """Per-view request counts, duration buckets and totals for this process."""
+
+    FIELDS = ('count', 'total_ms', 'db_ms', 'template_ms', 'queries', 'max_queries', 'duplicates',
+              'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, total_ms, stats, duplicates):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = dict.fromkeys(self.FIELDS, 0)
+                entry['buckets'] = [0] * (len(BUCKETS_MS) + 1)
+            entry['count'] += 1
+            entry['total_ms'] += total_ms
+            entry['db_ms'] += stats.db_time * 1000
+            entry['template_ms'] += stats.template_time * 1000
+            entry['queries'] += stats.queries
+            entry['max_queries'] = max(entry['max_queries'], stats.queries)
+            entry['duplicates'] += duplicates
+            entry['cache_hits'] += stats.cache_hits
+            entry['cache_misses'] += stats.cache_misses
+            entry['buckets'][_bucket(total_ms)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {view: {**entry, 'buckets': list(entry['buckets'])} for view, entry in self.views.items()}
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+def _bucket(ms):
+    for index, bound in enumerate(BUCKETS_MS):
+        if ms <= bound:
+            return index
+    return len(BUCKETS_MS)
+
+
+histograms = ViewHistograms()
+PROCESS = f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _publish():
+    cache.set(SNAPSHOT_KEY.format(PROCESS), histograms.snapshot(), SNAPSHOT_TIMEOUT)
+    processes = cache.get(PROCESSES_KEY) or []
+    if PROCESS not in processes:
+        cache.set(PROCESSES_KEY, [*processes, PROCESS], SNAPSHOT_TIMEOUT)
+
+
+def merged_snapshots():
+    """Every process's histograms added up, this process's current rather than last published."""
+    processes = [process for process in cache.get(PROCESSES_KEY) or [] if process != PROCESS]
+    snapshots = cache.get_many([SNAPSHOT_KEY.format(process) for process in processes])
+    merged = {}
+    for snapshot in [*snapshots.values(), histograms.snapshot()]:
+        for view, entry in snapshot.items():
+            total = merged.get(view)
+            if total is None:
+                merged[view] = {**entry, 'buckets': list(entry['buckets'])}
+                continue
+            for field in ViewHistograms.FIELDS:
+                total[field] = max(total[field], entry[field]) if field == 'max_queries' else total[field] + entry[field]
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], entry['buckets'])]
+    return merged, len(snapshots) + 1
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def server_timing(stats, total_ms):
+    return ', '.join([
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+        f'tpl;dur={stats.template_time * 1000:.1f};desc="templates"',
+        f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+        f'total;dur={total_ms:.1f}',
+    ])
+
+
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.publish_seconds = getattr(settings, 'REQUEST_INSTRUMENTATION_PUBLISH_SECONDS', 30)
+        self.published_at = 0
+        install()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        started = perf_counter()
+        with collect() as stats:
+            response = self.get_response(request)
+        total_ms = (perf_counter() - started) * 1000
+
+        view = _view_name(request)
+        duplicates = stats.duplicates()
+        logger.info(json.dumps({
+            'event': 'request', 'method': request.method, 'path': request.path, 'view': view,
+            'status': response.status_code, 'duration_ms': round(total_ms, 2), 'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000, 2), 'duplicate_queries': duplicates[:MAX_DUPLICATES],
+            'template_ms': round(stats.template_time * 1000, 2), 'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }))
+        timing = server_timing(stats, total_ms)
+        response['Server-Timing'] = f'{response["Server-Timing"]}, {timing}' if response.has_header('Server-Timing') else timing
+
+        histograms.record(view, total_ms, stats, sum(duplicate['count'] - 1 for duplicate in duplicates))
+        if monotonic() - self.published_at >= self.publish_seconds:
+            self.published_at = monotonic()
+            try:
+                _publish()
+            except Exception:
+                logger.exception('Publishing request histograms failed')
+        return response
+
+
+def _percentile(buckets, count, share):
+    """Upper bound (ms) of the bucket holding the given share of requests; None past the last bound."""
+    needed = share * count
+    seen = 0
+    for index, bucket in enumerate(buckets):
+        seen += bucket
+        if seen >= needed:
+            return BUCKETS_MS[index] if index < len(BUCKETS_MS) else None
+    return None
+
+
+@staff_member_required
+def request_metrics(request):
+    """Per-view request histograms from every process that published one."""
+    merged, processes = merged_snapshots()
+    rows = []
+    for view, entry in merged.items():
+        count = entry['count']
+        lookups = entry['cache_hits'] + entry['cache_misses']
+        rows.append({
+            'view': view,
+            'count': count,
+            'total_ms': entry['total_ms'],
+            'mean_ms': entry['total_ms'] / count,
+            'p50_ms': _percentile(entry['buckets'], count, 0.5),
+            'p95_ms': _percentile(entry['buckets'], count, 0.95),
+            'queries': entry['queries'] / count,
+            'max_queries': entry['max_queries'],
+            'db_ms': entry['db_ms'] / count,
+            'template_ms': entry['template_ms'] / count,
+            'duplicates': entry['duplicates'] / count,
+            'cache_hit_rate': entry['cache_hits'] / lookups * 100 if lookups else None,
+            'buckets': [
+                {'bound': bound, 'count': bucket, 'share': bucket / count * 100}
+                for bound, bucket in zip([*BUCKETS_MS, None], entry['buckets'])
+            ],
+        })
+    # Where the time goes first
+    rows.sort(key=lambda row: -row['total_ms'])
+    return render(request, 'admin/request_metrics.html', {
+        'rows': rows,
+        'processes': processes,
+        'sample_rate': getattr(settings, 'REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0),
+        'buckets': [*BUCKETS_MS, None],
+        'slowest_ms': BUCKETS_MS[-1],
+    })
@@ -0,0 +1,359 @@
+"""
+Prometheus metrics for the shop, served at /metrics.
+
+Gunicorn runs several worker processes, so a metric can't simply live in
+memory: each process keeps its values in its own memory-mapped file under
+METRICS_DIR (counter_<pid>.db, gauge_<pid>.db), and an update is a write
+into that mapping. /metrics reads every process's file and adds them up.
+Counters and histograms of workers that have exited stay in the total, as a
+counter must never go down; gauges only count processes still running on
+this host. Nothing removes the files by itself: gunicorn.conf.py clears
+METRICS_DIR when gunicorn starts, and any other way of running the server
+keeps adding to the previous run's values until clear_metrics_dir() is run.
+
+The metrics are declared at the bottom of this module. /metrics answers
+requests with `Authorization: Bearer <METRICS_TOKEN>` and staff.
+"""
+import hmac
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = {}
+_FILE_NAME = re.compile(r'^(counter|gauge)_(\d+)\.db$')
+
+_USED = struct.Struct('<i')
+_LENGTH = struct.Struct('<i')
+_VALUE = struct.Struct('<d')
+# Bytes before the first entry: the used-bytes count, padded so values stay
+# 8-byte aligned
+_START = 8
+
+
+def _padding(length):
+    return (8 - (_LENGTH.size + length) % 8) % 8
+
+
+def _entries(data, used):
+    """(key, value, value position) of every entry in a process file."""
+    position = _START
+    while position < used:
+        length, = _LENGTH.unpack_from(data, position)
+        key = bytes(data[position + _LENGTH.size:position + _LENGTH.size + length]).decode()
+        position += _LENGTH.size + length + _padding(length)
+        value, = _VALUE.unpack_from(data, position)
+        yield key, value, position
+        position += _VALUE.size
+
+
+class ProcessFile:
+    """
+    One process's values: appended (length, key, value) entries in a
+    memory-mapped file. Values are updated in place; the used-bytes count is
+    written after a new entry, so readers never see half of one.
+    """
+
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size == 0:
+            self.size = self.INITIAL_SIZE
+            self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.used = _USED.unpack_from(self.map, 0)[0] or _START
+        self.positions = {key: position for key, _, position in _entries(self.map, self.used)}
+
+    def _position(self, key):
+        position = self.positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode()
+        entry = _LENGTH.pack(len(encoded)) + encoded + b' ' * _padding(len(encoded)) + _VALUE.pack(0)
+        if self.used + len(entry) > self.size:
+            while self.used + len(entry) > self.size:
+                self.size *= 2
+            self.file.truncate(self.size)
+            self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.map[self.used:self.used + len(entry)] = entry
+        self.used += len(entry)
+        _USED.pack_into(self.map, 0, self.used)
+        position = self.positions[key] = self.used - _VALUE.size
+        return position
+
+    def add(self, key, amount):
+        with self.lock:
+            position = self._position(key)
+            _VALUE.pack_into(self.map, position, _VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def set(self, key, value):
+        with self.lock:
+            _VALUE.pack_into(self.map, self._position(key), value)
+
+
+_files = {}
+_files_lock = threading.Lock()
+_files_pid = None
+
+
+def _file(kind):
+    """This process's file of `kind`, reopened after a fork (gunicorn --preload)."""
+    global _files_pid
+    directory = settings.METRICS_DIR
+    with _files_lock:
+        if _files_pid != os.getpid():
+            _files.clear()
+            _files_pid = os.getpid()
+        process_file = _files.get((directory, kind))
+        if process_file is None:
+            os.makedirs(directory, exist_ok=True)
+            process_file = _files[directory, kind] = ProcessFile(os.path.join(directory, f'{kind}_{_files_pid}.db'))
+        return process_file
+
+
+def clear_metrics_dir(directory=None):
+    """Remove every process's file; run once, before any worker starts."""
+    directory = directory or settings.METRICS_DIR
+    with _files_lock:
+        for kind in ('counter', 'gauge'):
+            process_file = _files.pop((directory, kind), None)
+            if process_file is not None:
+                process_file.map.close()
+                process_file.file.close()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file_name in names:
+        if _FILE_NAME.match(file_name):
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except FileNotFoundError:
+                pass
+
+
+def _key(name, suffix, labels):
+    return json.dumps([name, suffix, labels])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_values(directory=None):
+    """{(name, suffix, labels): value} added up over every process's file."""
+    directory = directory or settings.METRICS_DIR
+    values = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return values
+    for file_name in names:
+        match = _FILE_NAME.match(file_name)
+        if match is None or match[1] == 'gauge' and not _alive(int(match[2])):
+            continue
+        try:
+            with open(os.path.join(directory, file_name), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _START:
+            continue
+        for key, value, _ in _entries(data, _USED.unpack_from(data, 0)[0]):
+            name, suffix, labels = json.loads(key)
+            key = (name, suffix, tuple(map(tuple, labels)))
+            values[key] = values.get(key, 0) + value
+    return values
+
+
+class Metric:
+    kind = None
+    file_kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        REGISTRY[name] = self
+
+    def _labels(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes the labels {self.label_names}, not {tuple(labels)}')
+        return sorted((name, str(value)) for name, value in labels.items())
+
+    def _add(self, suffix, labels, amount):
+        _file(self.file_kind).add(_key(self.name, suffix, labels), amount)
+
+    def samples(self, values):
+        """(name, labels, value) exposed for this metric."""
+        own = [(suffix, labels, value) for (name, suffix, labels), value in values.items() if name == self.name]
+        if not own and not self.label_names:
+            own = [('', (), 0)]
+        return [(self.name + suffix, labels, value) for suffix, labels, value in sorted(own)]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters only go up')
+        self._add('', self._labels(labels), amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, summed over the live processes."""
+
+    kind = 'gauge'
+    file_kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._add('', self._labels(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self._add('', self._labels(labels), -amount)
+
+    def set(self, value, **labels):
+        _file(self.file_kind).set(_key(self.name, '', self._labels(labels)), value)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Timer(ContextDecorator):
+    """Observes the seconds spent in a `with` block or decorated function."""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # A decorated view runs in several threads at once; each call times itself
+        return Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        # Stored per bucket; the exposition makes them cumulative
+        bound = next((bound for bound in self.buckets if value <= bound), math.inf)
+        self._add('_bucket', sorted([*labels, ('le', _format(bound))]), 1)
+        self._add('_sum', labels, value)
+        self._add('_count', labels, 1)
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def samples(self, values):
+        series = {}
+        for (name, suffix, labels), value in values.items():
+            if name != self.name:
+                continue
+            le = dict(labels).get('le')
+            labels = tuple(label for label in labels if label[0] != 'le')
+            entry = series.setdefault(labels, {'buckets': {}, 'sum': 0, 'count': 0})
+            if suffix == '_bucket':
+                entry['buckets'][le] = value
+            else:
+                entry[suffix[1:]] = value
+        if not series and not self.label_names:
+            series[()] = {'buckets': {}, 'sum': 0, 'count': 0}
+
+        samples = []
+        for labels, entry in sorted(series.items()):
+            cumulative = 0
+            for bound in (*self.buckets, math.inf):
+                cumulative += entry['buckets'].get(_format(bound), 0)
+                samples.append((f'{self.name}_bucket', (*labels, ('le', _format(bound))), cumulative))
+            samples.append((f'{self.name}_sum', labels, entry['sum']))
+            samples.append((f'{self.name}_count', labels, entry['count']))
+        return samples
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _escape(value, quote=True):
+    value = value.replace('\\', r'\\').replace('\n', r'\n')
+    return value.replace('"', r'\"') if quote else value
+
+
+def exposition(directory=None):
+    """Every registered metric in the Prometheus text format."""
+    values = read_values(directory)
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {_escape(metric.documentation, quote=False)}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples(values):
+            if labels:
+                name += '{' + ','.join(f'{label}="{_escape(text)}"' for label, text in labels) + '}'
+            lines.append(f'{name} {_format(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+ORDERS_PLACED = Counter('store_orders_placed_total', 'Orders committed by place_order.')
+CHECKOUT_SECONDS = Histogram('store_checkout_seconds', 'Time place_order takes, whatever the outcome.')
+STOCK_OUT_REJECTIONS = Counter('store_stock_out_rejections_total',
+                               'Orders turned away because a cart item was out of stock.')
+EMAIL_SEND_SECONDS = Histogram('store_email_send_seconds', 'Time sending a notification email takes.',
+                               buckets=SLOW_BUCKETS)
+EMAIL_FAILURES = Counter('store_email_failures_total', 'Notification emails that could not be sent.')
+CHATBOT_RESPONSE_SECONDS = Histogram('chatbot_response_seconds', 'Time the chatbot model takes to answer.',
+                                     buckets=SLOW_BUCKETS)
+CHATBOT_QUEUE_DEPTH = Gauge('chatbot_queue_depth', 'Chat messages waiting on the chatbot model.')
+ERP_REPORT_SECONDS = Histogram('erp_report_seconds', 'Time an ERP report view takes.', labels=('report',),
+                               buckets=SLOW_BUCKETS)
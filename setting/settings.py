@@ -18,6 +18,8 @@ import os
 from dotenv import load_dotenv
 import sys
 import socket
+import tempfile
+import warnings
 
 # Initialize dotenv
 load_dotenv()
@@ -107,10 +109,13 @@ INSTALLED_APPS = [
     'cms_store.apps.CmsStoreConfig',  # New CMS app for store pages
     'chatbot.apps.ChatbotConfig',
     'inventory_erp.apps.InventoryErpConfig',
+    'django_tasks',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # First after security so its timings cover the rest of the stack
+    'setting.instrumentation.RequestInstrumentationMiddleware',
 ]
 
 # Add WhiteNoise middleware only if not on Vercel
@@ -157,6 +162,13 @@ WSGI_APPLICATION = 'setting.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Persistent connections: keep each connection open for DB_CONN_MAX_AGE seconds
+# instead of reconnecting (and redoing the TLS handshake) on every request.
+# Health checks verify a reused connection before the request touches it.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if DEBUG else '60'))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+DB_POOL = os.getenv('DB_POOL', 'False').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE'),
@@ -165,12 +177,127 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        # Transaction policy: requests run in autocommit. Read-only views
+        # (catalog, blog, HTMX partials, reports) need no transaction at all;
+        # write paths such as place_order, purchase_entry and add_review open
+        # their own scoped transaction.atomic() blocks.
+        'ATOMIC_REQUESTS': False,
     }
 }
 
-# Add this for better database connection handling
-CONN_MAX_AGE = 0  # Close connections after each request
-ATOMIC_REQUESTS = True  # Wrap each request in a transaction
+# Optional connection pool (PostgreSQL with psycopg 3 + psycopg_pool only;
+# install requirements-pool.txt). Django uses psycopg2 when psycopg 3 is
+# missing, and psycopg2 has no pool. A pool replaces persistent connections,
+# so CONN_MAX_AGE must be 0 with it.
+if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+            }
+        }
+    except ImportError:
+        # LOGGING isn't configured yet while settings load
+        warnings.warn('DB_POOL is enabled but psycopg 3 and psycopg_pool are not installed '
+                      '(pip install -r requirements-pool.txt); using persistent connections instead',
+                      RuntimeWarning)
+
+
+# Optional read replica for catalog, blog and ERP report traffic. Set
+# DB_REPLICA_HOST (or DB_REPLICA_NAME, e.g. a second SQLite file locally) to
+# enable it; everything else keeps using the primary.
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['setting.db_routing.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'setting.db_routing.ReplicaRoutingMiddleware',
+    )
+
+# Views (dotted paths or whole modules) whose GET reads may use the replica
+REPLICA_READ_VIEWS = [
+    'store.views.product_list',
+    'store.views.product_detail',
+    'cms_store.views',
+    'inventory_erp.views.dealer_report',
+    'inventory_erp.views.sales_report',
+    'inventory_erp.views.purchase_report',
+    'inventory_erp.views.inventory_report',
+    'inventory_erp.views.export_data',
+]
+
+# After a write, keep the browser on the primary for this many seconds
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', '10'))
+
+# Share of requests (0-1) whose queries, template and cache time are logged,
+# sent as Server-Timing and added to the staff request metrics; 0 disables it
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('REQUEST_INSTRUMENTATION_SAMPLE_RATE', '0'))
+# How often each process publishes its request histograms to the cache (seconds)
+REQUEST_INSTRUMENTATION_PUBLISH_SECONDS = int(os.getenv('REQUEST_INSTRUMENTATION_PUBLISH_SECONDS', '30'))
+
+# Where each process keeps its Prometheus metrics; shared by the gunicorn
+# workers. gunicorn.conf.py clears it when gunicorn starts; under any other
+# server the values of earlier runs stay in /metrics until it is cleared
+METRICS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'future-store-metrics'))
+# Bearer token Prometheus scrapes /metrics with; without one only staff can read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
+# How long the ERP dashboard KPI snapshot is cached (seconds)
+ERP_DASHBOARD_CACHE_SECONDS = int(os.getenv('ERP_DASHBOARD_CACHE_SECONDS', '30'))
+
+# Sales/purchase reports: longest allowed date range, and how long reports
+# over closed periods (ending before today) stay cached
+ERP_REPORT_MAX_DAYS = int(os.getenv('ERP_REPORT_MAX_DAYS', '731'))
+ERP_REPORT_CACHE_SECONDS = int(os.getenv('ERP_REPORT_CACHE_SECONDS', '86400'))
+
+# In-process Bloom filter that lets IMEI/serial scans skip the database for
+# identifiers that are definitely new. Each worker picks up rows registered
+# by other workers every REFRESH seconds and rebuilds fully every REBUILD.
+ERP_IDENTIFIER_BLOOM = os.getenv('ERP_IDENTIFIER_BLOOM', 'True').lower() == 'true'
+ERP_IDENTIFIER_BLOOM_REFRESH_SECONDS = int(os.getenv('ERP_IDENTIFIER_BLOOM_REFRESH_SECONDS', '5'))
+ERP_IDENTIFIER_BLOOM_REBUILD_SECONDS = int(os.getenv('ERP_IDENTIFIER_BLOOM_REBUILD_SECONDS', '3600'))
+
+# Inventory valuation costing method ('average' or 'fifo') and how long a
+# day's valuation stays cached when nothing changes
+ERP_VALUATION_METHOD = os.getenv('ERP_VALUATION_METHOD', 'average')
+ERP_VALUATION_CACHE_SECONDS = int(os.getenv('ERP_VALUATION_CACHE_SECONDS', '86400'))
+
+# Background jobs (PDF printouts). In production they are queued in the
+# database and run by `python manage.py db_worker`, which must run next to
+# the web processes. In development (DEBUG) and on Vercel, where no worker can
+# run, the immediate backend runs a job inside the request. TASKS_BACKEND
+# overrides either default.
+TASKS = {
+    'default': {
+        'BACKEND': os.getenv('TASKS_BACKEND', 'django_tasks.backends.immediate.ImmediateBackend'
+                             if DEBUG or VERCEL_DEPLOYMENT else 'django_tasks.backends.database.DatabaseBackend'),
+    }
+}
+if TASKS['default']['BACKEND'] == 'django_tasks.backends.database.DatabaseBackend':
+    INSTALLED_APPS.append('django_tasks.backends.database')
+
+# PDF printouts with at most this many table rows are rendered in the
+# request; longer ones are rendered in the background and the requester is
+# emailed when they are ready (not under the immediate backend, which
+# renders them in the request too)
+ERP_PDF_SYNC_MAX_ROWS = int(os.getenv('ERP_PDF_SYNC_MAX_ROWS', '500'))
+ERP_PDF_NOTIFY_EMAIL = os.getenv('ERP_PDF_NOTIFY_EMAIL', 'True').lower() == 'true'
 
 
 # Password validation
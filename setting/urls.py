@@ -21,6 +21,8 @@ from django.conf.urls.static import static
 from django.http import JsonResponse
 from django.views.defaults import page_not_found, server_error, permission_denied, bad_request
 from store.views import admin_dashboard
+from setting.instrumentation import request_metrics
+from setting.metrics import metrics_view
 
 # Import Wagtail URLs
 try:
@@ -61,6 +63,7 @@ def custom_400(request, exception=None):
 
 urlpatterns = [
     path('admin/dashboard/', admin_dashboard, name='admin_dashboard'),
+    path('admin/requests/', request_metrics, name='request_metrics'),
     path('admin/', admin.site.urls),  # Django admin (Unfold)
     
     # Keep your existing user auth and store URLs working
@@ -71,6 +74,7 @@ urlpatterns = [
     path('erp/', include('inventory_erp.urls')),  # Include inventory_erp app URLs
     path('social-auth/', include('social_django.urls', namespace='social')),
     path('debug/', debug_settings, name='debug_settings'),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape endpoint
 ]
 
 # Add Wagtail URLs if available (admin only)
@@ -0,0 +1,79 @@
+from statistics import mean, quantiles
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request database connection overhead with and without persistent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Number of simulated requests per scenario (default: 200)')
+        parser.add_argument('--database', default='default',
+                            help='Database alias to benchmark (default: default)')
+        parser.add_argument('--max-age', type=int, default=60,
+                            help='CONN_MAX_AGE used for the persistent scenario (default: 60)')
+
+    def simulate(self, alias, requests, max_age):
+        """Run `requests` request cycles issuing one query each, like a tiny view."""
+        connection = connections[alias]
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(connection)
+
+        connection_created.connect(count_connection)
+        timings = []
+        try:
+            for _ in range(requests):
+                start = perf_counter()
+                # request_started/finished drive close_old_connections(), exactly
+                # as Django's handler does around a real request.
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                request_finished.send(sender=self.__class__)
+                timings.append((perf_counter() - start) * 1000)
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+
+        cuts = quantiles(timings, n=20)
+        return {
+            'connections': len(opened),
+            'mean': mean(timings),
+            'p50': cuts[9],
+            'p95': cuts[18],
+        }
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        requests = max(options['requests'], 2)
+        vendor = connections[alias].vendor
+
+        self.stdout.write(f'Benchmarking {requests} requests against "{alias}" ({vendor})')
+        scenarios = [
+            ('CONN_MAX_AGE=0 (connect per request)', 0),
+            (f'CONN_MAX_AGE={options["max_age"]} (persistent)', options['max_age']),
+        ]
+        results = []
+        for label, max_age in scenarios:
+            result = self.simulate(alias, requests, max_age)
+            results.append(result)
+            self.stdout.write(
+                f'{label:<40} connections={result["connections"]:<5} '
+                f'mean={result["mean"]:.3f}ms p50={result["p50"]:.3f}ms p95={result["p95"]:.3f}ms'
+            )
+
+        saved = results[0]['mean'] - results[1]['mean']
+        self.stdout.write(self.style.SUCCESS(f'Persistent connections save {saved:.3f}ms per request on average'))
@@ -0,0 +1,143 @@
+import io
+import random
+from contextlib import ExitStack, redirect_stdout
+from statistics import mean, quantiles
+from time import perf_counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from store.models import Address, Cart, CartItem, Product, ProductColor
+from user_auth.models import User
+
+
+class Command(BaseCommand):
+    help = ('Time the hot store and ERP views through the full middleware stack and report query counts '
+            'and p50/p95 latency (run generate_load_data first for realistic volumes)')
+
+    # Each is also the method building its request
+    VIEWS = ('product_list', 'product_list_search', 'product_detail', 'place_order', 'admin_dashboard',
+             'erp_dashboard', 'sales_report', 'purchase_report', 'inventory_report', 'dealer_report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Timed requests per view (default: 50)')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='Untimed requests per view first, to fill caches (default: 3)')
+        parser.add_argument('--view', action='append', choices=sorted(self.VIEWS),
+                            help='Only these views (repeatable; default: all)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def setup(self):
+        self.rng = random.Random(self.seed)
+        self.customer, _ = User.objects.get_or_create(email='bench-customer@example.com')
+        self.staff, _ = User.objects.get_or_create(email='bench-staff@example.com', defaults={'is_staff': True})
+        self.address = Address.objects.filter(user=self.customer).first() or Address.objects.create(
+            user=self.customer, address_type='home', street_address='1 Bench Road', city='Lahore',
+            state='Punjab', postal_code='54000', is_default=True,
+        )
+        self.cart, _ = Cart.objects.get_or_create(user=self.customer)
+        self.slugs = list(Product.objects.filter(is_available=True).order_by('pk').values_list('slug', flat=True)[:500])
+        self.pages = max(Product.objects.filter(is_available=True).count() // 12, 1)
+        self.colors = list(ProductColor.objects.filter(
+            product__is_available=True, stock__gt=0
+        ).order_by('pk').values_list('pk', 'product_id')[:500])
+
+    # Each returns (client, method, url, data) for one request
+
+    def product_list(self):
+        return self.anonymous, 'get', reverse('product_list'), {'page': self.rng.randint(1, min(self.pages, 20))}
+
+    def product_list_search(self):
+        term = self.rng.choice(('samsung', 'phone', 'pro', 'black', 'charger'))
+        return self.anonymous, 'get', reverse('product_list'), {'search': term}
+
+    def product_detail(self):
+        if not self.slugs:
+            return None
+        return self.anonymous, 'get', reverse('product_detail', args=[self.rng.choice(self.slugs)]), {}
+
+    def place_order(self):
+        if not self.colors:
+            return None
+        color_id, product_id = self.rng.choice(self.colors)
+        CartItem.objects.create(cart=self.cart, product_id=product_id, color_id=color_id, quantity=1)
+        return self.customer_client, 'post', reverse('place_order'), {
+            'phone_number': '+923001234567', 'selected_address': self.address.pk,
+        }
+
+    def admin_dashboard(self):
+        return self.staff_client, 'get', reverse('admin_dashboard'), {'days': self.rng.choice((7, 30, 90))}
+
+    def erp_dashboard(self):
+        return self.staff_client, 'get', reverse('inventory_erp:dashboard'), {}
+
+    def sales_report(self):
+        return self.staff_client, 'get', reverse('inventory_erp:sales_report'), {}
+
+    def purchase_report(self):
+        return self.staff_client, 'get', reverse('inventory_erp:purchase_report'), {}
+
+    def inventory_report(self):
+        return self.staff_client, 'get', reverse('inventory_erp:inventory_report'), {}
+
+    def dealer_report(self):
+        return self.staff_client, 'get', reverse('inventory_erp:dealer_report'), {}
+
+    def measure(self, build):
+        """Time one request; writes are rolled back so every run sees the same data."""
+        with transaction.atomic():
+            request = build()
+            if request is None:
+                return None
+            client, method, url, data = request
+            # The query log is capped; start each request with an empty one
+            reset_queries()
+            with ExitStack() as stack:
+                queries = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                # Views such as place_order print progress; keep it out of the report
+                stack.enter_context(redirect_stdout(io.StringIO()))
+                started = perf_counter()
+                response = getattr(client, method)(url, data, secure=True)
+                elapsed = (perf_counter() - started) * 1000
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(f'{url} answered {response.status_code}')
+        return elapsed, sum(len(captured) for captured in queries)
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        requests = max(options['requests'], 2)
+        names = options['view'] or list(self.VIEWS)
+
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            self.setup()
+            self.anonymous = Client()
+            self.customer_client = Client()
+            self.customer_client.force_login(self.customer)
+            self.staff_client = Client()
+            self.staff_client.force_login(self.staff)
+
+            self.stdout.write(f'{requests} requests per view after {options["warmup"]} warm-up requests '
+                              f'({connections["default"].vendor}, {len(self.slugs)} sampled products)')
+            self.stdout.write(f'{"view":<22}{"queries":>10}{"mean":>12}{"p50":>12}{"p95":>12}{"max":>12}')
+            for name in names:
+                build = getattr(self, name)
+                for _ in range(options['warmup']):
+                    self.measure(build)
+                results = [self.measure(build) for _ in range(requests)]
+                if results[0] is None:
+                    self.stdout.write(f'{name:<22}skipped: no data')
+                    continue
+                timings = [elapsed for elapsed, _ in results]
+                counts = sorted(count for _, count in results)
+                query_range = str(counts[0]) if counts[0] == counts[-1] else f'{counts[0]}-{counts[-1]}'
+                cuts = quantiles(timings, n=20, method='inclusive')
+                self.stdout.write(
+                    f'{name:<22}{query_range:>10}{mean(timings):>10.1f}ms{cuts[9]:>10.1f}ms'
+                    f'{cuts[18]:>10.1f}ms{max(timings):>10.1f}ms'
+                )
+        self.stdout.write(self.style.SUCCESS('Done'))
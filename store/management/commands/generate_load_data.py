@@ -0,0 +1,457 @@
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from time import perf_counter
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from inventory_erp import models as erp
+from inventory_erp.reports import invalidate_reports
+from inventory_erp.search import rebuild_index
+from inventory_erp.stock import reconcile_stock
+from inventory_erp.valuation import invalidate_valuation
+from store.models import (
+    Address, Category, Company, Order, OrderItem, Product, ProductColor, ProductImage, Review,
+)
+from user_auth.models import User
+
+CATEGORIES = ['Smartphones', 'Tablets', 'Laptops', 'Smartwatches', 'Earbuds', 'Chargers', 'Cases', 'Power Banks']
+BRANDS = ['Samsung', 'Apple', 'Xiaomi', 'Oppo', 'Vivo', 'Realme', 'Infinix', 'Tecno', 'Huawei', 'OnePlus',
+          'Nokia', 'Motorola', 'Google', 'Sony', 'Lenovo', 'Anker', 'Baseus', 'Honor']
+COLORS = [('Black', '#000000'), ('White', '#FFFFFF'), ('Blue', '#1E40AF'), ('Green', '#15803D'),
+          ('Silver', '#C0C0C0'), ('Gold', '#D4AF37'), ('Purple', '#7E22CE'), ('Red', '#B91C1C')]
+CITIES = [('Karachi', 'Sindh'), ('Lahore', 'Punjab'), ('Islamabad', 'Islamabad'), ('Faisalabad', 'Punjab'),
+          ('Rawalpindi', 'Punjab'), ('Multan', 'Punjab'), ('Bahawalpur', 'Punjab'), ('Peshawar', 'KPK'),
+          ('Quetta', 'Balochistan'), ('Hyderabad', 'Sindh')]
+ORDER_STATUSES = (('delivered', 70), ('shipped', 8), ('processing', 6), ('pending', 8), ('cancelled', 6),
+                  ('returned', 2))
+# Line items per order and units per line
+ITEMS_PER_ORDER = ((1, 62), (2, 24), (3, 9), (4, 5))
+QUANTITIES = ((1, 85), (2, 12), (3, 3))
+HISTORY_DAYS = 2 * 365
+
+
+class Zipf:
+    """Draws indexes 0..n-1 with weight 1 / (rank + 1) ** s: a few best sellers, a long tail."""
+
+    def __init__(self, rng, n, s=1.1):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def __call__(self):
+        return bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values it is given."""
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Generate store and ERP load-test data with bulk inserts: products, customers, orders, reviews, '
+            'devices, purchases, sales, device identifiers and dealer ledgers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Store products (default: 1000)')
+        parser.add_argument('--customers', type=int, default=None,
+                            help='Customer accounts (default: a fifth of --orders)')
+        parser.add_argument('--orders', type=int, default=10000, help='Store orders (default: 10000)')
+        parser.add_argument('--reviews', type=int, default=None, help='Product reviews (default: 2 per product)')
+        parser.add_argument('--devices', type=int, default=None, help='ERP devices (default: --products / 2)')
+        parser.add_argument('--dealers', type=int, default=100, help='ERP dealers (default: 100)')
+        parser.add_argument('--identifiers', type=int, default=50000,
+                            help='IMEI/serial numbers received through purchases; about 60%% are sold '
+                                 '(default: 50000)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable data (default: 42)')
+        parser.add_argument('--prefix', default='load',
+                            help='Marks the generated slugs, SKUs, invoices and emails; use a new one to '
+                                 'add more data to a database that already has a run (default: load)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix'].lower()
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+        if Product.objects.filter(slug__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Data with prefix "{self.prefix}" already exists; pass another --prefix')
+
+        orders = options['orders']
+        customers = options['customers'] if options['customers'] is not None else max(orders // 5, 1)
+        reviews = options['reviews'] if options['reviews'] is not None else options['products'] * 2
+        devices = options['devices'] if options['devices'] is not None else max(options['products'] // 2, 1)
+
+        steps = [
+            ('catalogue', lambda: self.catalogue(options['products'])),
+            ('customers', lambda: self.customers(customers)),
+            ('orders', lambda: self.orders(orders)),
+            ('reviews', lambda: self.reviews(reviews)),
+            ('erp catalogue', lambda: self.erp_catalogue(devices, options['dealers'])),
+            ('purchases and sales', lambda: self.purchases_and_sales(options['identifiers'])),
+            ('derived data', self.derived),
+        ]
+        with explicit_timestamps(Product, ProductColor, ProductImage, User, Address, Order, OrderItem, Review,
+                                 erp.Device, erp.Purchase, erp.DeviceIdentifier, erp.Sale, erp.Ledger):
+            for name, step in steps:
+                started = perf_counter()
+                with transaction.atomic():
+                    summary = step()
+                self.stdout.write(f'{name}: {summary} ({perf_counter() - started:.1f}s)')
+        self.stdout.write(self.style.SUCCESS(f'Generated load data with prefix "{self.prefix}"'))
+
+    def moment(self, days_ago):
+        return self.now - timedelta(days=days_ago, seconds=self.rng.randint(0, 86399))
+
+    def recent(self):
+        """Days ago, weighted towards the present as a growing shop's history is."""
+        return int(self.rng.triangular(0, HISTORY_DAYS, 0))
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return objects
+
+    def chunks(self, count, size=None):
+        size = size or self.batch_size
+        for offset in range(0, count, size):
+            yield range(offset, min(offset + size, count))
+
+    # Store
+
+    def catalogue(self, count):
+        rng = self.rng
+        categories = []
+        for name in CATEGORIES:
+            slug = f'{self.prefix}-{name.lower().replace(" ", "-")}'
+            categories.append(Category(name=name, slug=slug, description=f'{name} load-test category'))
+        self.bulk(Category, categories)
+        companies = self.bulk(Company, [
+            Company(category=category, name=brand, slug=f'{category.slug}-{brand.lower()}',
+                    is_featured=rng.random() < 0.2)
+            for category in categories for brand in rng.sample(BRANDS, 6)
+        ])
+        # Phones dominate the catalogue; accessories follow
+        category_weights = [30, 10, 8, 6, 8, 12, 18, 8]
+        by_category = {category.pk: [company for company in companies if company.category_id == category.pk]
+                       for category in categories}
+
+        colors = 0
+        for numbers in self.chunks(count):
+            products = []
+            for n in numbers:
+                category = rng.choices(categories, category_weights)[0]
+                company = rng.choice(by_category[category.pk])
+                # Log-normal prices: most items are cheap, a few cost a lot
+                price = Decimal(min(round(rng.lognormvariate(10.3, 1.0), -1), 999999)).quantize(Decimal('0.01'))
+                discount = rng.random() < 0.2
+                created = self.moment(rng.randint(0, HISTORY_DAYS))
+                products.append(Product(
+                    category=category, company=company, name=f'{company.name} {category.name[:-1]} {n}',
+                    slug=f'{self.prefix}-product-{n}', description=f'{company.name} {category.name} model {n}. ' * 8,
+                    price=price, discount_type='percentage' if discount else 'none',
+                    discount_value=Decimal(rng.choice((5, 10, 15, 20))) if discount else Decimal('0'),
+                    is_available=rng.random() < 0.95, is_featured=rng.random() < 0.02,
+                    specs={'ram': f'{rng.choice((2, 4, 6, 8, 12))} GB', 'storage': f'{rng.choice((32, 64, 128, 256))} GB'},
+                    features={'device': f'{company.name} {n}', 'features': ['Fast charging', 'Dual SIM']},
+                    created_at=created, updated_at=created,
+                ))
+            self.bulk(Product, products)
+
+            product_colors = []
+            for product in products:
+                for index, (name, hex_code) in enumerate(rng.sample(COLORS, weighted(rng, ((1, 30), (2, 40), (3, 20), (4, 10))))):
+                    # One color in ten is sold out; the rest hold a few units
+                    stock = 0 if rng.random() < 0.1 else int(rng.expovariate(1 / 15)) + 1
+                    product_colors.append(ProductColor(
+                        product=product, name=name, hex_code=hex_code, is_primary=index == 0, stock=stock,
+                        created_at=product.created_at, updated_at=product.created_at,
+                    ))
+            self.bulk(ProductColor, product_colors)
+            self.bulk(ProductImage, [
+                ProductImage(product_id=color.product_id, color=color, is_primary=True,
+                             image_url=f'https://picsum.photos/seed/{self.prefix}-{color.product_id}-{color.name}/600',
+                             alt_text=color.name, created_at=color.created_at, updated_at=color.created_at)
+                for color in product_colors
+            ])
+            colors += len(product_colors)
+
+        # Popularity: the Zipf rank of a product is its position in this list
+        self.colors = list(ProductColor.objects.filter(product__slug__startswith=f'{self.prefix}-').values_list(
+            'pk', 'product_id', 'product__price'
+        ))
+        rng.shuffle(self.colors)
+        return f'{len(categories)} categories, {len(companies)} companies, {count} products, {colors} colors'
+
+    def customers(self, count):
+        rng = self.rng
+        # Hashing is deliberately slow: every customer shares one hash
+        password = make_password(f'{self.prefix}-Str0ngPass!')
+        for numbers in self.chunks(count):
+            users = []
+            for n in numbers:
+                joined = self.moment(rng.randint(0, HISTORY_DAYS))
+                users.append(User(
+                    email=f'{self.prefix}-customer-{n}@example.com', password=password,
+                    first_name='Customer', last_name=str(n), phone_number=f'+92300{n % 10 ** 7:07d}',
+                    date_joined=joined,
+                ))
+            self.bulk(User, users)
+            addresses = []
+            for user in users:
+                city, state = rng.choice(CITIES)
+                addresses.append(Address(
+                    user=user, address_type=weighted(rng, (('home', 80), ('office', 15), ('other', 5))),
+                    street_address=f'House {rng.randint(1, 999)}, Street {rng.randint(1, 60)}', city=city,
+                    state=state, postal_code=f'{rng.randint(10000, 99999)}', is_default=True,
+                    created_at=user.date_joined, updated_at=user.date_joined,
+                ))
+            self.bulk(Address, addresses)
+        self.addresses = list(Address.objects.filter(
+            user__email__startswith=f'{self.prefix}-customer-'
+        ).values_list('pk', 'user_id'))
+        rng.shuffle(self.addresses)
+        return f'{count} customers'
+
+    def orders(self, count):
+        rng = self.rng
+        if not self.colors or not self.addresses:
+            return 'skipped: no products or customers'
+        pick_color = Zipf(rng, len(self.colors))
+        # Some customers come back again and again
+        pick_customer = Zipf(rng, len(self.addresses), s=0.6)
+        items = 0
+        for numbers in self.chunks(count, max(self.batch_size // 3, 1)):
+            orders, lines = [], []
+            for _ in numbers:
+                address_id, user_id = self.addresses[pick_customer()]
+                created = self.moment(self.recent())
+                status = weighted(rng, ORDER_STATUSES)
+                order_lines = []
+                for _ in range(weighted(rng, ITEMS_PER_ORDER)):
+                    color_id, product_id, price = self.colors[pick_color()]
+                    order_lines.append((product_id, color_id, weighted(rng, QUANTITIES), price))
+                orders.append(Order(
+                    user_id=user_id, address_id=address_id, status=status,
+                    total_amount=sum(quantity * price for _, _, quantity, price in order_lines),
+                    payment_method=weighted(rng, (('cash_on_delivery', 60), ('bank_transfer', 25),
+                                                  ('online_payment', 10), ('pending', 5))),
+                    payment_status='paid' if status == 'delivered' else 'pending',
+                    actual_delivery_date=created + timedelta(days=rng.randint(1, 6)) if status == 'delivered' else None,
+                    created_at=created, updated_at=created,
+                ))
+                lines.append(order_lines)
+            self.bulk(Order, orders)
+            order_items = [
+                OrderItem(order=order, product_id=product_id, color_id=color_id, quantity=quantity, price=price,
+                          created_at=order.created_at, updated_at=order.created_at)
+                for order, order_lines in zip(orders, lines)
+                for product_id, color_id, quantity, price in order_lines
+            ]
+            self.bulk(OrderItem, order_items)
+            items += len(order_items)
+        return f'{count} orders, {items} items'
+
+    def reviews(self, count):
+        rng = self.rng
+        if not self.colors or not self.addresses:
+            return 'skipped: no products or customers'
+        pick_color = Zipf(rng, len(self.colors))
+        seen = set()
+        reviews = []
+        # (product, user) is unique; give up on pairs after a bounded number of draws
+        for _ in range(count * 3):
+            if len(seen) == count:
+                break
+            product_id = self.colors[pick_color()][1]
+            user_id = rng.choice(self.addresses)[1]
+            if (product_id, user_id) in seen:
+                continue
+            seen.add((product_id, user_id))
+            created = self.moment(self.recent())
+            reviews.append(Review(
+                product_id=product_id, user_id=user_id,
+                rating=weighted(rng, ((5, 45), (4, 30), (3, 12), (2, 6), (1, 7))),
+                comment='Load-test review. ' * rng.randint(1, 6), created_at=created, updated_at=created,
+            ))
+        self.bulk(Review, reviews)
+        return f'{len(reviews)} reviews'
+
+    # ERP
+
+    def erp_catalogue(self, devices, dealers):
+        rng = self.rng
+        tag = self.prefix.upper()
+        self.staff = User.objects.create_user(email=f'{self.prefix}-staff@example.com', password=None, is_staff=True)
+        companies = self.bulk(erp.Company, [
+            erp.Company(name=f'{brand} ({tag})', contact_person=f'{brand} Pakistan', phone=f'021{n:08d}')
+            for n, brand in enumerate(BRANDS)
+        ])
+        device_rows = []
+        for n in range(devices):
+            company = companies[n % len(companies)]
+            created = self.moment(rng.randint(0, HISTORY_DAYS))
+            device_rows.append(erp.Device(
+                name=f'{company.name.split(" (")[0]} Model {n}', sku=f'{tag}-{n:08d}', company=company,
+                price=Decimal(rng.randint(15, 400) * 1000), created_at=created, updated_at=created,
+            ))
+        self.devices = self.bulk(erp.Device, device_rows)
+        self.dealers = self.bulk(erp.Dealer, [
+            erp.Dealer(
+                name=f'{rng.choice(("Al", "New", "City", "Star", "Royal"))} Mobile {tag} {n}',
+                dealer_type='main' if n % 5 == 0 else 'sub', contact_person=f'Dealer Contact {n}',
+                phone=f'0321{n:07d}', email=f'{self.prefix}-dealer-{n}@example.com',
+                address=', '.join(rng.choice(CITIES)), credit_limit=Decimal(rng.choice((0, 500000, 2000000))),
+            )
+            for n in range(dealers)
+        ])
+        return f'{len(companies)} companies, {devices} devices, {dealers} dealers'
+
+    def purchases_and_sales(self, identifiers):
+        """
+        Purchases of a few devices each register the identifiers; most units
+        are later sold, singly or two or three to an invoice, and every
+        purchase credits its dealer's ledger, which is mostly paid down.
+        """
+        rng = self.rng
+        if not self.devices or not self.dealers:
+            return 'skipped: no devices or dealers'
+        tag = self.prefix.upper()
+        pick_device = Zipf(rng, len(self.devices))
+        pick_dealer = Zipf(rng, len(self.dealers), s=0.8)
+        totals = dict.fromkeys(('purchases', 'identifiers', 'units', 'sales', 'ledger'), 0)
+
+        while totals['identifiers'] < identifiers:
+            purchases, purchase_lines = [], []
+            while len(purchases) < max(self.batch_size // 20, 1) and totals['identifiers'] < identifiers:
+                lines = []
+                for _ in range(weighted(rng, ((1, 50), (2, 30), (3, 20)))):
+                    device = self.devices[pick_device()]
+                    quantity = min(weighted(rng, ((1, 30), (5, 30), (10, 25), (20, 15))),
+                                   identifiers - totals['identifiers'])
+                    if quantity:
+                        unit_price = (device.price * Decimal(rng.uniform(0.8, 0.92))).quantize(Decimal('1'))
+                        lines.append((device, quantity, unit_price))
+                        totals['identifiers'] += quantity
+                days_ago = self.recent()
+                total = sum(quantity * unit_price for _, quantity, unit_price in lines)
+                purchases.append(erp.Purchase(
+                    dealer=self.dealers[pick_dealer()], purchase_date=self.today - timedelta(days=days_ago),
+                    dealer_invoice_number=f'{tag}-DI-{totals["purchases"] + len(purchases):09d}',
+                    purchase_type='new', total_amount=total, status='received',
+                    paid_amount=total if rng.random() < 0.6 else (total * Decimal(rng.random())).quantize(Decimal('1')),
+                    created_at=self.moment(days_ago), updated_at=self.now,
+                ))
+                purchase_lines.append(lines)
+            self.bulk(erp.Purchase, purchases)
+            self.bulk(erp.PurchaseItem, [
+                erp.PurchaseItem(purchase=purchase, device=device, quantity=quantity, unit_price=unit_price,
+                                 received_quantity=quantity)
+                for purchase, lines in zip(purchases, purchase_lines)
+                for device, quantity, unit_price in lines
+            ])
+
+            # Units, and the sales that took the sold ones
+            units, sales, sale_units = [], [], []
+            for purchase, lines in zip(purchases, purchase_lines):
+                for device, quantity, unit_price in lines:
+                    for _ in range(quantity):
+                        number = totals['units'] + len(units)
+                        units.append([device, purchase, unit_price, None, f'{tag}{number:012d}'])
+            rng.shuffle(units)
+            sold = int(len(units) * 0.6)
+            index = 0
+            while index < sold:
+                group = units[index:index + weighted(rng, ((1, 80), (2, 15), (3, 5)))]
+                index += len(group)
+                purchase_date = max(unit[1].purchase_date for unit in group)
+                sale_date = min(purchase_date + timedelta(days=int(rng.expovariate(1 / 20))), self.today)
+                amount = sum((unit[0].price or unit[2]) for unit in group)
+                wholesale = len(group) > 1 and rng.random() < 0.5
+                sales.append(erp.Sale(
+                    customer_name=f'Walk-in Customer {rng.randint(1, 10 ** 6)}',
+                    customer_phone=f'03{rng.randint(0, 10 ** 9 - 1):09d}', sale_type='wholesale' if wholesale else 'retail',
+                    sub_dealer=rng.choice(self.dealers) if wholesale else None, sale_date=sale_date,
+                    invoice_number=f'{tag}-INV-{totals["sales"] + len(sales):09d}', total_amount=amount,
+                    final_amount=amount, received_amount=amount, payment_status='paid',
+                    status=weighted(rng, (('completed', 94), ('pending', 4), ('cancelled', 2))),
+                    created_by=self.staff,
+                    created_at=timezone.make_aware(datetime.combine(sale_date, time(12))), updated_at=self.now,
+                ))
+                sale_units.append(group)
+            self.bulk(erp.Sale, sales)
+            for sale, group in zip(sales, sale_units):
+                for unit in group:
+                    unit[3] = sale
+
+            identifier_rows = [
+                erp.DeviceIdentifier(
+                    device=device, identifier_type='imei' if device.pk % 4 else 'serial', identifier_value=value,
+                    status='sold' if sale else 'in_stock', purchase=purchase, sale=sale,
+                    created_at=purchase.created_at, updated_at=purchase.created_at,
+                )
+                for device, purchase, _, sale, value in units
+            ]
+            self.bulk(erp.DeviceIdentifier, identifier_rows)
+            self.bulk(erp.SaleItem, [
+                erp.SaleItem(sale=identifier.sale, device=identifier.device, device_identifier=identifier,
+                             unit_price=identifier.device.price or 0, total_price=identifier.device.price or 0)
+                for identifier in identifier_rows if identifier.sale
+            ])
+
+            ledger = []
+            for purchase in purchases:
+                ledger.append(erp.Ledger(
+                    dealer=purchase.dealer, purchase=purchase, transaction_date=purchase.purchase_date,
+                    amount=purchase.total_amount, payment_type='credit', created_by=self.staff,
+                    notes=f'Purchase {purchase.dealer_invoice_number}', created_at=purchase.created_at,
+                ))
+                if purchase.paid_amount:
+                    paid_on = min(purchase.purchase_date + timedelta(days=rng.randint(0, 45)), self.today)
+                    ledger.append(erp.Ledger(
+                        dealer=purchase.dealer, transaction_date=paid_on, amount=purchase.paid_amount,
+                        payment_type='net', created_by=self.staff, notes='Payment',
+                        created_at=timezone.make_aware(datetime.combine(paid_on, time(12))),
+                    ))
+            self.bulk(erp.Ledger, ledger)
+
+            totals['purchases'] += len(purchases)
+            totals['units'] += len(units)
+            totals['sales'] += len(sales)
+            totals['ledger'] += len(ledger)
+        return (f'{totals["purchases"]} purchases, {totals["identifiers"]} identifiers, '
+                f'{totals["sales"]} sales, {totals["ledger"]} ledger entries')
+
+    def derived(self):
+        """What the save() overrides and signals skipped by bulk_create would have kept up to date."""
+        fixed = erp.Ledger.objects.filter(dealer__in=self.dealers).rebuild_balances(self.batch_size)
+        drifted = 0
+        for numbers in self.chunks(len(self.devices)):
+            drift, _ = reconcile_stock([self.devices[n].pk for n in numbers], include_untracked=True,
+                                       batch_size=self.batch_size)
+            drifted += len(drift)
+        indexed = rebuild_index(batch_size=self.batch_size)
+        # The report and valuation caches know nothing of the new rows
+        invalidate_reports('sales')
+        invalidate_reports('purchases')
+        transaction.on_commit(invalidate_valuation)
+        return (f'{fixed} ledger balances, {drifted} device stocks, '
+                f'{sum(indexed.values())} records indexed for search')
@@ -4,6 +4,7 @@ from user_auth.models import User
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
+from setting.metrics import EMAIL_FAILURES, EMAIL_SEND_SECONDS
 import os
 
 class Category(models.Model):
@@ -112,6 +113,20 @@ class ProductImage(models.Model):
             return self.image.url
         return self.image_url
 
+class ProductQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Everything a product card shows, for a whole page of products in a
+        fixed number of queries: company, colors, images and the average
+        rating (a subquery, so the paginator's COUNT needs no GROUP BY).
+        """
+        ratings = Review.objects.filter(product=models.OuterRef('pk')).values('product').annotate(
+            average=models.Avg('rating')
+        ).values('average')
+        return self.select_related('company').prefetch_related('colors', 'images').annotate(
+            avg_rating=models.Subquery(ratings, output_field=models.FloatField())
+        )
+
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='products', null=True)
@@ -129,11 +144,20 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def _prefetched(self, name):
+        """The related objects if the queryset prefetched them, else None."""
+        cached = getattr(self, '_prefetched_objects_cache', {}).get(name)
+        return None if cached is None else sorted(cached, key=lambda related: related.pk)
+
     @property
     def average_rating(self):
+        if hasattr(self, 'avg_rating'):
+            return self.avg_rating or 0
         reviews = self.reviews.all()
         if reviews:
             return sum(review.rating for review in reviews) / len(reviews)
@@ -141,6 +165,10 @@ class Product(models.Model):
 
     @property
     def primary_image(self):
+        images = self._prefetched('images')
+        if images is not None:
+            primary = next((image for image in images if image.is_primary), images[0] if images else None)
+            return primary.get_image_url if primary else None
         primary = self.images.filter(is_primary=True).first()
         if primary:
             return primary.get_image_url
@@ -166,6 +194,9 @@ class Product(models.Model):
 
     @property
     def primary_color(self):
+        colors = self._prefetched('colors')
+        if colors is not None:
+            return next((color for color in colors if color.is_primary), None)
         return self.colors.filter(is_primary=True).first()
 
     @property
@@ -176,6 +207,9 @@ class Product(models.Model):
     @property
     def is_in_stock(self):
         """Check if any color has stock"""
+        colors = self._prefetched('colors')
+        if colors is not None:
+            return any(color.stock > 0 for color in colors)
         return self.colors.filter(stock__gt=0).exists()
 
     @property
@@ -282,6 +316,7 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.notification_type} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
+    @EMAIL_SEND_SECONDS.time()
     def send_email_notification(self):
         """Send email notification to user"""
         try:
@@ -331,6 +366,7 @@ class Notification(models.Model):
             return True
         except Exception as e:
             print(f"❌ Failed to send email notification: {e}")
+            EMAIL_FAILURES.inc()
             import traceback
             traceback.print_exc()
             return False
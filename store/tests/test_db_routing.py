@@ -0,0 +1,145 @@
+import tempfile
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from setting.db_routing import PIN_COOKIE_NAME, REPLICA_ALIAS, ReplicaRouter, ReplicaRoutingMiddleware
+from store import views
+from store.models import Category, Order, Product
+from user_auth.models import User
+
+
+def report_view(request):
+    return HttpResponse()
+
+
+@override_settings(REPLICA_READ_VIEWS=['store.views.product_list', 'store.tests.test_db_routing'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def run_request(self, request, view, action=None):
+        """Run a request through the middleware, recording routing decisions."""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if action:
+                action()
+            seen['read'] = self.router.db_for_read(Product)
+            seen['session_read'] = self.router.db_for_read(Session)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return seen, response
+
+    def test_listed_view_reads_from_replica(self):
+        seen, response = self.run_request(self.factory.get('/store/'), views.product_list)
+        self.assertEqual(seen['read'], 'replica')
+        self.assertIsNone(seen['session_read'])
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_module_prefix_matches(self):
+        seen, _ = self.run_request(self.factory.get('/report/'), report_view)
+        self.assertEqual(seen['read'], 'replica')
+
+    def test_unlisted_view_uses_primary(self):
+        seen, _ = self.run_request(self.factory.get('/store/cart/'), views.cart_detail)
+        self.assertIsNone(seen['read'])
+
+    def test_write_switches_to_primary_and_pins(self):
+        seen, response = self.run_request(
+            self.factory.get('/store/'), views.product_list,
+            action=lambda: self.router.db_for_write(Order)
+        )
+        self.assertIsNone(seen['read'])
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_post_pins_browser_to_primary(self):
+        _, response = self.run_request(self.factory.post('/store/place-order/'), views.place_order)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_pinned_request_reads_from_primary(self):
+        request = self.factory.get('/store/')
+        request.COOKIES[PIN_COOKIE_NAME] = str(int(time.time()) + 10)
+        seen, _ = self.run_request(request, views.product_list)
+        self.assertIsNone(seen['read'])
+
+    def test_router_outside_requests_uses_primary(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'store'))
+
+
+ROUTING_MIDDLEWARE = list(settings.MIDDLEWARE)
+ROUTING_MIDDLEWARE.insert(
+    ROUTING_MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+    'setting.db_routing.ReplicaRoutingMiddleware',
+)
+
+
+@override_settings(DATABASE_ROUTERS=['setting.db_routing.ReplicaRouter'], MIDDLEWARE=ROUTING_MIDDLEWARE)
+class ReplicaConnectionTest(TransactionTestCase):
+    """Routing through real requests, with the replica as a second connection to the test database."""
+
+    @classmethod
+    def setUpClass(cls):
+        # connections reads DATABASES only once, so overriding the setting
+        # wouldn't open a second connection; the alias is registered with it
+        # directly. It is added to `databases` here rather than in the class
+        # body, where the test runner would try to create a database for it.
+        cls.databases = {'default', REPLICA_ALIAS}
+        connections.settings[REPLICA_ALIAS] = dict(connections['default'].settings_dict)
+        cls.addClassCleanup(connections.settings.pop, REPLICA_ALIAS)
+        cls.addClassCleanup(connections.__delitem__, REPLICA_ALIAS)
+        cls.addClassCleanup(connections[REPLICA_ALIAS].close)
+        super().setUpClass()
+
+    def setUp(self):
+        self.enterContext(override_settings(METRICS_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        category = Category.objects.create(name='Phones', slug='phones')
+        Product.objects.create(category=category, name='Galaxy', slug='galaxy', description='A phone',
+                               price=Decimal('1000.00'))
+
+    def get(self, url, **params):
+        """Response and the SQL each alias ran for one request."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            response = self.client.get(url, params)
+        return response, [query['sql'] for query in primary], [query['sql'] for query in replica]
+
+    def test_catalog_reads_run_on_the_replica(self):
+        response, primary, replica = self.get(reverse('product_list'))
+        self.assertContains(response, 'Galaxy')
+        self.assertTrue(any(Product._meta.db_table in sql for sql in replica))
+        self.assertFalse(any(Product._meta.db_table in sql for sql in primary))
+
+    def test_write_pins_the_browser_to_the_primary(self):
+        response = self.client.post(reverse('product_list'))
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+        response, primary, replica = self.get(reverse('product_list'))
+        self.assertContains(response, 'Galaxy')
+        self.assertTrue(any(Product._meta.db_table in sql for sql in primary))
+        self.assertEqual(replica, [])
+
+    def test_decorated_report_view_is_matched(self):
+        staff = User.objects.create_user(email='staff@example.com', password='Str0ngPass!23', is_staff=True)
+        self.client.force_login(staff)
+        # Logging in wrote the session; a later browser visit is no longer pinned
+        self.client.cookies.pop(PIN_COOKIE_NAME, None)
+
+        response, primary, replica = self.get(reverse('inventory_erp:sales_report'),
+                                              start_date='2025-01-01', end_date='2025-01-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('inventory_erp_sale' in sql for sql in replica))
+        self.assertFalse(any('inventory_erp_sale' in sql for sql in primary))
+        # Sessions always come from the primary
+        self.assertTrue(any(Session._meta.db_table in sql for sql in primary))
@@ -0,0 +1,92 @@
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from setting import instrumentation
+from setting.instrumentation import RequestInstrumentationMiddleware, collect
+from store.models import Category, Company, Product
+from user_auth.models import User
+
+
+@override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1.0)
+class RequestInstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        company = Company.objects.create(category=category, name='Samsung', slug='samsung')
+        Product.objects.create(category=category, company=company, name='Galaxy', slug='galaxy',
+                               description='A phone', price=Decimal('1000.00'))
+        cls.staff = User.objects.create_user(email='staff@example.com', password='Str0ngPass!23', is_staff=True)
+
+    def setUp(self):
+        instrumentation.histograms.reset()
+        cache.clear()
+
+    def test_sampled_request_is_logged_and_timed(self):
+        with self.assertLogs('setting.instrumentation', 'INFO') as logs:
+            response = Client().get(reverse('product_list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'product_list')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertGreater(line['template_ms'], 0)
+        self.assertEqual(instrumentation.histograms.snapshot()['product_list']['count'], 1)
+
+    def test_duplicate_queries_name_their_call_site(self):
+        with collect() as stats:
+            for _ in range(3):
+                list(Product.objects.filter(slug='galaxy'))
+
+        duplicate, = stats.duplicates()
+        self.assertEqual(duplicate['count'], 3)
+        self.assertIn('store/tests/test_instrumentation.py', duplicate['call_site'])
+        self.assertIn('test_duplicate_queries_name_their_call_site', duplicate['call_site'])
+
+    def test_cache_lookups_are_counted(self):
+        RequestInstrumentationMiddleware(lambda request: HttpResponse())
+        cache.set('present', 1)
+        with collect() as stats:
+            cache.get('present')
+            cache.get('absent')
+            cache.get_many(['present', 'absent'])
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (2, 2))
+
+    def test_staff_page_lists_sampled_views(self):
+        with self.assertLogs('setting.instrumentation', 'INFO'):
+            Client().get(reverse('product_list'))
+        client = Client()
+        client.force_login(self.staff)
+        with self.assertLogs('setting.instrumentation', 'INFO'):
+            response = client.get(reverse('request_metrics'))
+
+        self.assertContains(response, 'product_list')
+        view, = [row for row in response.context['rows'] if row['view'] == 'product_list']
+        self.assertEqual(view['count'], 1)
+
+    def test_staff_page_requires_staff(self):
+        with self.assertLogs('setting.instrumentation', 'INFO'):
+            response = Client().get(reverse('request_metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_sampling_off_adds_nothing(self):
+        response = Client().get(reverse('product_list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(instrumentation.histograms.snapshot(), {})
+
+    def test_snapshots_of_other_processes_are_merged(self):
+        middleware = RequestInstrumentationMiddleware(lambda request: HttpResponse())
+        with self.assertLogs('setting.instrumentation', 'INFO'):
+            middleware(RequestFactory().get('/'))
+        other = instrumentation.histograms.snapshot()
+        cache.set(instrumentation.SNAPSHOT_KEY.format('other:1'), other)
+        cache.set(instrumentation.PROCESSES_KEY, ['other:1'])
+
+        merged, processes = instrumentation.merged_snapshots()
+        self.assertEqual(processes, 2)
+        self.assertEqual(merged['unresolved']['count'], 2)
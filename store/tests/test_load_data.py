@@ -0,0 +1,53 @@
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from inventory_erp.models import Dealer, Device, DeviceIdentifier, Ledger, Sale
+from store.models import Order, OrderItem, Product
+
+
+class GenerateLoadDataTest(TestCase):
+    def generate(self, **options):
+        options = {'products': 40, 'orders': 60, 'identifiers': 150, 'dealers': 5, 'batch_size': 25, **options}
+        call_command('generate_load_data', stdout=StringIO(), **options)
+
+    def test_generates_consistent_data(self):
+        self.generate()
+
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Order.objects.count(), 60)
+        for order in Order.objects.prefetch_related('items')[:10]:
+            self.assertEqual(order.total_amount, order.get_total)
+        self.assertEqual(DeviceIdentifier.objects.count(), 150)
+        sold = DeviceIdentifier.objects.filter(status='sold')
+        self.assertEqual(sold.filter(sale__isnull=True).count(), 0)
+        self.assertEqual(Sale.objects.filter(items__isnull=True).count(), 0)
+        # What save() and the signals would have maintained
+        for device in Device.objects.all():
+            self.assertEqual(device.stock, device.identifiers.filter(status='in_stock').count())
+        self.assertEqual(Ledger.objects.filter(dealer__in=Dealer.objects.all()).rebuild_balances(), 0)
+
+    def test_same_prefix_refused(self):
+        self.generate(orders=0, identifiers=0)
+        with self.assertRaises(CommandError):
+            self.generate(orders=0, identifiers=0)
+
+
+class BenchViewsTest(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(METRICS_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def test_reports_each_view(self):
+        call_command('generate_load_data', products=30, orders=20, identifiers=40, dealers=3, stdout=StringIO())
+        out = StringIO()
+
+        call_command('bench_views', requests=2, warmup=0, view=['product_detail', 'place_order', 'sales_report'],
+                     stdout=out)
+
+        lines = out.getvalue().splitlines()
+        for name in ('product_detail', 'place_order', 'sales_report'):
+            self.assertTrue(any(line.startswith(name) and 'ms' in line for line in lines), name)
+        # Orders placed while benchmarking are rolled back
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(OrderItem.objects.filter(order__user__email='bench-customer@example.com').count(), 0)
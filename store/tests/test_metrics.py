@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from setting import metrics
+from setting.metrics import Counter, Gauge, Histogram, clear_metrics_dir, exposition, read_values
+from store.models import Address, Cart, CartItem, Category, Notification, Order, Product, ProductColor
+from user_auth.models import User
+
+
+class MetricsDirMixin:
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='scrape-token')
+        override.enable()
+        self.addCleanup(override.disable)
+        registry = mock.patch.dict(metrics.REGISTRY)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def value(self, name, suffix='', labels=()):
+        return read_values().get((name, suffix, tuple(labels)), 0)
+
+
+class RegistryTest(MetricsDirMixin, SimpleTestCase):
+    def test_exposition_format(self):
+        metrics.REGISTRY.clear()
+        orders = Counter('test_orders_total', 'Orders.')
+        latency = Histogram('test_report_seconds', 'Report time.', labels=('report',), buckets=(0.1, 1))
+        orders.inc()
+        orders.inc(2)
+        latency.observe(0.05, report='sales')
+        latency.observe(0.5, report='sales')
+        latency.observe(5, report='sales')
+
+        self.assertEqual(exposition(), '\n'.join([
+            '# HELP test_orders_total Orders.',
+            '# TYPE test_orders_total counter',
+            'test_orders_total 3.0',
+            '# HELP test_report_seconds Report time.',
+            '# TYPE test_report_seconds histogram',
+            'test_report_seconds_bucket{report="sales",le="0.1"} 1.0',
+            'test_report_seconds_bucket{report="sales",le="1.0"} 2.0',
+            'test_report_seconds_bucket{report="sales",le="+Inf"} 3.0',
+            'test_report_seconds_sum{report="sales"} 5.55',
+            'test_report_seconds_count{report="sales"} 3.0',
+        ]) + '\n')
+
+    def test_labels_must_match(self):
+        latency = Histogram('test_labelled_seconds', 'Time.', labels=('report',))
+        with self.assertRaises(ValueError):
+            latency.observe(1)
+
+    def test_file_grows_past_its_initial_size(self):
+        counter = Counter('test_series_total', 'Series.', labels=('n',))
+        for n in range(2000):
+            counter.inc(n=n)
+        self.assertEqual(self.value('test_series_total', labels=[('n', '1999')]), 1)
+
+    def test_processes_are_added_up_and_dead_gauges_dropped(self):
+        counter = Counter('test_forked_total', 'Forked.')
+        gauge = Gauge('test_inflight', 'In flight.')
+        counter.inc()
+        gauge.inc()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                counter.inc(5)
+                gauge.inc(10)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        # The exited worker's orders still count; its in-flight messages don't
+        self.assertEqual(self.value('test_forked_total'), 6)
+        self.assertEqual(self.value('test_inflight'), 1)
+
+    def test_clear_removes_only_process_files(self):
+        counter = Counter('test_restarted_total', 'Restarted.')
+        counter.inc()
+        open(os.path.join(self.directory, 'notes.txt'), 'w').close()
+
+        clear_metrics_dir()
+        self.assertEqual(os.listdir(self.directory), ['notes.txt'])
+        self.assertEqual(read_values(), {})
+        counter.inc()
+        self.assertEqual(self.value('test_restarted_total'), 1)
+
+    def test_timer_decorator(self):
+        latency = Histogram('test_view_seconds', 'View time.')
+
+        @latency.time()
+        def view():
+            return 'done'
+
+        self.assertEqual([view(), view()], ['done', 'done'])
+        self.assertEqual(self.value('test_view_seconds', '_count'), 2)
+
+
+class MetricsWiringTest(MetricsDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='buyer@example.com', password='Str0ngPass!23')
+        self.address = Address.objects.create(
+            user=self.user, address_type='home', street_address='1 Main St',
+            city='Bahawalpur', state='Punjab', postal_code='63100'
+        )
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', slug='phone', description='A phone', price=Decimal('100.00')
+        )
+        self.color = ProductColor.objects.create(product=self.product, name='Black', stock=2, is_primary=True)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def place_order(self, quantity):
+        CartItem.objects.create(cart=self.cart, product=self.product, color=self.color, quantity=quantity)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('place_order'), {
+                'phone_number': '+923001234567', 'selected_address': self.address.id,
+            })
+
+    def test_orders_and_stock_outs_are_counted(self):
+        self.place_order(5)
+        self.assertEqual(self.value('store_stock_out_rejections_total'), 1)
+        self.assertEqual(self.value('store_orders_placed_total'), 0)
+
+        self.cart.items.all().delete()
+        self.place_order(1)
+        self.assertEqual(self.value('store_orders_placed_total'), 1)
+        self.assertEqual(self.value('store_checkout_seconds', '_count'), 2)
+
+    def test_email_failures_are_counted(self):
+        order = Order.objects.create(user=self.user, address=self.address, total_amount=Decimal('100'))
+        notification = Notification.objects.create(
+            user=self.user, order=order, notification_type='order_created', title='Order', message='Placed'
+        )
+        with mock.patch('store.models.send_mail', side_effect=OSError('SMTP down')):
+            self.assertFalse(notification.send_email_notification())
+        self.assertEqual(self.value('store_email_failures_total'), 1)
+        self.assertEqual(self.value('store_email_send_seconds', '_count'), 1)
+
+    def test_report_durations_are_labelled(self):
+        self.client.force_login(User.objects.create_user(email='staff@example.com', password=None, is_staff=True))
+        self.client.get(reverse('inventory_erp:dealer_report'))
+        self.assertEqual(self.value('erp_report_seconds', '_count', [('report', 'dealers')]), 1)
+
+    def test_chatbot_latency_and_queue_depth(self):
+        depths = []
+
+        def generate_response(message):
+            depths.append(self.value('chatbot_queue_depth'))
+            return 'Hello'
+
+        with mock.patch('chatbot.views.chatbot.generate_response', side_effect=generate_response):
+            response = self.client.post(reverse('chatbot:message'), '{"message": "hi"}',
+                                        content_type='application/json')
+        self.assertEqual(response.json()['response'], 'Hello')
+        self.assertEqual(depths, [1])
+        self.assertEqual(self.value('chatbot_queue_depth'), 0)
+        self.assertEqual(self.value('chatbot_response_seconds', '_count'), 1)
+
+    def test_endpoint_needs_the_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(response, '# TYPE store_orders_placed_total counter')
+        self.assertContains(response, 'store_orders_placed_total 0')
+
+        self.client.force_login(User.objects.create_user(email='staff@example.com', password=None, is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
@@ -0,0 +1,127 @@
+"""
+Query budgets for the hot pages.
+
+Each page is requested at a few data sizes. The number of queries must stay
+within its budget and must not grow with the data: a page that issues one
+more query per product, order or post (an N+1) fails here before it fails in
+production. The time limits are deliberately loose; they only catch a page
+that became pathologically slow.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from time import perf_counter
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.models import Page
+from cms_store.models import BlogCategory, BlogIndexPage, BlogPost
+from inventory_erp.models import Dealer, Ledger, Sale
+from store.models import (
+    Address, Cart, CartItem, Category, Company, Order, OrderItem, Product, ProductColor, ProductImage, Review,
+)
+from user_auth.models import User
+
+# Records of each kind present at each measurement
+SIZES = (2, 10, 30)
+MAX_SECONDS = 2
+
+# page: (client, URL, most queries)
+PAGES = {
+    'home': ('anonymous', lambda test: reverse('home'), 8),
+    'product_list': ('anonymous', lambda test: reverse('product_list'), 9),
+    'product_detail': ('anonymous', lambda test: reverse('product_detail', args=[test.products[0].slug]), 11),
+    'cart_detail': ('customer', lambda test: reverse('cart_detail'), 11),
+    'checkout': ('customer', lambda test: reverse('checkout'), 12),
+    'order_history': ('customer', lambda test: reverse('order_history'), 12),
+    'erp_dashboard': ('staff', lambda test: reverse('inventory_erp:dashboard'), 8),
+    'dealer_list': ('staff', lambda test: reverse('inventory_erp:dealer_list'), 7),
+    'blog_index': ('anonymous', lambda test: reverse('cms_store:blog_index'), 8),
+}
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(email='customer@example.com', password='Str0ngPass!23')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='Str0ngPass!23', is_staff=True)
+        cls.address = Address.objects.create(
+            user=cls.customer, address_type='home', street_address='1 Main St', city='Bahawalpur',
+            state='Punjab', postal_code='63100', is_default=True,
+        )
+        cls.cart = Cart.objects.create(user=cls.customer)
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.company = Company.objects.create(category=cls.category, name='Samsung', slug='samsung')
+        cls.blog_category = BlogCategory.objects.create(name='Reviews', slug='reviews')
+        cls.blog = Page.get_first_root_node().add_child(instance=BlogIndexPage(title='Blog', slug='blog'))
+
+    def setUp(self):
+        self.products = []
+        self.added = 0
+        self.clients = {'anonymous': self.client_class()}
+        for name in ('customer', 'staff'):
+            self.clients[name] = self.client_class()
+            self.clients[name].force_login(getattr(self, name))
+
+    def add_records(self, count):
+        """`count` more products, reviews, cart items, orders, dealers, sales and posts."""
+        for n in range(self.added, self.added + count):
+            product = Product.objects.create(
+                category=self.category, company=self.company, name=f'Phone {n}', slug=f'phone-{n}',
+                description='A phone', price=Decimal('1000.00'),
+            )
+            for name in ('Black', 'White'):
+                color = ProductColor.objects.create(product=product, name=name, stock=5, is_primary=name == 'Black')
+                ProductImage.objects.create(product=product, color=color, image_url=f'https://example.com/{n}.jpg',
+                                            is_primary=True)
+            self.products.append(product)
+            reviewer = User.objects.create_user(email=f'reviewer{n}@example.com', password=None)
+            # Every review lands on the first product, so its page grows too
+            Review.objects.create(product=self.products[0], user=reviewer, rating=4, comment='Good')
+            CartItem.objects.create(cart=self.cart, product=product, color=product.colors.first(), quantity=1)
+            order = Order.objects.create(user=self.customer, address=self.address, total_amount=Decimal('2000'))
+            for color in product.colors.all():
+                OrderItem.objects.create(order=order, product=product, color=color, quantity=1, price=Decimal('1000'))
+
+            dealer = Dealer.objects.create(name=f'Dealer {n}', dealer_type='main', contact_person='Ali',
+                                           phone=f'0300{n:07d}', address='Bahawalpur')
+            Ledger.objects.create(dealer=dealer, transaction_date=date.today() - timedelta(days=n), amount=Decimal('500'),
+                                  payment_type='credit', created_by=self.staff)
+            Sale.objects.create(
+                customer_name=f'Customer {n}', customer_phone='03001234567', sale_type='retail',
+                sale_date=date.today() - timedelta(days=n), invoice_number=f'INV-{n}', total_amount=Decimal('900'),
+                final_amount=Decimal('900'), received_amount=Decimal('900'), status='completed',
+                created_by=self.staff,
+            )
+            self.blog.add_child(instance=BlogPost(
+                title=f'Post {n}', slug=f'post-{n}', featured_image='https://example.com/post.jpg',
+                excerpt='Excerpt', content='<p>Content</p>', category=self.blog_category, is_featured=n < 3,
+            ))
+        self.added += count
+
+    def measure(self, page):
+        client, url, _ = PAGES[page]
+        # Once untimed, so per-process caches are warm as on a live site
+        self.clients[client].get(url(self))
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = self.clients[client].get(url(self))
+            elapsed = perf_counter() - started
+        self.assertEqual(response.status_code, 200, page)
+        return len(queries), elapsed, queries
+
+    def test_query_counts_do_not_grow_with_data(self):
+        counts = {page: [] for page in PAGES}
+        for size in SIZES:
+            self.add_records(size - self.added)
+            for page in PAGES:
+                count, elapsed, queries = self.measure(page)
+                counts[page].append(count)
+                budget = PAGES[page][2]
+                with self.subTest(page=page, size=size):
+                    self.assertLessEqual(count, budget, '\n'.join(query['sql'] for query in queries))
+                    self.assertLess(elapsed, MAX_SECONDS)
+
+        for page, page_counts in counts.items():
+            with self.subTest(page=page):
+                self.assertEqual(len(set(page_counts)), 1, f'{page} queries grew with the data: {page_counts}')
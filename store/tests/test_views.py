@@ -0,0 +1,55 @@
+import tempfile
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from store.models import Address, Cart, CartItem, Category, Order, Product, ProductColor
+from user_auth.models import User
+
+
+class PlaceOrderTest(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(METRICS_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        self.user = User.objects.create_user(email='buyer@example.com', password='Str0ngPass!23')
+        self.client.force_login(self.user)
+        self.address = Address.objects.create(
+            user=self.user, address_type='home', street_address='1 Main St',
+            city='Bahawalpur', state='Punjab', postal_code='63100'
+        )
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', slug='phone',
+            description='A phone', price=Decimal('100.00')
+        )
+        self.black = ProductColor.objects.create(product=self.product, name='Black', stock=5, is_primary=True)
+        self.white = ProductColor.objects.create(product=self.product, name='White', stock=1)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def place_order(self):
+        return self.client.post(reverse('place_order'), {
+            'phone_number': '+923001234567',
+            'selected_address': self.address.id,
+        })
+
+    def test_stock_failure_rolls_back_earlier_items(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, color=self.black, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.product, color=self.white, quantity=3)
+
+        response = self.place_order()
+
+        self.assertRedirects(response, reverse('cart_detail'), fetch_redirect_response=False)
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_notification_sent_after_commit(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, color=self.black, quantity=2)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.place_order()
+
+        order = Order.objects.get()
+        # The notification and the orders-placed metric
+        self.assertEqual(len(callbacks), 2)
+        self.assertTrue(order.notifications.filter(notification_type='order_created').exists())
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.stock, 3)
@@ -4,16 +4,25 @@ from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.core.paginator import Paginator
 from django.template.loader import render_to_string
-from django.db import models
+from django.db import models, transaction
 from .models import Category, Company, Product, Cart, CartItem, Review, Address, Order, OrderItem, ProductColor, Notification, Contact
+from setting.metrics import CHECKOUT_SECONDS, ORDERS_PLACED, STOCK_OUT_REJECTIONS
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Sum, F, Count, Q, ExpressionWrapper, DecimalField, Avg
+from django.db.models import Sum, F, Count, Q, ExpressionWrapper, DecimalField, Avg, Prefetch, prefetch_related_objects
 from django.utils import timezone
 from datetime import timedelta, datetime
 import re
 import json
 import random
 
+REVIEWS_PER_PAGE = 5
+
+
+def prefetch_cart_items(cart):
+    """Load the cart's items with their products, colors and images in three queries."""
+    prefetch_related_objects([cart], Prefetch(
+        'items', queryset=CartItem.objects.select_related('product', 'color').prefetch_related('product__images')
+    ))
 
 @staff_member_required
 def admin_dashboard(request):
@@ -260,8 +269,8 @@ def product_list(request):
     # Get search query
     search_query = request.GET.get('search', '').strip()
     
-    # Start with all available products
-    products = Product.objects.filter(is_available=True)
+    # Start with all available products, with what their cards show
+    products = Product.objects.filter(is_available=True).for_cards()
     
     # Apply search filter if provided
     if search_query:
@@ -294,9 +303,7 @@ def product_list(request):
     # Apply rating filter
     rating = request.GET.get('rating')
     if rating:
-        products = products.annotate(
-            avg_rating=models.Avg('reviews__rating')
-        ).filter(avg_rating__gte=rating)
+        products = products.filter(avg_rating__gte=rating)
     
     # Apply availability filter
     availability = request.GET.get('availability')
@@ -312,9 +319,7 @@ def product_list(request):
     elif sort == 'price_high':
         products = products.order_by('-price')
     elif sort == 'rating':
-        products = products.annotate(
-            avg_rating=models.Avg('reviews__rating')
-        ).order_by('-avg_rating')
+        products = products.order_by(F('avg_rating').desc(nulls_last=True))
     else:  # newest
         products = products.order_by('-created_at')
     
@@ -343,14 +348,18 @@ def product_list(request):
     return render(request, 'store/product_list.html', context)
 
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, is_available=True)
-    reviews = product.reviews.all().order_by('-created_at')
+    product = get_object_or_404(
+        Product.objects.select_related('category', 'company').prefetch_related('colors'), slug=slug, is_available=True
+    )
+    review_stats = product.reviews.aggregate(count=Count('id'), average=Avg('rating'))
+    # The first page; load_more_reviews serves the rest
+    reviews = product.reviews.select_related('user').order_by('-created_at')[:REVIEWS_PER_PAGE]
     
     # Get selected color from query params
     selected_color_id = request.GET.get('color')
     selected_color = None
     if selected_color_id:
-        selected_color = product.colors.filter(id=selected_color_id).first()
+        selected_color = next((color for color in product.colors.all() if str(color.id) == selected_color_id), None)
     
     # If no color selected, use primary color
     if not selected_color:
@@ -359,15 +368,17 @@ def product_detail(request, slug):
     # Get images for selected color
     color_images = []
     if selected_color:
-        color_images = selected_color.images.all()
+        color_images = list(selected_color.images.all())
     
     # If no color-specific images, fall back to product images
     if not color_images:
-        color_images = product.images.all()
+        color_images = list(product.images.all())
     
     return render(request, 'store/product_detail.html', {
         'product': product,
         'reviews': reviews,
+        'review_count': review_stats['count'],
+        'average_rating': review_stats['average'] or 0,
         'selected_color': selected_color,
         'color_images': color_images,
     })
@@ -443,6 +454,7 @@ def add_to_cart(request, product_id):
 @login_required(login_url='login')
 def cart_detail(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
+    prefetch_cart_items(cart)
     return render(request, 'store/cart.html', {'cart': cart})
 
 @login_required(login_url='login')
@@ -471,11 +483,12 @@ def add_review(request, product_id):
         comment = request.POST.get('comment')
         
         # Update or create the review
-        review, created = Review.objects.update_or_create(
-            product=product,
-            user=request.user,
-            defaults={'rating': rating, 'comment': comment}
-        )
+        with transaction.atomic():
+            review, created = Review.objects.update_or_create(
+                product=product,
+                user=request.user,
+                defaults={'rating': rating, 'comment': comment}
+            )
         
         messages.success(request, 'Your review has been submitted.')
         return redirect('product_detail', slug=product.slug)
@@ -485,6 +498,7 @@ def add_review(request, product_id):
 @login_required(login_url='login')
 def checkout(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
+    prefetch_cart_items(cart)
     
     # Check if cart is empty
     if not cart.items.exists():
@@ -535,6 +549,7 @@ def add_address(request):
     return redirect('checkout')
 
 @login_required(login_url='login')
+@CHECKOUT_SECONDS.time()
 def place_order(request):
     if request.method == 'POST':
         print(f"Order placement attempt - User: {request.user.email}")
@@ -572,7 +587,6 @@ def place_order(request):
             return redirect('checkout')
         
         # Start transaction to ensure data consistency
-        from django.db import transaction
         try:
             with transaction.atomic():
                 print("Starting transaction...")
@@ -594,6 +608,9 @@ def place_order(request):
                                 request,
                                 f'Sorry, {cart_item.product.name} ({cart_item.color.name}) only has {cart_item.color.stock} items in stock.'
                             )
+                            STOCK_OUT_REJECTIONS.inc()
+                            # Undo stock already reserved for earlier cart items
+                            transaction.set_rollback(True)
                             return redirect('cart_detail')
                     else:
                         # Check product total stock
@@ -602,6 +619,8 @@ def place_order(request):
                                 request,
                                 f'Sorry, {cart_item.product.name} only has {cart_item.product.total_stock} items in stock.'
                             )
+                            STOCK_OUT_REJECTIONS.inc()
+                            transaction.set_rollback(True)
                             return redirect('cart_detail')
                     
                     # Reduce stock
@@ -642,13 +661,10 @@ def place_order(request):
                 cart.items.all().delete()
                 print("Cart cleared")
                 
-                # Create order notification
-                try:
-                    order.create_order_notification()
-                    print("Order notification created")
-                except Exception as e:
-                    print(f"Notification error: {e}")
-                    # Continue even if notification fails
+                # Create order notification once the order is committed, so
+                # the SMTP round-trip doesn't hold the transaction open
+                transaction.on_commit(lambda: send_order_notification(order))
+                transaction.on_commit(ORDERS_PLACED.inc)
                 
                 messages.success(request, 'Order placed successfully! Our representative will contact you shortly to discuss payment and delivery details.')
                 print("Order placement successful!")
@@ -663,6 +679,14 @@ def place_order(request):
     
     return redirect('checkout')
 
+def send_order_notification(order):
+    """Create the order notification, continuing even if it fails"""
+    try:
+        order.create_order_notification()
+        print("Order notification created")
+    except Exception as e:
+        print(f"Notification error: {e}")
+
 @login_required(login_url='login')
 def order_detail(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
@@ -674,7 +698,10 @@ def order_detail(request, order_id):
 
 @login_required(login_url='login')
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).select_related('address').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product', 'color').prefetch_related('product__images'))
+    ).order_by('-created_at')
+    orders = Paginator(orders, 10).get_page(request.GET.get('page'))
     return render(request, 'store/order_history.html', {'orders': orders})
 
 @login_required(login_url='login')
@@ -686,9 +713,9 @@ def get_review(request, review_id):
 def load_more_reviews(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     page = int(request.GET.get('page', 1))
-    reviews = product.reviews.all().order_by('-created_at')
+    reviews = product.reviews.select_related('user').order_by('-created_at')
     
-    paginator = Paginator(reviews, 5)  # 5 reviews per page
+    paginator = Paginator(reviews, REVIEWS_PER_PAGE)
     try:
         reviews_page = paginator.page(page)
     except:
@@ -14,7 +14,7 @@ from store.models import Contact, Order
 def home(request):
     # Get featured products (newest and highest rated)
     from store.models import Product
-    featured_products = Product.objects.filter(is_available=True).order_by('-created_at')[:3]
+    featured_products = Product.objects.filter(is_available=True).for_cards().order_by('-created_at')[:3]
     
     # Import CMS models here to avoid circular imports
     try: